@@ -0,0 +1,178 @@
+"""Chunk file benchmark: legacy JSON object versus the streamed format.
+
+Writes one synthetic document in both formats (services/*/chunk_format.py)
+and reads it back the way the embeddings engine does, against a file-backed
+S3 stand-in with a fixed latency per request and limited bandwidth. Embedding
+is simulated with a fixed cost per batch. Per format it reports bytes
+transferred, GET requests, time-to-first-vector, total time and peak RSS, for
+a full ingestion and for a re-ingestion where --changed of the chunks differ:
+
+    python benchmarks/chunk_storage.py --chunks 1000 10000 50000 --latency-ms 20 \\
+        --bandwidth-mbps 200 --changed 0.02 --output chunk_storage.json
+
+Every run happens in a fresh subprocess, so peak RSS is per run.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "embeddings-engine"))
+from chunk_format import ChunkFile, ChunkRecord, encode_chunk_file, encode_index, index_key, legacy_key, stream_key  # noqa: E402
+
+WORDS = ("scanner laser meting puntenwolk kalibratie tracker software export registratie project "
+         "accuracy probe alignment firmware license sensor target distance temperature compensation").split()
+
+BUCKET = "bench"
+DOCUMENT_ID = "doc"
+# Same as JOB_PROGRESS_CHUNKS in the embeddings-engine: chunks embedded per step
+EMBED_BATCH = 64
+
+
+class FileS3:
+    """get_object over files in a directory, with latency per request and limited bandwidth"""
+
+    def __init__(self, root: str, latency_ms: float, bandwidth_mbps: float):
+        self.root = root
+        self.latency = latency_ms / 1000
+        self.bytes_per_s = bandwidth_mbps * 1024 * 1024 / 8
+
+    def get_object(self, Bucket: str, Key: str, Range: str = None):
+        with open(os.path.join(self.root, Key.replace("/", "_")), "rb") as f:
+            if Range:
+                start, end = (int(x) for x in Range[len("bytes="):].split("-"))
+                f.seek(start)
+                data = f.read(end - start + 1)
+            else:
+                data = f.read()
+        time.sleep(self.latency + len(data) / self.bytes_per_s)
+        return {"Body": io.BytesIO(data)}
+
+
+def synthetic_records(count: int, words: int, seed: int) -> List[ChunkRecord]:
+    rng = random.Random(seed)
+    records, offset = [], 0
+    for i in range(count):
+        text = " ".join(rng.choice(WORDS) for _ in range(words)) + f" ref-{i}"
+        records.append(ChunkRecord(i, text, page=i // 4 + 1, start=offset, end=offset + len(text)))
+        offset += len(text) - 200
+    return records
+
+
+def write_document(root: str, records: List[ChunkRecord]):
+    def put(key: str, data: bytes):
+        with open(os.path.join(root, key.replace("/", "_")), "wb") as f:
+            f.write(data)
+
+    legacy = {"document_id": DOCUMENT_ID, "filename": "bench.pdf", "created_at": "", "total_chunks": len(records),
+              "chunks": [r.text for r in records]}
+    put(legacy_key(DOCUMENT_ID), json.dumps(legacy).encode("utf-8"))
+    data, index = encode_chunk_file(records, DOCUMENT_ID, "bench.pdf", "")
+    put(stream_key(DOCUMENT_ID), data)
+    put(index_key(stream_key(DOCUMENT_ID)), encode_index(index))
+
+
+# --- Runs (executed in a subprocess) ---
+
+def prepare(root: str, count: int, words: int, seed: int):
+    # In its own process: Linux carries the peak RSS of a parent over into its children
+    write_document(root, synthetic_records(count, words, seed))
+
+
+async def ingest(client: FileS3, key: str, changed: float, embed_ms: float, seed: int) -> Dict:
+    t0 = time.perf_counter()
+    chunk_file = await ChunkFile(client, BUCKET, key).open()
+    positions = list(range(len(chunk_file.hashes)))
+    if changed < 1:
+        # Stands in for the manifest diff: which chunks are new is known before any text is read
+        positions = sorted(random.Random(seed).sample(positions, max(1, int(len(positions) * changed))))
+
+    first_vector = None
+    embedded = 0
+    async for records in chunk_file.iter_records(positions):
+        for start in range(0, len(records), EMBED_BATCH):
+            batch = records[start:start + EMBED_BATCH]
+            await asyncio.sleep(embed_ms / 1000)
+            embedded += len(batch)
+            if first_vector is None:
+                first_vector = time.perf_counter() - t0
+    return {
+        "embedded": embedded,
+        "bytes": chunk_file.stats["bytes"],
+        "requests": chunk_file.stats["requests"],
+        "first_vector_s": round(first_vector or 0, 3),
+        "total_s": round(time.perf_counter() - t0, 3),
+    }
+
+
+def worker(root: str, fmt: str, changed: float, latency_ms: float, bandwidth_mbps: float, embed_ms: float, seed: int):
+    client = FileS3(root, latency_ms, bandwidth_mbps)
+    key = stream_key(DOCUMENT_ID) if fmt == "streamed" else legacy_key(DOCUMENT_ID)
+    result = asyncio.run(ingest(client, key, changed, embed_ms, seed))
+    # ru_maxrss is in KiB on Linux
+    result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print(json.dumps(result))
+
+
+def measure(root: str, fmt: str, changed: float, args) -> Dict:
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", root, fmt, str(changed),
+         "--latency-ms", str(args.latency_ms), "--bandwidth-mbps", str(args.bandwidth_mbps),
+         "--embed-ms", str(args.embed_ms), "--seed", str(args.seed)],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 10000, 50000], help="Document sizes in chunks")
+    parser.add_argument("--chunk-words", type=int, default=150)
+    parser.add_argument("--latency-ms", type=float, default=20, help="Simulated S3 latency per GET")
+    parser.add_argument("--bandwidth-mbps", type=float, default=200, help="Simulated S3 bandwidth")
+    parser.add_argument("--embed-ms", type=float, default=50, help="Simulated embedding time per batch")
+    parser.add_argument("--changed", type=float, default=0.02, help="Fraction of new chunks on re-ingestion")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--prepare", nargs=2, metavar=("ROOT", "CHUNKS"), help=argparse.SUPPRESS)
+    parser.add_argument("--worker", nargs=3, metavar=("ROOT", "FORMAT", "CHANGED"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare:
+        prepare(args.prepare[0], int(args.prepare[1]), args.chunk_words, args.seed)
+        return
+    if args.worker:
+        root, fmt, changed = args.worker
+        worker(root, fmt, float(changed), args.latency_ms, args.bandwidth_mbps, args.embed_ms, args.seed)
+        return
+
+    results = []
+    print(f"{'chunks':>7} {'run':8} {'format':9} {'MB read':>8} {'GETs':>5} {'first':>8} {'total':>8} {'rss':>9}")
+    for count in args.chunks:
+        with tempfile.TemporaryDirectory(prefix="chunk-storage-") as root:
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--prepare", root, str(count),
+                            "--chunk-words", str(args.chunk_words), "--seed", str(args.seed)], check=True)
+            for run, changed in (("full", 1.0), ("reingest", args.changed)):
+                for fmt in ("legacy", "streamed"):
+                    row = measure(root, fmt, changed, args)
+                    row.update({"chunks": count, "run": run, "format": fmt})
+                    results.append(row)
+                    print(f"{count:7} {run:8} {fmt:9} {row['bytes'] / 1024 / 1024:8.2f} {row['requests']:5} "
+                          f"{row['first_vector_s']:7.2f}s {row['total_s']:7.2f}s {row['peak_rss_mb']:6.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
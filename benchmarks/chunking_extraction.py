@@ -0,0 +1,185 @@
+"""Extraction benchmark for document-chunking /chunk/file.
+
+Generates synthetic PDF and DOCX files of increasing size and chunks each one
+with the legacy path (whole upload in memory, `text +=` per page, one split at
+the end) and with the streaming pipeline from services/document-chunking/
+extraction.py. Every run happens in a fresh subprocess so peak RSS (including
+the extraction worker processes) is measured per run:
+
+    python benchmarks/chunking_extraction.py --pages 50 200 800 --output extraction.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from typing import List
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "document-chunking")
+
+WORDS = (
+    "pump filter valve pressure sensor maintenance interval cartridge temperature "
+    "replace check serial number device settings error code manual operator safety"
+).split()
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def write_pdf(path: str, pages: int, lines_per_page: int = 40, seed: int = 0):
+    """Minimal multi-page PDF with Helvetica text, enough for pypdf to extract"""
+    rng = random.Random(seed)
+    objects: List[bytes] = [b"", b""]  # 1: catalog, 2: pages tree (filled in below)
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")  # 3: font
+    page_ids = []
+    for _ in range(pages):
+        lines = [_paragraph(rng, 12) for _ in range(lines_per_page)]
+        ops = ["BT", "/F1 10 Tf", "40 800 Td", "14 TL"]
+        ops += [f"({line}) '" for line in lines]
+        ops.append("ET")
+        stream = zlib.compress("\n".join(ops).encode("latin-1"))
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for i, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % i + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def write_docx(path: str, pages: int, paragraphs_per_page: int = 8, seed: int = 0):
+    import docx
+
+    rng = random.Random(seed)
+    document = docx.Document()
+    for _ in range(pages * paragraphs_per_page):
+        document.add_paragraph(_paragraph(rng, 60))
+    document.save(path)
+
+
+# --- Runs (executed in a subprocess) ---
+
+def run_legacy(path: str) -> int:
+    """The original /chunk/file code path"""
+    import io
+    import docx
+    import pypdf
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    with open(path, "rb") as f:
+        content = f.read()
+    text = ""
+    if path.endswith(".pdf"):
+        for page in pypdf.PdfReader(io.BytesIO(content)).pages:
+            text += page.extract_text() + "\n"
+    else:
+        for paragraph in docx.Document(io.BytesIO(content)).paragraphs:
+            text += paragraph.text + "\n"
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return len(splitter.split_text(text))
+
+
+def run_streaming(path: str) -> int:
+    sys.path.insert(0, SERVICE_DIR)
+    from extraction import iter_document_chunks, shutdown_pool
+
+    async def chunk():
+        return [c async for c in iter_document_chunks(path, path, CHUNK_SIZE, CHUNK_OVERLAP)]
+
+    try:
+        return len(asyncio.run(chunk()))
+    finally:
+        # Join the workers so their peak RSS shows up in RUSAGE_CHILDREN
+        shutdown_pool(wait=True)
+
+
+def worker(mode: str, path: str):
+    t0 = time.perf_counter()
+    chunks = run_legacy(path) if mode == "legacy" else run_streaming(path)
+    wall = time.perf_counter() - t0
+    # ru_maxrss is in KiB on Linux; children covers the extraction process pool
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print(json.dumps({
+        "chunks": chunks,
+        "wall_seconds": round(wall, 3),
+        "peak_rss_mb": round(self_rss / 1024, 1),
+        "peak_rss_children_mb": round(children_rss / 1024, 1),
+    }))
+
+
+def measure(mode: str, path: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", mode, path],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[25, 100, 400], help="Document sizes in pages")
+    parser.add_argument("--formats", nargs="+", default=["pdf", "docx"], choices=["pdf", "docx"])
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per mode; the fastest is reported")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--worker", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(*args.worker)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="chunk-bench-") as tmp:
+        for fmt in args.formats:
+            for pages in args.pages:
+                path = os.path.join(tmp, f"doc-{pages}.{fmt}")
+                (write_pdf if fmt == "pdf" else write_docx)(path, pages)
+                size_mb = os.path.getsize(path) / (1024 * 1024)
+                for mode in ("legacy", "streaming"):
+                    runs = [measure(mode, path) for _ in range(args.repeat)]
+                    best = min(runs, key=lambda r: r["wall_seconds"])
+                    best.update({"format": fmt, "pages": pages, "file_mb": round(size_mb, 2), "mode": mode})
+                    results.append(best)
+                    print(f"{fmt:4} {pages:5} pages {size_mb:7.2f} MB  {mode:9}  "
+                          f"{best['wall_seconds']:7.2f}s  rss {best['peak_rss_mb']:7.1f} MB "
+                          f"(workers {best['peak_rss_children_mb']:.1f} MB)  chunks {best['chunks']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "chunk_size": CHUNK_SIZE,
+                "chunk_overlap": CHUNK_OVERLAP,
+                "cpu_count": os.cpu_count(),
+                "results": results,
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Embedding provider benchmark: remote API (Portkey) versus the local model.
+
+Per provider it measures the latency of single-text calls (what a query
+costs) and the throughput of batched calls (what ingestion costs):
+
+    python benchmarks/embedding_providers.py --providers local portkey --queries 200 \\
+        --texts 2000 --batch-size 32 --concurrency 4 --output embedding_providers.json
+
+The providers are configured as in the embeddings-engine (EMBEDDING_PROVIDER
+settings, e.g. LOCAL_EMBEDDING_MODEL, PORTKEY_API_KEY). Texts are synthetic
+chunks of roughly --chunk-words words unless --texts-file (one text per line)
+is given. Startup time of the local provider includes model load and warm-up.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "embeddings-engine"))
+from providers import create_provider  # noqa: E402
+
+WORDS = ("scanner laser meting puntenwolk kalibratie tracker software export registratie project "
+         "accuracy probe alignment firmware license sensor target distance temperature compensation").split()
+
+
+def synthetic_texts(count: int, words: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(words)) + f" ref-{i}" for i in range(count)]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def bench_provider(name: str, queries: List[str], texts: List[str], batch_size: int, concurrency: int) -> Dict:
+    provider = create_provider(name)
+    async with httpx.AsyncClient(timeout=60) as client:
+        t0 = time.perf_counter()
+        await provider.start(client)
+        startup = time.perf_counter() - t0
+
+        latencies, failed = [], 0
+        for query in queries:
+            t0 = time.perf_counter()
+            vector = (await provider.embed([query]))[0]
+            latencies.append((time.perf_counter() - t0) * 1000)
+            failed += vector is None
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_batch(batch: List[str]) -> int:
+            async with semaphore:
+                return sum(v is None for v in await provider.embed(batch))
+
+        t0 = time.perf_counter()
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        failed += sum(await asyncio.gather(*(run_batch(b) for b in batches)))
+        elapsed = time.perf_counter() - t0
+    await provider.close()
+
+    return {
+        "provider": name,
+        "model": provider.model_id,
+        "startup_s": round(startup, 2),
+        "single_p50_ms": round(statistics.median(latencies), 1),
+        "single_p95_ms": round(percentile(latencies, 0.95), 1),
+        "single_p99_ms": round(percentile(latencies, 0.99), 1),
+        "batch_texts_per_s": round(len(texts) / elapsed, 1),
+        "failed": failed,
+    }
+
+
+async def run(args) -> List[Dict]:
+    if args.texts_file:
+        with open(args.texts_file) as f:
+            texts = [line.strip() for line in f if line.strip()][:args.texts]
+    else:
+        texts = synthetic_texts(args.texts, args.chunk_words, args.seed)
+    queries = synthetic_texts(args.queries, 12, args.seed + 1)
+
+    results = []
+    for name in args.providers:
+        print(f"Benchmarking {name}...")
+        results.append(await bench_provider(name, queries, texts, args.batch_size, args.concurrency))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--providers", nargs="+", default=["local", "portkey"], choices=["local", "portkey"])
+    parser.add_argument("--queries", type=int, default=200, help="Sequential single-text calls")
+    parser.add_argument("--texts", type=int, default=2000, help="Texts embedded in batches for throughput")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4, help="Batches in flight")
+    parser.add_argument("--chunk-words", type=int, default=150)
+    parser.add_argument("--texts-file", help="One text per line instead of synthetic chunks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"{'provider':9} {'startup':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'texts/s':>9} {'failed':>7}  model")
+    for row in results:
+        print(f"{row['provider']:9} {row['startup_s']:7.1f}s {row['single_p50_ms']:7.1f}ms {row['single_p95_ms']:7.1f}ms "
+              f"{row['single_p99_ms']:7.1f}ms {row['batch_texts_per_s']:9.1f} {row['failed']:7}  {row['model']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
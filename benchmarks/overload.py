@@ -0,0 +1,205 @@
+"""rag-query under overload and during an LLM outage, with and without admission control.
+
+Starts services/rag-query as a local uvicorn process against stand-ins: the
+Qdrant stand-in from stand_ins.py and an upstream serving the embeddings
+engine's /embed and an LLM whose capacity is limited (--llm-capacity
+generations at a time, each --llm-latency-ms; the rest queue, like a
+saturated model server). For each setting of ADMISSION_ENABLED:
+
+  * overload: an open-loop arrival rate (--rate requests/s for --seconds)
+    above what the LLM can serve; reports goodput (answers within --slo-ms
+    per second of wall time), shed requests and the latency of the requests
+    that were answered
+  * outage: the LLM answers 500 for --outage-seconds at a low rate; reports
+    how many queries failed and how many got a retrieval-only answer once
+    the llm circuit opened
+
+    python benchmarks/overload.py --rate 40 --seconds 20 --llm-capacity 8 --llm-latency-ms 1000 --output overload.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from stand_ins import hash_embedding, qdrant_app, serve_in_thread
+
+RAG_QUERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "rag-query")
+DIM = 256
+
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def upstream_app(state: Dict) -> FastAPI:
+    """/embed like the embeddings engine, and chat completions with a fixed number of slots"""
+    app = FastAPI()
+    slots = asyncio.Semaphore(state["capacity"])
+
+    @app.post("/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        return {"embedding": hash_embedding(body["text"], DIM)}
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        if state["failing"]:
+            return JSONResponse({"error": "model unavailable"}, status_code=500)
+        async with slots:
+            await asyncio.sleep(state["latency_ms"] / 1000)
+        return {"choices": [{"index": 0, "message": {"role": "assistant", "content": "An answer."}}]}
+
+    return app
+
+
+def seed_qdrant(url: str):
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models
+    client = QdrantClient(url=url, check_compatibility=False)
+    client.create_collection("faro_docs", vectors_config=models.VectorParams(size=DIM, distance=models.Distance.COSINE))
+    client.upsert("faro_docs", points=[
+        models.PointStruct(id=i, vector=hash_embedding(f"document {i}", DIM), payload={"text": f"Passage {i}."})
+        for i in range(50)
+    ])
+
+
+def start_rag_query(port: int, env: Dict[str, str]) -> subprocess.Popen:
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=RAG_QUERY_DIR, env=dict(os.environ, **env),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health")
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("rag-query did not start")
+
+
+async def open_loop(url: str, rate: float, seconds: float) -> Tuple[List[Dict], float]:
+    """Sends rate requests/s regardless of how fast they are answered; returns (results, wall time)"""
+    results: List[Dict] = []
+
+    async def one(client: httpx.AsyncClient, i: int):
+        t0 = time.perf_counter()
+        try:
+            r = await client.post("/query", json={"question": f"document {i % 50}", "top_k": 3})
+            body = r.json() if r.headers.get("content-type", "").startswith("application/json") else {}
+            results.append({"status": r.status_code, "latency": time.perf_counter() - t0,
+                            "degraded": body.get("degraded") or [], "retry_after": r.headers.get("retry-after")})
+        except httpx.HTTPError as e:
+            results.append({"status": type(e).__name__, "latency": time.perf_counter() - t0, "degraded": []})
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        tasks = []
+        start = time.perf_counter()
+        for i in range(int(rate * seconds)):
+            await asyncio.sleep(max(0.0, start + i / rate - time.perf_counter()))
+            tasks.append(asyncio.create_task(one(client, i)))
+        await asyncio.gather(*tasks)
+    return results, time.perf_counter() - start
+
+
+def summarize(results: List[Dict], wall: float, slo_ms: float) -> Dict:
+    ok = [r for r in results if r["status"] == 200]
+    full = [r for r in ok if not r["degraded"]]
+    within_slo = [r for r in full if r["latency"] * 1000 <= slo_ms]
+    ms = sorted(r["latency"] * 1000 for r in ok)
+    statuses: Dict[str, int] = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    return {
+        "sent": len(results),
+        "statuses": statuses,
+        "answered": len(full),
+        "retrieval_only": len(ok) - len(full),
+        "within_slo": len(within_slo),
+        "goodput_rps": round(len(within_slo) / wall, 2),
+        "wall_s": round(wall, 1),
+        "p50_ms": round(statistics.median(ms), 1) if ms else None,
+        "p99_ms": round(ms[int(0.99 * (len(ms) - 1))], 1) if ms else None,
+    }
+
+
+def run(args, admission: bool, state: Dict, upstream_url: str, qdrant_url: str) -> Dict:
+    port = free_port()
+    proc = start_rag_query(port, {
+        "ADMISSION_ENABLED": str(admission).lower(),
+        "ADMISSION_QUEUE_TARGET_MS": str(args.queue_target_ms),
+        "EMBEDDINGS_ENGINE_URL": upstream_url, "EMBED_TRANSPORT": "json",
+        "LLM_BASE_URL": f"{upstream_url}/v1", "LLM_API_KEY": "bench",
+        "QDRANT_URL": qdrant_url, "SEMANTIC_CACHE_ENABLED": "false", "PG_HOST": "",
+        "BREAKER_OPEN_SECONDS": str(args.breaker_open_seconds),
+    })
+    url = f"http://127.0.0.1:{port}"
+    try:
+        state["failing"] = False
+        overload = summarize(*asyncio.run(open_loop(url, args.rate, args.seconds)), args.slo_ms)
+        state["failing"] = True
+        outage = summarize(*asyncio.run(open_loop(url, args.outage_rate, args.outage_seconds)), args.slo_ms)
+        state["failing"] = False
+        metrics = httpx.get(f"{url}/metrics").text
+        limit = next((float(line.split()[1]) for line in metrics.splitlines()
+                      if line.startswith("rag_admission_limit ")), None)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {"admission": admission, "overload": overload, "outage": outage, "final_limit": limit}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=40, help="Requests per second during the overload phase")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--llm-capacity", type=int, default=8, help="Generations the LLM stand-in runs at once")
+    parser.add_argument("--llm-latency-ms", type=float, default=1000)
+    parser.add_argument("--slo-ms", type=float, default=5000, help="Answers slower than this do not count as goodput")
+    parser.add_argument("--queue-target-ms", type=int, default=500, help="ADMISSION_QUEUE_TARGET_MS")
+    parser.add_argument("--outage-rate", type=float, default=5)
+    parser.add_argument("--outage-seconds", type=float, default=10)
+    parser.add_argument("--breaker-open-seconds", type=float, default=15, help="BREAKER_OPEN_SECONDS")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    state = {"capacity": args.llm_capacity, "latency_ms": args.llm_latency_ms, "failing": False}
+    upstream_port, qdrant_port = free_port(), free_port()
+    serve_in_thread(upstream_app(state), upstream_port)
+    serve_in_thread(qdrant_app(), qdrant_port)
+    qdrant_url = f"http://127.0.0.1:{qdrant_port}"
+    seed_qdrant(qdrant_url)
+
+    capacity_rps = args.llm_capacity / (args.llm_latency_ms / 1000)
+    print(f"LLM capacity ~{capacity_rps:.1f} req/s, offered {args.rate:g} req/s")
+    runs = []
+    for admission in (False, True):
+        result = run(args, admission, state, f"http://127.0.0.1:{upstream_port}", qdrant_url)
+        runs.append(result)
+        o, d = result["overload"], result["outage"]
+        print(f"admission {'on ' if admission else 'off'}: goodput {o['goodput_rps']:.1f} req/s "
+              f"({o['within_slo']}/{o['answered']} answers within {args.slo_ms:g}ms, {o['wall_s']}s), "
+              f"p50/p99 {o['p50_ms']}/{o['p99_ms']}ms, statuses {o['statuses']}, limit {result['final_limit']}")
+        print(f"  LLM outage: statuses {d['statuses']}, retrieval-only answers {d['retrieval_only']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "runs": runs}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
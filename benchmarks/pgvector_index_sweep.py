@@ -0,0 +1,163 @@
+"""pgvector index sweep: recall@k against exact search versus query latency.
+
+Loads synthetic clustered vectors into a scratch table, computes the exact
+top-k with numpy, then builds each index variant with the same DDL the
+embeddings-engine uses and sweeps hnsw.ef_search / ivfflat.probes:
+
+    python benchmarks/pgvector_index_sweep.py --dsn "host=localhost dbname=vectordb user=vectoradmin" \\
+        --rows 50000 --dim 1024 --output pgvector_sweep.json
+
+The scratch table (default `bench_vectors`) is dropped at the end.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+import psycopg
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "embeddings-engine"))
+from pg_index import index_ddl, index_options  # noqa: E402
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def make_vectors(rows: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Gaussian clusters, normalized; closer to real embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    data = centers[rng.integers(0, clusters, rows)] + 0.35 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def exact_top_k(data: np.ndarray, queries: np.ndarray, k: int) -> List[List[int]]:
+    sims = queries @ data.T
+    top = np.argpartition(-sims, k, axis=1)[:, :k]
+    return [list(row[np.argsort(-sims[i, row])]) for i, row in enumerate(top)]
+
+
+def vec_literal(v: np.ndarray) -> str:
+    return "[" + ",".join(f"{x:.6f}" for x in v) + "]"
+
+
+def load(conn, table: str, data: np.ndarray):
+    dim = data.shape[1]
+    conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.execute(f"CREATE TABLE {table} (id INT PRIMARY KEY, vector vector({dim}))")
+    with conn.cursor().copy(f"COPY {table} (id, vector) FROM STDIN") as copy:
+        for i, v in enumerate(data):
+            copy.write_row((i, vec_literal(v)))
+    conn.execute(f"ANALYZE {table}")
+
+
+def run_queries(conn, table: str, queries: np.ndarray, truth: List[List[int]], k: int,
+                setting: str = None, value: int = None) -> Dict[str, float]:
+    latencies, recalls = [], []
+    for q, expected in zip(queries, truth):
+        literal = vec_literal(q)
+        with conn.transaction():
+            if setting:
+                conn.execute("SELECT set_config(%s, %s, true)", (setting, str(value)))
+            t0 = time.perf_counter()
+            rows = conn.execute(
+                f"SELECT id FROM {table} ORDER BY vector <=> %s::vector LIMIT %s", (literal, k)
+            ).fetchall()
+            latencies.append((time.perf_counter() - t0) * 1000)
+        recalls.append(len({r[0] for r in rows} & set(expected)) / k)
+    return {
+        "recall_at_k": round(statistics.fmean(recalls), 4),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+    }
+
+
+def build(conn, table: str, index_type: str, options: Dict[str, int]) -> Dict[str, float]:
+    name = f"{table}_{index_type}_idx"
+    conn.execute(f"DROP INDEX IF EXISTS {name}")
+    t0 = time.perf_counter()
+    conn.execute(index_ddl(index_type, options, name=name, table=table, concurrently=False))
+    seconds = time.perf_counter() - t0
+    size = conn.execute("SELECT pg_relation_size(%s::regclass)", (name,)).fetchone()[0]
+    return {"name": name, "build_seconds": round(seconds, 2), "size_mb": round(size / (1024 * 1024), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("PG_DSN", ""), help="libpq connection string (or PG* env vars)")
+    parser.add_argument("--table", default="bench_vectors")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--hnsw-m", type=int, nargs="+", default=[16])
+    parser.add_argument("--hnsw-ef-construction", type=int, default=64)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[10, 20, 40, 80, 160])
+    parser.add_argument("--ivfflat-lists", type=int, default=0, help="0 = same rule as the service")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 5, 10, 20, 40])
+    parser.add_argument("--maintenance-work-mem", default="512MB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    data = make_vectors(args.rows, args.dim, args.clusters, args.seed)
+    queries = make_vectors(args.queries, args.dim, args.clusters, args.seed + 1)
+    truth = exact_top_k(data, queries, args.top_k)
+
+    results = []
+
+    def report(row: Dict):
+        results.append(row)
+        label = f"{row['index']:8} {row.get('param', ''):>12}"
+        print(f"{label}  recall@{args.top_k}={row['recall_at_k']:.3f}  p50={row['p50_ms']:7.2f}ms  p95={row['p95_ms']:7.2f}ms")
+
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        print(f"Loading {args.rows} x {args.dim} vectors into {args.table}...")
+        load(conn, args.table, data)
+        conn.execute(f"SET maintenance_work_mem = '{args.maintenance_work_mem}'")
+        try:
+            report({"index": "none", **run_queries(conn, args.table, queries, truth, args.top_k)})
+
+            for m in args.hnsw_m:
+                options = index_options("hnsw", args.rows, m=m, ef_construction=args.hnsw_ef_construction)
+                info = build(conn, args.table, "hnsw", options)
+                print(f"hnsw {options}: built in {info['build_seconds']}s, {info['size_mb']} MB")
+                for ef in args.ef_search:
+                    stats = run_queries(conn, args.table, queries, truth, args.top_k, "hnsw.ef_search", max(ef, args.top_k))
+                    report({"index": "hnsw", "options": options, "param": f"ef_search={ef}", **info, **stats})
+                conn.execute(f"DROP INDEX {info['name']}")
+
+            options = index_options("ivfflat", args.rows, lists=args.ivfflat_lists or None)
+            info = build(conn, args.table, "ivfflat", options)
+            print(f"ivfflat {options}: built in {info['build_seconds']}s, {info['size_mb']} MB")
+            for probes in args.probes:
+                stats = run_queries(conn, args.table, queries, truth, args.top_k, "ivfflat.probes", probes)
+                report({"index": "ivfflat", "options": options, "param": f"probes={probes}", **info, **stats})
+        finally:
+            conn.execute(f"DROP TABLE IF EXISTS {args.table}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "rows": args.rows,
+                "dim": args.dim,
+                "queries": args.queries,
+                "top_k": args.top_k,
+                "results": results,
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""End-to-end pipeline benchmark with local stand-ins.
+
+Starts document-chunking, embeddings-engine and rag-query from this checkout
+(one uvicorn process each, as in the cluster) against local dependencies:
+
+- embedding API and LLM: an OpenAI-compatible stand-in with configurable latency
+- Qdrant: --qdrant-url, or an in-memory stand-in (default)
+- S3: --s3-endpoint (e.g. MinIO), or moto's server when moto is installed
+- Postgres + pgvector: --pg-host etc. (optional; without it there is no dual-write or hybrid search)
+
+For every corpus size it ingests synthetic documents through /chunk/text and
+the embedding job queue, then runs /query at every concurrency level:
+
+    pip install "moto[server]" psutil
+    python benchmarks/pipeline_e2e.py --docs 100 1000 --concurrency 1 8 32 --queries 500 \\
+        --label $(git rev-parse --short HEAD) --output e2e.json
+
+Reported per corpus size: ingestion docs/s and chunks/s, query p50/p95/p99 and
+throughput per concurrency level, and peak RSS per service for each phase.
+The stand-ins run inside this process, so at high concurrency they compete
+with the load generator for one core; compare runs on the same machine.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+import psutil
+
+from rag_query_load import run as run_query_load
+from stand_ins import qdrant_app, serve_in_thread, upstream_app
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SERVICES = {
+    "document-chunking": os.path.join(ROOT, "services", "document-chunking"),
+    "embeddings-engine": os.path.join(ROOT, "services", "embeddings-engine"),
+    "rag-query": os.path.join(ROOT, "services", "rag-query"),
+}
+
+WORDS = (
+    "pump filter valve pressure sensor maintenance interval cartridge temperature "
+    "replace check serial number device settings error code manual operator safety "
+    "calibration firmware update display battery motor housing seal flow alarm"
+).split()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def synthetic_corpus(docs: int, words: int, seed: int):
+    """Documents with one unique error code each, and questions that ask for those codes"""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(docs):
+        sentences, n = [], 0
+        while n < words:
+            length = rng.randint(8, 16)
+            sentences.append(" ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + ".")
+            n += length
+        sentences.insert(rng.randrange(len(sentences)), f"Error code E-{i:05d} means the {rng.choice(WORDS)} failed.")
+        corpus.append((f"bench-doc-{i:05d}", " ".join(sentences)))
+    questions = [f"What does error code E-{rng.randrange(docs):05d} mean?" for _ in range(200)]
+    return corpus, questions
+
+
+class RssSampler:
+    """Samples RSS of each service process (plus its children) and keeps the peak per service"""
+
+    def __init__(self, pids: Dict[str, int], interval: float = 0.05):
+        self.processes = {name: psutil.Process(pid) for name, pid in pids.items()}
+        self.interval = interval
+        self.peaks: Dict[str, int] = {name: 0 for name in pids}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for name, proc in self.processes.items():
+                try:
+                    rss = proc.memory_info().rss + sum(c.memory_info().rss for c in proc.children(recursive=True))
+                except psutil.Error:
+                    continue
+                self.peaks[name] = max(self.peaks[name], rss)
+
+    def take(self) -> Dict[str, float]:
+        """Peaks in MB since the last call"""
+        peaks = {name: round(rss / 2 ** 20, 1) for name, rss in self.peaks.items()}
+        self.peaks = {name: 0 for name in self.peaks}
+        return peaks
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class Pipeline:
+    """The three services as local uvicorn processes for one corpus run"""
+
+    def __init__(self, env: Dict[str, str], workdir: str):
+        self.ports = {name: free_port() for name in SERVICES}
+        self.urls = {name: f"http://127.0.0.1:{port}" for name, port in self.ports.items()}
+        self.workdir = workdir
+        self.env = env
+        self.processes: Dict[str, subprocess.Popen] = {}
+
+    def service_env(self, name: str) -> Dict[str, str]:
+        env = dict(os.environ, PYTHONUNBUFFERED="1", **self.env)
+        if name == "document-chunking":
+            env["EMBEDDINGS_JOBS_URL"] = f"{self.urls['embeddings-engine']}/jobs"
+        if name == "rag-query":
+            env["EMBEDDINGS_ENGINE_URL"] = self.urls["embeddings-engine"]
+        return env
+
+    def start(self):
+        for name, path in SERVICES.items():
+            log = open(os.path.join(self.workdir, f"{name}.log"), "w")
+            self.processes[name] = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                 "--port", str(self.ports[name]), "--log-level", "warning"],
+                cwd=path, env=self.service_env(name), stdout=log, stderr=subprocess.STDOUT,
+            )
+        for name in SERVICES:
+            self.wait_healthy(name)
+
+    def wait_healthy(self, name: str, timeout: float = 180):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.processes[name].poll() is not None:
+                raise RuntimeError(f"{name} exited, see {self.workdir}/{name}.log:\n{self.log_tail(name)}")
+            try:
+                if httpx.get(f"{self.urls[name]}/health", timeout=2).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"{name} not healthy after {timeout}s:\n{self.log_tail(name)}")
+
+    def log_tail(self, name: str, lines: int = 20) -> str:
+        with open(os.path.join(self.workdir, f"{name}.log")) as f:
+            return "".join(f.readlines()[-lines:])
+
+    def stop(self):
+        for proc in self.processes.values():
+            proc.terminate()
+        for proc in self.processes.values():
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+async def ingest(pipeline: Pipeline, corpus, concurrency: int, chunk_size: int, timeout: float) -> dict:
+    """Chunks every document (which queues its embedding job) and waits until all jobs finished"""
+    chunks = 0
+    job_ids: List[str] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency * 2)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def submit(doc_id: str, text: str):
+            nonlocal chunks, errors
+            async with semaphore:
+                r = await client.post(f"{pipeline.urls['document-chunking']}/chunk/text", json={
+                    "text": text, "document_id": doc_id, "chunk_size": chunk_size, "chunk_overlap": chunk_size // 5})
+            if r.status_code != 200 or not r.json().get("job_id"):
+                errors += 1
+                return
+            chunks += r.json()["total_chunks"]
+            job_ids.append(r.json()["job_id"])
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(submit(doc_id, text) for doc_id, text in corpus))
+        chunked = time.perf_counter() - t0
+
+        pending, failed = set(job_ids), 0
+        deadline = time.time() + timeout
+        while pending and time.time() < deadline:
+            await asyncio.sleep(0.2)
+            for job_id in list(pending)[:200]:
+                r = await client.get(f"{pipeline.urls['embeddings-engine']}/jobs/{job_id}")
+                status = r.json().get("status") if r.status_code == 200 else None
+                if status in ("completed", "dead_letter"):
+                    pending.discard(job_id)
+                    failed += status == "dead_letter"
+        wall = time.perf_counter() - t0
+
+    done = len(job_ids) - len(pending) - failed
+    return {
+        "docs": len(corpus),
+        "chunks": chunks,
+        "wall_seconds": round(wall, 3),
+        "chunking_seconds": round(chunked, 3),
+        "docs_per_s": round(done / wall, 2) if wall else 0.0,
+        "chunks_per_s": round(chunks / wall, 1) if wall else 0.0,
+        "chunk_errors": errors,
+        "jobs_failed": failed,
+        "jobs_timed_out": len(pending),
+    }
+
+
+def start_s3(args) -> str:
+    if args.s3_endpoint:
+        return args.s3_endpoint
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        sys.exit("No S3 stand-in: pip install 'moto[server]' or pass --s3-endpoint (e.g. MinIO)")
+    port = free_port()
+    ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False).start()
+    return f"http://127.0.0.1:{port}"
+
+
+def reset_postgres(args):
+    import psycopg
+    with psycopg.connect(host=args.pg_host, dbname=args.pg_db, user=args.pg_user,
+                         password=args.pg_password, autocommit=True) as conn:
+        if conn.execute("SELECT to_regclass('embeddings')").fetchone()[0]:
+            conn.execute("TRUNCATE embeddings")
+
+
+def run_corpus(args, base_env: Dict[str, str], docs: int, run_id: str) -> dict:
+    import boto3
+
+    bucket = f"faro-bench-{run_id}-{docs}"
+    collection = f"bench_{run_id}_{docs}"
+    s3 = boto3.client("s3", endpoint_url=base_env["AWS_ENDPOINT_URL"], region_name=base_env["AWS_REGION"],
+                      aws_access_key_id=base_env["AWS_ACCESS_KEY_ID"],
+                      aws_secret_access_key=base_env["AWS_SECRET_ACCESS_KEY"])
+    s3.create_bucket(Bucket=bucket, CreateBucketConfiguration={"LocationConstraint": base_env["AWS_REGION"]})
+    if args.pg_host:
+        reset_postgres(args)
+
+    workdir = tempfile.mkdtemp(prefix=f"e2e-{docs}-")
+    env = dict(base_env, S3_BUCKET=bucket, QDRANT_COLLECTION=collection,
+               EMBED_CACHE_PATH=os.path.join(workdir, "embedding-cache.sqlite3"),
+               JOB_QUEUE_PATH=os.path.join(workdir, "jobs.sqlite3"))
+    corpus, questions = synthetic_corpus(docs, args.doc_words, args.seed)
+    pipeline = Pipeline(env, workdir)
+    print(f"[{docs} docs] starting services (logs in {workdir})")
+    pipeline.start()
+    sampler = RssSampler({name: proc.pid for name, proc in pipeline.processes.items()})
+    try:
+        sampler.take()
+        ingestion = asyncio.run(ingest(pipeline, corpus, args.ingest_concurrency, args.chunk_size, args.timeout))
+        ingestion["peak_rss_mb"] = sampler.take()
+        print(f"[{docs} docs] ingested {ingestion['chunks']} chunks: {ingestion['docs_per_s']} docs/s, "
+              f"{ingestion['chunks_per_s']} chunks/s, peak RSS {ingestion['peak_rss_mb']}")
+
+        queries = []
+        for users in args.concurrency:
+            result = asyncio.run(run_query_load(pipeline.urls["rag-query"], users, args.queries, args.top_k,
+                                                questions, args.timeout))
+            result.update({"concurrency": users, "peak_rss_mb": sampler.take()})
+            lat = result["latency_ms"]
+            print(f"[{docs} docs] {users:4} users: p50={lat['p50']}ms p95={lat['p95']}ms p99={lat['p99']}ms "
+                  f"{result['throughput_rps']} req/s, {result['errors']} errors")
+            queries.append(result)
+    finally:
+        sampler.stop()
+        pipeline.stop()
+        httpx.delete(f"{base_env['QDRANT_URL']}/collections/{collection}")
+
+    return {"docs": docs, "ingest": ingestion, "queries": queries}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, nargs="+", default=[100, 1000], help="Corpus sizes")
+    parser.add_argument("--doc-words", type=int, default=600, help="Words per synthetic document")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--ingest-concurrency", type=int, default=8, help="Documents chunked at once")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Query users")
+    parser.add_argument("--queries", type=int, default=500, help="Queries per concurrency level")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--embed-latency-ms", type=float, default=20, help="Stand-in embedding API latency")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="Stand-in LLM latency")
+    parser.add_argument("--qdrant-url", help="Real Qdrant; default is the in-memory stand-in")
+    parser.add_argument("--s3-endpoint", help="S3-compatible endpoint (MinIO); default starts moto")
+    parser.add_argument("--pg-host", default=os.getenv("PG_HOST"))
+    parser.add_argument("--pg-db", default=os.getenv("PG_DB", "vectordb"))
+    parser.add_argument("--pg-user", default=os.getenv("PG_USER", "vectoradmin"))
+    parser.add_argument("--pg-password", default=os.getenv("PG_PASSWORD", ""))
+    parser.add_argument("--semantic-cache", action="store_true", help="Keep rag-query's semantic cache on")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="", help="Free-form label stored with the results (e.g. git sha)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    serve_in_thread(upstream_app(embed_latency_ms=args.embed_latency_ms, llm_latency_ms=args.llm_latency_ms),
+                    upstream_port)
+    qdrant_url = args.qdrant_url
+    if not qdrant_url:
+        qdrant_port = free_port()
+        serve_in_thread(qdrant_app(), qdrant_port)
+        qdrant_url = f"http://127.0.0.1:{qdrant_port}"
+
+    upstream = f"http://127.0.0.1:{upstream_port}/v1"
+    base_env = {
+        "AWS_ENDPOINT_URL": start_s3(args),
+        "AWS_REGION": "eu-central-1",
+        "AWS_DEFAULT_REGION": "eu-central-1",
+        "AWS_ACCESS_KEY_ID": os.getenv("AWS_ACCESS_KEY_ID", "bench"),
+        "AWS_SECRET_ACCESS_KEY": os.getenv("AWS_SECRET_ACCESS_KEY", "bench"),
+        "S3_ENABLED": "true",
+        "QDRANT_URL": qdrant_url,
+        "PORTKEY_API_URL": f"{upstream}/embeddings",
+        "PORTKEY_API_KEY": "bench",
+        "LLM_BASE_URL": upstream,
+        "LLM_API_KEY": "bench",
+        "SEMANTIC_CACHE_ENABLED": "true" if args.semantic_cache else "false",
+    }
+    if args.pg_host:
+        base_env.update({"PG_HOST": args.pg_host, "PG_DB": args.pg_db, "PG_USER": args.pg_user,
+                         "PG_PASSWORD": args.pg_password})
+
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    results = {
+        "label": args.label,
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "args": vars(args),
+        "stand_ins": {"qdrant": "external" if args.qdrant_url else "in-memory",
+                      "s3": "external" if args.s3_endpoint else "moto", "postgres": bool(args.pg_host)},
+        "runs": [run_corpus(args, base_env, docs, run_id) for docs in args.docs],
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Qdrant collection profile benchmark: recall, latency and memory per profile.
+
+Loads the same vectors into one collection per profile (see services/
+embeddings-engine/qdrant_profile.py), waits until Qdrant has built the index,
+and runs the same queries with every combination of --hnsw-ef and
+--oversampling. Recall@k is measured against exact (numpy) search:
+
+    python benchmarks/qdrant_profiles.py --url http://localhost:6333 --points 100000 \\
+        --profiles baseline scalar scalar-disk binary-disk --hnsw-ef 64 128 --oversampling 1 2 4 \\
+        --output qdrant_profiles.json
+
+Vectors are synthetic (clustered, normalized) unless --vectors-file (.npy,
+one row per vector) is given; queries are perturbed copies of stored vectors.
+Memory is reported twice: an estimate of what the profile keeps in RAM, and
+the change in Qdrant's resident memory (from its /metrics) after loading,
+when Qdrant exposes it. Point this at a dedicated Qdrant, not production:
+collections named bench_<profile> are created and dropped.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "embeddings-engine"))
+from qdrant_profile import PROFILES, CollectionProfile, create_collection  # noqa: E402
+
+# Payload of a typical chunk: text plus the fields the embeddings-engine stores
+PAYLOAD_TEXT_CHARS = 1000
+
+
+def synthetic_vectors(count: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(vectors: np.ndarray, count: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    queries = vectors[rng.integers(0, len(vectors), count)] + 0.1 * rng.standard_normal((count, vectors.shape[1]))
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    truth = []
+    for start in range(0, len(queries), 256):
+        scores = queries[start:start + 256] @ vectors.T
+        truth.extend(set(row) for row in np.argpartition(-scores, k, axis=1)[:, :k].tolist())
+    return truth
+
+
+def estimate_ram_bytes(profile: CollectionProfile, points: int, dim: int) -> int:
+    """What the profile keeps resident: vectors or their quantized form, HNSW links and payload"""
+    ram = 0 if profile.on_disk_vectors else points * dim * 4
+    if profile.quantization == "scalar":
+        ram += points * dim
+    elif profile.quantization == "binary":
+        ram += points * dim // 8
+    # Layer 0 holds up to 2 * m links of 4 bytes per point; upper layers add little
+    ram += points * profile.m * 2 * 4
+    if not profile.on_disk_payload:
+        ram += points * (PAYLOAD_TEXT_CHARS + 200)
+    return ram
+
+
+def resident_bytes(url: str) -> Optional[int]:
+    """Qdrant's own resident memory from /metrics, None when unavailable"""
+    try:
+        text = httpx.get(f"{url.rstrip('/')}/metrics", timeout=5).text
+    except Exception:
+        return None
+    for line in text.splitlines():
+        if line.startswith("memory_resident_bytes"):
+            return int(float(line.split()[-1]))
+    return None
+
+
+def load(client: QdrantClient, collection: str, vectors: np.ndarray, batch: int):
+    text = "x" * PAYLOAD_TEXT_CHARS
+    for start in range(0, len(vectors), batch):
+        ids = list(range(start, min(start + batch, len(vectors))))
+        client.upsert(collection, wait=True, points=models.Batch(
+            ids=ids,
+            vectors=vectors[start:start + batch].tolist(),
+            payloads=[{"text": text, "document_id": f"doc-{i // 50}", "source_file": f"chunks/doc-{i // 50}.ndjson.gz"}
+                      for i in ids],
+        ))
+
+
+def wait_indexed(client: QdrantClient, collection: str, timeout: float) -> float:
+    """Seconds until the optimizer is done (status green)"""
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout:
+        if client.get_collection(collection).status == models.CollectionStatus.GREEN:
+            break
+        time.sleep(1)
+    return time.perf_counter() - t0
+
+
+def run_queries(client: QdrantClient, collection: str, queries: np.ndarray, truth: List[set], k: int,
+                hnsw_ef: int, oversampling: float) -> Dict:
+    params = models.SearchParams(hnsw_ef=max(hnsw_ef, k), quantization=models.QuantizationSearchParams(
+        rescore=True, oversampling=oversampling))
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        t0 = time.perf_counter()
+        points = client.query_points(collection, query=query.tolist(), limit=k, search_params=params,
+                                     with_payload=False).points
+        latencies.append((time.perf_counter() - t0) * 1000)
+        hits += len(expected & {p.id for p in points})
+    latencies.sort()
+    return {
+        "hnsw_ef": hnsw_ef,
+        "oversampling": oversampling,
+        "recall": round(hits / (k * len(queries)), 4),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:6333")
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--vectors-file", help=".npy file with real embeddings instead of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--hnsw-ef", type=int, nargs="+", default=[64, 128])
+    parser.add_argument("--oversampling", type=float, nargs="+", default=[1.0, 2.0, 4.0])
+    parser.add_argument("--batch", type=int, default=256, help="Points per upsert")
+    parser.add_argument("--index-timeout", type=float, default=1800, help="Max seconds to wait for indexing")
+    parser.add_argument("--keep", action="store_true", help="Keep the bench_* collections")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.vectors_file:
+        vectors = np.load(args.vectors_file).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    else:
+        vectors = synthetic_vectors(args.points, args.dim, args.clusters, args.seed)
+    queries = make_queries(vectors, args.queries, args.seed)
+    truth = exact_top_k(vectors, queries, args.k)
+
+    client = QdrantClient(url=args.url, timeout=120)
+    results = []
+    for name in args.profiles:
+        profile = PROFILES[name]
+        collection = f"bench_{name.replace('-', '_')}"
+        if client.collection_exists(collection):
+            client.delete_collection(collection)
+        before = resident_bytes(args.url)
+        create_collection(client, collection, vectors.shape[1], profile)
+
+        t0 = time.perf_counter()
+        load(client, collection, vectors, args.batch)
+        load_s = time.perf_counter() - t0
+        index_s = wait_indexed(client, collection, args.index_timeout)
+        after = resident_bytes(args.url)
+        print(f"{name}: loaded {len(vectors)} points in {load_s:.1f}s, indexed after {index_s:.1f}s more")
+
+        row = {
+            "profile": name,
+            "settings": profile.settings(),
+            "load_s": round(load_s, 1),
+            "index_s": round(index_s, 1),
+            "est_ram_mb": round(estimate_ram_bytes(profile, len(vectors), vectors.shape[1]) / 2**20, 1),
+            "resident_delta_mb": round((after - before) / 2**20, 1) if before is not None and after is not None else None,
+            "runs": [run_queries(client, collection, queries, truth, args.k, ef, os_)
+                     for ef in args.hnsw_ef for os_ in args.oversampling],
+        }
+        results.append(row)
+        if not args.keep:
+            client.delete_collection(collection)
+
+    print(f"{'profile':12} {'est RAM':>9} {'measured':>9} {'ef':>5} {'oversmp':>7} {'recall':>7} {'p50':>8} {'p95':>8}")
+    for row in results:
+        measured = f"{row['resident_delta_mb']:.0f}MB" if row["resident_delta_mb"] is not None else "n/a"
+        for run in row["runs"]:
+            print(f"{row['profile']:12} {row['est_ram_mb']:7.0f}MB {measured:>9} {run['hnsw_ef']:5} "
+                  f"{run['oversampling']:7.1f} {run['recall']:7.3f} {run['p50_ms']:6.2f}ms {run['p95_ms']:6.2f}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "points": len(vectors), "dim": int(vectors.shape[1]), "results": results},
+                      f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Load test for the rag-query /query endpoint.
+
+Runs N concurrent virtual users against a running rag-query instance and
+reports latency percentiles. Run it once against the old image and once
+against the new one to compare:
+
+    kubectl port-forward svc/rag-query -n rag-services 8002:80
+    python benchmarks/rag_query_load.py --url http://localhost:8002 --users 100 --requests 2000 --output after.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from typing import Dict, List
+
+import httpx
+
+DEFAULT_QUESTIONS = [
+    "How do I reset the device to factory settings?",
+    "What does error code E-104 mean?",
+    "Which maintenance interval is recommended for the pump?",
+    "How do I replace the filter cartridge?",
+    "What is the maximum operating temperature?",
+    "Where can I find the serial number?",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(latencies: List[float], errors: int, wall: float, stage_ms: Dict[str, List[int]]) -> dict:
+    ms = [v * 1000 for v in latencies]
+    return {
+        "requests": len(latencies) + errors,
+        "ok": len(latencies),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(ms), 1) if ms else 0.0,
+            "p50": round(percentile(ms, 50), 1),
+            "p95": round(percentile(ms, 95), 1),
+            "p99": round(percentile(ms, 99), 1),
+            "max": round(max(ms), 1) if ms else 0.0,
+        },
+        # Server-side timings_ms, useful to see which stage moved
+        "server_timings_ms_p50": {k: round(percentile(v, 50), 1) for k, v in stage_ms.items()},
+    }
+
+
+async def run(url: str, users: int, total: int, top_k: int, questions: List[str], timeout: float,
+              endpoint: str = "/query") -> dict:
+    latencies: List[float] = []
+    stage_ms: Dict[str, List[int]] = {}
+    errors = 0
+    remaining = total
+    lock = asyncio.Lock()
+
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+
+        async def user():
+            nonlocal remaining, errors
+            while True:
+                async with lock:
+                    if remaining <= 0:
+                        return
+                    remaining -= 1
+                body = {"question": random.choice(questions), "top_k": top_k}
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post(endpoint, json=body)
+                    elapsed = time.perf_counter() - t0
+                    if r.status_code != 200:
+                        errors += 1
+                        continue
+                    latencies.append(elapsed)
+                    for stage, value in (r.json().get("timings_ms") or {}).items():
+                        stage_ms.setdefault(stage, []).append(value)
+                except httpx.HTTPError:
+                    errors += 1
+
+        t_start = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(users)))
+        wall = time.perf_counter() - t_start
+
+    return summarize(latencies, errors, wall, stage_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for rag-query")
+    parser.add_argument("--url", default="http://localhost:8002")
+    parser.add_argument("--endpoint", default="/query")
+    parser.add_argument("--users", type=int, default=100, help="Concurrent virtual users")
+    parser.add_argument("--requests", type=int, default=1000, help="Total requests to send")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--questions", help="File with one question per line")
+    parser.add_argument("--label", default="", help="Free-form label stored with the results (e.g. git sha)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if len(line.strip()) >= 3]
+
+    result = asyncio.run(run(args.url, args.users, args.requests, args.top_k, questions, args.timeout, args.endpoint))
+    result.update({"label": args.label, "url": args.url, "users": args.users})
+
+    lat = result["latency_ms"]
+    print(f"{result['ok']}/{result['requests']} ok, {result['throughput_rps']} req/s over {result['wall_seconds']}s")
+    print(f"latency ms: p50={lat['p50']} p95={lat['p95']} p99={lat['p99']} max={lat['max']}")
+    print(f"server p50 timings_ms: {result['server_timings_ms_p50']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
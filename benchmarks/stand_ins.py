@@ -0,0 +1,174 @@
+"""Local stand-ins for the external dependencies of the pipeline benchmark.
+
+- upstream_app: OpenAI-compatible /v1/embeddings and /v1/chat/completions with
+  configurable latency. Embeddings are feature-hashed bags of words, so
+  questions retrieve the chunks that share their terms.
+- qdrant_app: the part of the Qdrant REST API the services use, backed by
+  qdrant-client's in-memory mode. Index settings (HNSW, quantization) are
+  accepted but not applied; use a real Qdrant for search latency numbers.
+- serve_in_thread: runs one of these apps on a local port in a daemon thread.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def hash_embedding(text: str, dim: int) -> list:
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in re.findall(r"\w+", text.lower()):
+        h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+        vector[h % dim] += 1.0 if h >> 63 else -1.0
+    norm = float(np.linalg.norm(vector))
+    if not norm:
+        vector[0], norm = 1.0, 1.0
+    return (vector / norm).tolist()
+
+
+def upstream_app(dim: int = 1024, embed_latency_ms: float = 20, embed_item_ms: float = 0.2,
+                 llm_latency_ms: float = 300, llm_tokens: int = 40) -> FastAPI:
+    """Embedding API (latency = base + per input) and chat completions (streamed or not)"""
+    app = FastAPI()
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep((embed_latency_ms + embed_item_ms * len(inputs)) / 1000)
+        return {"object": "list", "data": [{"object": "embedding", "index": i, "embedding": hash_embedding(text, dim)}
+                                           for i, text in enumerate(inputs)]}
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        tokens = [f"token{i} " for i in range(llm_tokens)]
+        if not body.get("stream"):
+            await asyncio.sleep(llm_latency_ms / 1000)
+            return {"choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}}]}
+
+        async def events():
+            # Latency is spread over the tokens, like a generating model
+            for token in tokens:
+                await asyncio.sleep(llm_latency_ms / 1000 / llm_tokens)
+                yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': token}}]})}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def qdrant_app() -> FastAPI:
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models
+
+    client = QdrantClient(":memory:")
+    app = FastAPI()
+
+    def ok(result):
+        if hasattr(result, "model_dump"):
+            result = result.model_dump(mode="json")
+        elif isinstance(result, list):
+            result = [r.model_dump(mode="json") if hasattr(r, "model_dump") else r for r in result]
+        return {"result": result, "status": "ok", "time": 0.0}
+
+    updated = {"operation_id": 0, "status": "completed"}
+
+    @app.exception_handler(ValueError)
+    async def not_found(request: Request, exc: ValueError):
+        return JSONResponse(status_code=404, content={"status": {"error": f"Not found: {exc}"}, "time": 0.0})
+
+    @app.get("/")
+    async def root():
+        return {"title": "qdrant - vector search engine", "version": "1.12.0"}
+
+    @app.get("/collections")
+    async def list_collections():
+        return ok({"collections": [{"name": c.name} for c in client.get_collections().collections]})
+
+    @app.get("/collections/{name}")
+    async def get_collection(name: str):
+        return ok(client.get_collection(name))
+
+    @app.get("/collections/{name}/exists")
+    async def collection_exists(name: str):
+        return ok({"exists": client.collection_exists(name)})
+
+    @app.put("/collections/{name}")
+    async def create_collection(name: str, request: Request):
+        req = models.CreateCollection(**await request.json())
+        if client.collection_exists(name):
+            return JSONResponse(status_code=409, content={"status": {"error": f"Collection `{name}` already exists!"}})
+        client.create_collection(name, vectors_config=req.vectors, sparse_vectors_config=req.sparse_vectors)
+        return ok(True)
+
+    @app.patch("/collections/{name}")
+    async def update_collection(name: str, request: Request):
+        client.get_collection(name)  # 404 for unknown collections; the settings themselves are not applied
+        return ok(True)
+
+    @app.put("/collections/{name}/index")
+    async def create_payload_index(name: str, request: Request):
+        client.get_collection(name)
+        return ok(updated)
+
+    @app.delete("/collections/{name}")
+    async def delete_collection(name: str):
+        return ok(client.delete_collection(name))
+
+    @app.put("/collections/{name}/points")
+    async def upsert(name: str, request: Request):
+        body = await request.json()
+        if "batch" in body:
+            client.upsert(name, points=models.Batch(**body["batch"]))
+        else:
+            client.upsert(name, points=[models.PointStruct(**p) for p in body["points"]])
+        return ok(updated)
+
+    @app.post("/collections/{name}/points/delete")
+    async def delete_points(name: str, request: Request):
+        body = await request.json()
+        selector = models.FilterSelector(**body) if "filter" in body else models.PointIdsList(**body)
+        client.delete(name, points_selector=selector)
+        return ok(updated)
+
+    @app.post("/collections/{name}/points")
+    async def retrieve(name: str, request: Request):
+        req = models.PointRequest(**await request.json())
+        return ok(client.retrieve(name, req.ids, with_payload=req.with_payload if req.with_payload is not None else True,
+                                  with_vectors=req.with_vector or False))
+
+    @app.post("/collections/{name}/points/query")
+    async def query(name: str, request: Request):
+        req = models.QueryRequest(**await request.json())
+        return ok(client.query_points(
+            name, query=req.query, using=req.using, query_filter=req.filter, search_params=req.params,
+            limit=req.limit or 10, offset=req.offset, score_threshold=req.score_threshold,
+            with_payload=req.with_payload if req.with_payload is not None else False,
+            with_vectors=req.with_vector or False,
+        ))
+
+    @app.post("/collections/{name}/points/count")
+    async def count(name: str, request: Request):
+        req = models.CountRequest(**await request.json())
+        return ok(client.count(name, count_filter=req.filter, exact=req.exact if req.exact is not None else True))
+
+    return app
+
+
+def serve_in_thread(app: FastAPI, port: int) -> uvicorn.Server:
+    """Starts `app` on 127.0.0.1:port; stop it with server.should_exit = True"""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError(f"Stand-in on port {port} did not start")
+        time.sleep(0.01)
+    return server
@@ -0,0 +1,161 @@
+"""Cost of tracing and of the sampling profiler.
+
+Measures three things against services/rag-query/tracing.py and profiler.py
+(the copies in the other services are identical):
+
+  * span(): time per span, without export, and with every span exported to a
+    local stand-in collector (OTLP/HTTP, answers 200 to everything)
+  * the middleware: latency of a trivial FastAPI endpoint with and without
+    TracingMiddleware, over a real socket
+  * the profiler: throughput of a CPU-bound loop while /debug/profile samples
+    the process at each --hz
+
+    python benchmarks/tracing_overhead.py --spans 200000 --requests 2000 --hz 100 500 --output tracing.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Dict, List
+
+import httpx
+from fastapi import FastAPI, Request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "rag-query"))
+import profiler  # noqa: E402
+import tracing  # noqa: E402
+from stand_ins import serve_in_thread  # noqa: E402
+
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def collector_app(received: List[int]) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v1/traces")
+    async def traces(request: Request):
+        body = await request.json()
+        received.append(sum(len(ss["spans"]) for rs in body["resourceSpans"] for ss in rs["scopeSpans"]))
+        return {}
+
+    return app
+
+
+def time_spans(count: int) -> float:
+    """Microseconds per span, nested one level under a parent like a real call site"""
+    with tracing.span("bench.parent", kind=tracing.KIND_INTERNAL):
+        t0 = time.perf_counter()
+        for _ in range(count):
+            with tracing.span("bench.child", attempt=1):
+                pass
+        return (time.perf_counter() - t0) / count * 1e6
+
+
+def bench_spans(count: int) -> Dict:
+    without = time_spans(count)
+    received: List[int] = []
+    port = free_port()
+    serve_in_thread(collector_app(received), port)
+    tracing._exporter = tracing.OtlpExporter(f"http://127.0.0.1:{port}", "bench")
+    try:
+        with_export = time_spans(count)
+    finally:
+        exporter, tracing._exporter = tracing._exporter, None
+        exporter.shutdown(timeout=30)
+    dropped = tracing.SPANS_DROPPED._value.get()
+    return {"us_per_span": round(without, 2), "us_per_span_exported": round(with_export, 2),
+            "exported": sum(received), "dropped": int(dropped)}
+
+
+def endpoint_app(traced: bool) -> FastAPI:
+    app = FastAPI()
+    if traced:
+        app.add_middleware(tracing.TracingMiddleware)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+def bench_middleware(requests: int) -> Dict:
+    results = {}
+    for traced in (False, True):
+        port = free_port()
+        serve_in_thread(endpoint_app(traced), port)
+        latencies = []
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            for _ in range(50):
+                client.get("/ping")
+            for _ in range(requests):
+                t0 = time.perf_counter()
+                client.get("/ping", headers={"X-Request-ID": "bench"})
+                latencies.append((time.perf_counter() - t0) * 1000)
+        latencies.sort()
+        results["traced" if traced else "plain"] = {
+            "p50_ms": round(statistics.median(latencies), 3),
+            "p99_ms": round(latencies[int(0.99 * (len(latencies) - 1))], 3),
+        }
+    return results
+
+
+def iterations(seconds: float) -> int:
+    """Iterations of a pure-Python loop in `seconds`: holds the GIL like request handling does"""
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(100))
+        count += 1
+    return count
+
+
+def bench_profiler(seconds: float, rates: List[int]) -> List[Dict]:
+    baseline = iterations(seconds)
+    rows = [{"hz": 0, "iterations": baseline, "slowdown_pct": 0.0}]
+    for hz in rates:
+        result = {}
+        sampler = threading.Thread(target=lambda: result.update(stacks=profiler.sample_stacks(seconds, hz)))
+        sampler.start()
+        count = iterations(seconds)
+        sampler.join()
+        rows.append({"hz": hz, "iterations": count, "samples": sum(result["stacks"].values()),
+                     "slowdown_pct": round(100 * (1 - count / baseline), 1)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spans", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--profile-seconds", type=float, default=5)
+    parser.add_argument("--hz", type=int, nargs="+", default=[100, 500])
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    spans = bench_spans(args.spans)
+    print(f"span(): {spans['us_per_span']:.2f}us, exported {spans['us_per_span_exported']:.2f}us "
+          f"({spans['exported']} exported, {spans['dropped']} dropped)")
+    middleware = bench_middleware(args.requests)
+    print(f"GET /ping p50/p99: plain {middleware['plain']['p50_ms']:.3f}/{middleware['plain']['p99_ms']:.3f}ms, "
+          f"traced {middleware['traced']['p50_ms']:.3f}/{middleware['traced']['p99_ms']:.3f}ms")
+    rows = bench_profiler(args.profile_seconds, args.hz)
+    for row in rows:
+        print(f"profiler {row['hz']:>4} Hz: {row['iterations']} iterations ({row['slowdown_pct']:.1f}% slower)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "spans": spans, "middleware": middleware, "profiler": rows}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
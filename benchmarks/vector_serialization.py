@@ -0,0 +1,146 @@
+"""Vector serialization microbenchmark: JSON float lists versus packed vectors.
+
+Measures encode/decode time, payload size and precision loss of every format
+the embeddings-engine can answer /embed with, plus the pgvector parameter
+(text literal via str() versus the binary format):
+
+    python benchmarks/vector_serialization.py --dim 1024 --iterations 2000 --output vector_serialization.json
+
+With --dsn the pgvector comparison also runs a round trip against Postgres.
+Encoding starts from a Python float list, as the service receives it from
+the embedding API or cache; decoding ends in a float32 numpy array.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "embeddings-engine"))
+from vector_codec import PgVector, decode_vector, decode_vector_b64, encode_vector, encode_vector_b64  # noqa: E402
+
+
+def time_us(fn: Callable, iterations: int) -> float:
+    """Median of `iterations` calls, in microseconds"""
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return statistics.median(samples)
+
+
+def json_codec():
+    def encode(vector: List[float]) -> bytes:
+        return json.dumps({"embedding": vector}).encode("utf-8")
+
+    def decode(payload: bytes) -> np.ndarray:
+        return np.asarray(json.loads(payload)["embedding"], dtype=np.float32)
+    return encode, decode
+
+
+def base64_codec(dtype: str):
+    def encode(vector: List[float]) -> bytes:
+        packed, scale = encode_vector_b64(vector, dtype)
+        return json.dumps({"embedding_b64": packed, "dtype": dtype, "scale": scale, "dim": len(vector)}).encode("utf-8")
+
+    def decode(payload: bytes) -> np.ndarray:
+        data = json.loads(payload)
+        return decode_vector_b64(data["embedding_b64"], data["dtype"], data["scale"], data["dim"])
+    return encode, decode
+
+
+def raw_codec(dtype: str):
+    # The scale travels in a response header; it is part of the measured work here
+    def encode(vector: List[float]):
+        return encode_vector(vector, dtype)
+
+    def decode(payload) -> np.ndarray:
+        data, scale = payload
+        return decode_vector(data, dtype, scale)
+    return encode, decode
+
+
+def payload_size(payload) -> int:
+    return len(payload[0]) if isinstance(payload, tuple) else len(payload)
+
+
+def bench_formats(vector: List[float], iterations: int) -> List[Dict]:
+    reference = np.asarray(vector, dtype=np.float32)
+    formats = {"json": json_codec()}
+    for dtype in ("float32", "float16", "int8"):
+        formats[f"base64-{dtype}"] = base64_codec(dtype)
+        formats[f"raw-{dtype}"] = raw_codec(dtype)
+
+    rows = []
+    for name, (encode, decode) in formats.items():
+        payload = encode(vector)
+        decoded = decode(payload)
+        cosine = float(decoded @ reference / (np.linalg.norm(decoded) * np.linalg.norm(reference)))
+        rows.append({
+            "format": name,
+            "bytes": payload_size(payload),
+            "encode_us": round(time_us(lambda: encode(vector), iterations), 1),
+            "decode_us": round(time_us(lambda: decode(payload), iterations), 1),
+            "max_abs_error": float(np.abs(decoded - reference).max()),
+            "cosine": round(cosine, 6),
+        })
+    return rows
+
+
+def bench_pgvector(vector: List[float], iterations: int, dsn: str = None) -> List[Dict]:
+    rows = [
+        {"param": "text (str(list))", "bytes": len(str(vector)),
+         "encode_us": round(time_us(lambda: str(vector), iterations), 1)},
+        {"param": "binary (PgVector)", "bytes": len(PgVector(vector).data),
+         "encode_us": round(time_us(lambda: PgVector(vector), iterations), 1)},
+    ]
+    if dsn:
+        import psycopg
+        with psycopg.connect(dsn, autocommit=True) as conn:
+            conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+            text_sql, binary_sql = "SELECT %s::vector <=> %s::vector", "SELECT %b::vector <=> %b::vector"
+            rows[0]["roundtrip_us"] = round(time_us(
+                lambda: conn.execute(text_sql, (str(vector), str(vector))).fetchone(), iterations), 1)
+            rows[1]["roundtrip_us"] = round(time_us(
+                lambda: conn.execute(binary_sql, (PgVector(vector), PgVector(vector))).fetchone(), iterations), 1)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--dsn", default=os.getenv("PG_DSN"), help="libpq connection string for the pgvector round trip")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vector = rng.standard_normal(args.dim).astype(np.float32)
+    vector = (vector / np.linalg.norm(vector)).tolist()
+
+    formats = bench_formats(vector, args.iterations)
+    print(f"{'format':16} {'bytes':>7} {'encode':>10} {'decode':>10} {'max err':>10} {'cosine':>9}")
+    for row in formats:
+        print(f"{row['format']:16} {row['bytes']:7} {row['encode_us']:8.1f}us {row['decode_us']:8.1f}us "
+              f"{row['max_abs_error']:10.2e} {row['cosine']:9.6f}")
+
+    pgvector = bench_pgvector(vector, args.iterations, args.dsn)
+    print()
+    for row in pgvector:
+        roundtrip = f"  roundtrip={row['roundtrip_us']:.1f}us" if "roundtrip_us" in row else ""
+        print(f"pgvector {row['param']:18} {row['bytes']:7} bytes  encode={row['encode_us']:.1f}us{roundtrip}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"dim": args.dim, "iterations": args.iterations, "formats": formats, "pgvector": pgvector}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -70,6 +70,36 @@ resource "kubernetes_config_map" "rag_dashboard" {
       "unit": "percent",
       "description": "Percentage of top-k results shared between Qdrant and Postgres"
     },
+    {
+      "title": "Recall@k and nDCG (Qdrant vs. exact Postgres)",
+      "type": "timeseries",
+      "targets": [
+        {
+          "legendFormat": "Recall@k",
+          "expr": "avg_over_time(rag_search_recall_at_k[5m])"
+        },
+        {
+          "legendFormat": "nDCG",
+          "expr": "avg_over_time(rag_search_ndcg[5m])"
+        }
+      ],
+      "gridPos": { "h": 6, "w": 6, "x": 18, "y": 4 },
+      "min": 0,
+      "max": 1,
+      "description": "Quality of the Qdrant ranking measured by the background shadow evaluator"
+    },
+    {
+      "title": "Shadow Comparisons Skipped",
+      "type": "timeseries",
+      "targets": [
+        {
+          "legendFormat": "{{reason}}",
+          "expr": "sum by (reason) (rate(rag_shadow_skipped_total[5m]))"
+        }
+      ],
+      "gridPos": { "h": 6, "w": 6, "x": 6, "y": 12 },
+      "description": "Sampled-out, dropped (queue full) and failed shadow comparisons per second"
+    },
     {
       "title": "Postgres Active Connections",
       "type": "timeseries",
@@ -0,0 +1,209 @@
+import os
+import asyncio
+import bisect
+import codecs
+import hashlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, List, Optional, Tuple
+
+import pypdf
+import docx
+from fastapi import UploadFile
+from chunk_format import ChunkRecord
+from splitting import CHUNK_UNIT, flush_chars, locate_chunks, split_text
+
+# --- Configuration ---
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(max(1, min(4, os.cpu_count() or 1)))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+SPOOL_READ_SIZE = 1024 * 1024
+TEXT_READ_SIZE = 256 * 1024
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+    return _pool
+
+
+def shutdown_pool(wait: bool = False):
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+
+
+async def spool_upload(file: UploadFile) -> Tuple[str, str]:
+    """Copies the upload to a temp file in fixed-size pieces; returns its path and the SHA-256 of the content"""
+    suffix = os.path.splitext(file.filename or "")[1]
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=suffix)
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                data = await file.read(SPOOL_READ_SIZE)
+                if not data:
+                    break
+                digest.update(data)
+                out.write(data)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path, digest.hexdigest()
+
+
+# --- Worker-side functions (run in the process pool, must be top-level) ---
+
+# Each worker keeps the reader of the file it last worked on; reopening it for
+# every page range re-parses shared fonts and resources and doubles the cost
+_reader_key: Optional[tuple] = None
+_reader: Optional[pypdf.PdfReader] = None
+
+
+def _pdf_reader(path: str) -> pypdf.PdfReader:
+    global _reader_key, _reader
+    st = os.stat(path)
+    key = (path, st.st_ino, st.st_mtime_ns)  # temp file names can be reused
+    if _reader_key != key:
+        _reader_key, _reader = key, pypdf.PdfReader(path)
+    return _reader
+
+
+def _pdf_page_count(path: str) -> int:
+    return len(_pdf_reader(path).pages)
+
+
+def _extract_pdf_pages(path: str, start: int, end: int) -> List[str]:
+    reader = _pdf_reader(path)
+    return [(reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def _extract_docx(path: str) -> List[str]:
+    return [paragraph.text for paragraph in docx.Document(path).paragraphs]
+
+
+# --- Page producers ---
+
+async def iter_pdf_pages(path: str) -> AsyncIterator[str]:
+    """Extracts page ranges in parallel and yields page texts in document order"""
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    total = await loop.run_in_executor(pool, _pdf_page_count, path)
+
+    ranges = [(s, min(s + PDF_PAGES_PER_TASK, total)) for s in range(0, total, PDF_PAGES_PER_TASK)]
+    # Keep a bounded number of ranges in flight so memory stays flat for huge files
+    max_in_flight = EXTRACT_WORKERS * 2
+    pending = []
+    next_range = 0
+    try:
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < max_in_flight:
+                start, end = ranges[next_range]
+                pending.append(loop.run_in_executor(pool, _extract_pdf_pages, path, start, end))
+                next_range += 1
+            for page_text in await pending.pop(0):
+                yield page_text
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+
+async def iter_docx_paragraphs(path: str) -> AsyncIterator[str]:
+    loop = asyncio.get_running_loop()
+    for paragraph in await loop.run_in_executor(get_pool(), _extract_docx, path):
+        yield paragraph
+
+
+async def iter_text_blocks(path: str) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        while True:
+            data = await asyncio.to_thread(f.read, TEXT_READ_SIZE)
+            if not data:
+                break
+            yield decoder.decode(data)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_document_parts(path: str, filename: str) -> AsyncIterator[str]:
+    if filename.endswith(".pdf"):
+        return iter_pdf_pages(path)
+    if filename.endswith(".docx"):
+        return iter_docx_paragraphs(path)
+    return iter_text_blocks(path)
+
+
+# --- Incremental chunking ---
+
+async def split_in_pool(text: str, chunk_size: int, chunk_overlap: int, unit: str = CHUNK_UNIT) -> List[str]:
+    """Splitting is CPU-bound; run it in the worker processes, which keep their splitters cached"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(), split_text, text, chunk_size, chunk_overlap, unit)
+
+
+async def iter_chunks(parts: AsyncIterator[str], chunk_size: int, chunk_overlap: int, unit: str = CHUNK_UNIT,
+                      separator: str = "\n", paged: bool = False) -> AsyncIterator[ChunkRecord]:
+    """Splits text as it arrives instead of after the whole document is extracted.
+
+    Parts are buffered in a list and split (in the process pool) once the buffer is large enough; the
+    text of the last chunk of every split is carried into the next round so no
+    chunk is cut short at a flush boundary and overlap is kept. Chunks carry
+    their character span in the joined document text and, when `paged`, the
+    number of the part (page) they start in.
+    """
+    flush_at = flush_chars(chunk_size, unit)
+    buffer: List[str] = []
+    buffered = 0
+    buffer_start = 0  # document offset of the first buffered character
+    part_starts: List[int] = []
+    position = 0
+
+    def records(text: str, chunks: List[str]) -> List[ChunkRecord]:
+        nonlocal position
+        out = []
+        for chunk, (start, end) in zip(chunks, locate_chunks(text, chunks)):
+            start, end = buffer_start + start, buffer_start + end
+            page = bisect.bisect_right(part_starts, start) if paged else None
+            out.append(ChunkRecord(position, chunk, page, start, end))
+            position += 1
+        return out
+
+    async for part in parts:
+        part_starts.append(buffer_start + buffered)
+        buffer.append(part)
+        buffer.append(separator)
+        buffered += len(part) + len(separator)
+        if buffered < flush_at:
+            continue
+
+        text = "".join(buffer)
+        chunks = await split_in_pool(text, chunk_size, chunk_overlap, unit)
+        for record in records(text, chunks[:-1]):
+            yield record
+        # Carry the raw text from the last chunk on (not the stripped chunk) so
+        # the whitespace at the boundary survives into the next split
+        carry_at = text.rfind(chunks[-1]) if chunks else len(text)
+        buffer_start += carry_at
+        carry = text[carry_at:]
+        buffer, buffered = [carry], len(carry)
+
+    if buffered:
+        text = "".join(buffer)
+        for record in records(text, await split_in_pool(text, chunk_size, chunk_overlap, unit)):
+            yield record
+
+
+def iter_document_chunks(path: str, filename: str, chunk_size: int, chunk_overlap: int,
+                         unit: str = CHUNK_UNIT) -> AsyncIterator[ChunkRecord]:
+    """Extract + chunk pipeline for a spooled upload"""
+    # Pages and paragraphs are joined by newlines (as before); raw text blocks are contiguous
+    separator = "" if filename.endswith(".txt") else "\n"
+    return iter_chunks(iter_document_parts(path, filename), chunk_size, chunk_overlap, unit,
+                       separator=separator, paged=filename.endswith(".pdf"))
@@ -1,159 +1,294 @@
 import os
-import io
+import re
 import json
 import uuid
+import asyncio
+import hashlib
+import tempfile
+import time
+from dataclasses import dataclass
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from pydantic import BaseModel
-from typing import List, Optional
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-import pypdf
-import docx
+from fastapi import FastAPI, Header, HTTPException, UploadFile, File
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, AsyncIterator, Dict, List, Optional
 import boto3
-import requests
+import httpx
+from prometheus_fastapi_instrumentator import Instrumentator
+
+from extraction import (EXTRACT_WORKERS, SUPPORTED_EXTENSIONS, get_pool, spool_upload, iter_document_chunks,
+                        shutdown_pool)
+from splitting import CHUNK_UNIT, split_text_records, validate_settings
+from chunk_format import ChunkRecord, encode_chunk_file, encode_index, index_key, legacy_key, stream_key
+from tracing import KIND_INTERNAL, TracingMiddleware, inject_headers, instrument_boto3, span, start_tracing, stop_tracing
+from profiler import profile_response
 
 app = FastAPI(title="Document Chunking Service")
+app.add_middleware(TracingMiddleware)
+
+Instrumentator().instrument(app).expose(app)
 
 # Configuration
 S3_BUCKET = os.getenv("S3_BUCKET", "faro-rag-documents-eu-central-1")
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
 S3_ENABLED = os.getenv("S3_ENABLED", "false").lower() == "true"
+# ndjson-gz = streamable chunk file + index (read with ranged GETs); json = one legacy JSON object,
+# for embeddings engines that predate the streamed format
+CHUNK_FORMAT = os.getenv("CHUNK_FORMAT", "ndjson-gz")
+# Service name 'embeddings-engine' resolves to the Service IP in K8s
+EMBEDDINGS_JOBS_URL = os.getenv("EMBEDDINGS_JOBS_URL", "http://embeddings-engine/jobs")
+ENQUEUE_ATTEMPTS = int(os.getenv("ENQUEUE_ATTEMPTS", "3"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+# /chunk/batch: documents listed inline per request, and documents processed at once
+BATCH_MAX_DOCUMENTS = int(os.getenv("BATCH_MAX_DOCUMENTS", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(EXTRACT_WORKERS * 2)))
+
+# Namespace of derived document ids (see resolve_document_id): uploads without a document_id are keyed
+# on their content, so a corrected file becomes a new document; only an explicit id replaces one
+DOCUMENT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, "documents.faro-rag")
+DOCUMENT_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+# Returned with content-derived ids, so a client re-uploading a changed document learns it was not replaced
+NEW_DOCUMENT_NOTICE = ("document_id was derived from the content: changed content is stored as a new document "
+                       "next to earlier versions. Pass document_id to replace a document.")
 
 # S3 Client - only create if enabled
 s3_client = None
 if S3_ENABLED:
-    s3_client = boto3.client("s3")
+    s3_client = instrument_boto3(boto3.client("s3"))
+
+# Shared HTTP client, created at startup and closed at shutdown
+http_client: Optional[httpx.AsyncClient] = None
+
+@app.on_event("startup")
+async def startup():
+    global http_client
+    start_tracing("document-chunking")
+    http_client = httpx.AsyncClient(
+        timeout=5,
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        # The embedding job continues the trace of the upload
+        event_hooks={"request": [inject_headers]},
+    )
+
+@app.on_event("shutdown")
+async def shutdown():
+    if http_client:
+        await http_client.aclose()
+    shutdown_pool()
+    stop_tracing()
 
 class ChunkRequest(BaseModel):
     text: str
     chunk_size: int = 1000
     chunk_overlap: int = 200
     save_to_s3: bool = True  # Default true when S3 is enabled
+    document_id: Optional[str] = None  # Pass the same id again to replace a document
+    unit: Optional[str] = None  # chars | tokens (of the embedding model's tokenizer), defaults to CHUNK_UNIT
 
 class ChunkResponse(BaseModel):
     chunks: List[str]
     total_chunks: int
     document_id: Optional[str] = None
     s3_path: Optional[str] = None
+    job_id: Optional[str] = None  # embedding job, poll GET /jobs/{job_id} on the embeddings engine
+    notice: Optional[str] = None  # set when no document_id was passed, see NEW_DOCUMENT_NOTICE
+
+class BatchDocument(BaseModel):
+    text: str
+    document_id: Optional[str] = None
+    name: Optional[str] = None  # echoed in the results, e.g. the source path
+
+class BatchRequest(BaseModel):
+    documents: List[BatchDocument] = Field(default_factory=list, max_length=BATCH_MAX_DOCUMENTS)
+    # PDF/DOCX/TXT objects to chunk, listed inline and/or in a manifest object (one key per line)
+    s3_keys: List[str] = Field(default_factory=list, max_length=BATCH_MAX_DOCUMENTS)
+    manifest_key: Optional[str] = None
+    source_bucket: Optional[str] = None  # bucket of s3_keys and manifest_key, defaults to S3_BUCKET
+    chunk_size: int = 1000
+    chunk_overlap: int = 200
+    unit: Optional[str] = None
+    save_to_s3: bool = True
+    include_chunks: bool = False  # chunk texts in the results; usually not wanted for bulk loads
+
+@dataclass
+class BatchItem:
+    index: int
+    name: str
+    document_id: Optional[str]
+    text: Optional[str] = None
+    path: Optional[str] = None  # spooled upload, removed when processed
+    s3_key: Optional[str] = None
+    notice: Optional[str] = None
 
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "s3_enabled": S3_ENABLED}
 
-def save_chunks_to_s3(chunks: List[str], filename: str = "text") -> tuple[str, str]:
-    """Save chunks to S3 and return document_id and s3_path"""
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 30, hz: int = 100, idle: bool = False,
+                        x_profiler_token: Optional[str] = Header(None)):
+    """Samples the stacks of this worker for `seconds` and returns them folded, for a flame graph (PROFILER_ENABLED)"""
+    return await profile_response(seconds, hz, idle, x_profiler_token)
+
+def resolve_document_id(document_id: Optional[str], name: str) -> str:
+    """Client-provided id, or one derived from `name` (content hash or S3 location).
+
+    Only an explicit id (or the same S3 key) replaces an earlier version of a
+    document; without one, changed content becomes a new document.
+    """
+    if document_id is None:
+        return str(uuid.uuid5(DOCUMENT_NAMESPACE, name))
+    if not DOCUMENT_ID_PATTERN.match(document_id):
+        raise HTTPException(status_code=400, detail="document_id may only contain letters, digits, '.', '_' and '-'")
+    return document_id
+
+def get_s3_client():
     global s3_client
-    
+    if s3_client is None:
+        s3_client = instrument_boto3(boto3.client("s3"))
+    return s3_client
+
+def check_settings(chunk_size: int, chunk_overlap: int, unit: Optional[str]) -> str:
+    unit = unit or CHUNK_UNIT
+    try:
+        validate_settings(chunk_size, chunk_overlap, unit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return unit
+
+def save_chunks_to_s3(records: List[ChunkRecord], document_id: str, filename: str = "text") -> tuple[str, str, str]:
+    """Save chunks to S3 and return document_id, s3_path and the key of the chunk file"""
     if not S3_ENABLED:
         raise HTTPException(status_code=400, detail="S3 storage is not enabled. Set S3_ENABLED=true")
     
-    if s3_client is None:
-        s3_client = boto3.client("s3")
+    s3_client = get_s3_client()
     
-    document_id = str(uuid.uuid4())
     timestamp = datetime.now().isoformat()
+
+    if CHUNK_FORMAT == "json":
+        data = {
+            "document_id": document_id,
+            "filename": filename,
+            "created_at": timestamp,
+            "total_chunks": len(records),
+            "chunks": [r.text for r in records]
+        }
+        s3_key = legacy_key(document_id)
+        s3_client.put_object(Bucket=S3_BUCKET, Key=s3_key, Body=json.dumps(data), ContentType="application/json")
+        return document_id, f"s3://{S3_BUCKET}/{s3_key}", s3_key
+
+    body, index = encode_chunk_file(records, document_id, filename, timestamp)
+    s3_key = stream_key(document_id)
+    # No Content-Encoding: clients must not decompress transparently, ranges address the compressed bytes
+    s3_client.put_object(Bucket=S3_BUCKET, Key=s3_key, Body=body, ContentType="application/gzip")
+    # Index last: readers start from it, so it never points at a missing data object
+    s3_client.put_object(Bucket=S3_BUCKET, Key=index_key(s3_key), Body=encode_index(index), ContentType="application/gzip")
     
-    data = {
-        "document_id": document_id,
-        "filename": filename,
-        "created_at": timestamp,
-        "total_chunks": len(chunks),
-        "chunks": chunks
-    }
-    
-    s3_key = f"chunks/{document_id}.json"
-    s3_client.put_object(
-        Bucket=S3_BUCKET,
-        Key=s3_key,
-        Body=json.dumps(data),
-        ContentType="application/json"
-    )
-    
-    return document_id, f"s3://{S3_BUCKET}/{s3_key}"
+    return document_id, f"s3://{S3_BUCKET}/{s3_key}", s3_key
+
+async def enqueue_embedding(document_id: str, s3_key: str) -> Optional[str]:
+    """Queues an embedding job for the saved chunks and returns its job id"""
+    payload = {"s3_key": s3_key, "s3_bucket": S3_BUCKET}
+    for attempt in range(1, ENQUEUE_ATTEMPTS + 1):
+        try:
+            with span("embeddings_engine.enqueue", attempt=attempt):
+                response = await http_client.post(EMBEDDINGS_JOBS_URL, json=payload)
+                response.raise_for_status()
+            job_id = response.json()["job_id"]
+            print(f"Queued embedding job {job_id} for {document_id}")
+            return job_id
+        except Exception as e:
+            print(f"Warning: Failed to queue embedding job for {document_id} (attempt {attempt}): {e}")
+            if attempt < ENQUEUE_ATTEMPTS:
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+    # Chunks are in S3; they can still be queued by hand via POST /jobs
+    print(f"ERROR: Embedding job for {document_id} was not queued")
+    return None
 
 @app.post("/chunk/text", response_model=ChunkResponse)
 async def chunk_text(request: ChunkRequest):
     """Chunk plain text into smaller pieces"""
+    unit = check_settings(request.chunk_size, request.chunk_overlap, request.unit)
     try:
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=request.chunk_size,
-            chunk_overlap=request.chunk_overlap
-        )
-        chunks = splitter.split_text(request.text)
+        # Splitting is CPU-bound: it runs in the worker processes, not on the event loop
+        loop = asyncio.get_running_loop()
+        with span("chunk.split", kind=KIND_INTERNAL, chars=len(request.text)):
+            records = await loop.run_in_executor(get_pool(), split_text_records, request.text,
+                                                 request.chunk_size, request.chunk_overlap, unit)
+        chunks = [r.text for r in records]
         
         document_id = None
         s3_path = None
+        job_id = None
+        notice = None
         if request.save_to_s3:
-            document_id, s3_path = save_chunks_to_s3(chunks)
+            text_hash = hashlib.sha256(request.text.encode("utf-8")).hexdigest()
+            document_id = resolve_document_id(request.document_id, f"text:{text_hash}")
+            if request.document_id is None:
+                notice = NEW_DOCUMENT_NOTICE
+            document_id, s3_path, s3_key = await asyncio.to_thread(save_chunks_to_s3, records, document_id)
         
-            try:
-                trigger_url = "http://embeddings-engine/process/s3"
-                # Using the default bucket variable
-                requests.post(trigger_url, json={"s3_key": f"chunks/{document_id}.json", "s3_bucket": S3_BUCKET}, timeout=5)
-                print(f"Triggered embedding for {document_id}")
-            except Exception as e:
-                print(f"Warning: Failed to trigger embedding service: {e}")
+            job_id = await enqueue_embedding(document_id, s3_key)
         
         return {
             "chunks": chunks, 
             "total_chunks": len(chunks),
             "document_id": document_id,
-            "s3_path": s3_path
+            "s3_path": s3_path,
+            "job_id": job_id,
+            "notice": notice
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/chunk/file", response_model=ChunkResponse)
-async def chunk_file(file: UploadFile = File(...), save_to_s3: bool = True):
+async def chunk_file(file: UploadFile = File(...), save_to_s3: bool = True, document_id: Optional[str] = None,
+                     unit: Optional[str] = None):
     """Upload and chunk a document (PDF, DOCX, TXT)"""
+    if not (file.filename or "").endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Unsupported file type. Use PDF, DOCX, or TXT.")
+    unit = check_settings(CHUNK_SIZE, CHUNK_OVERLAP, unit)
+    # An explicit id is checked up front so a bad one is rejected before the upload is processed
+    if save_to_s3 and document_id is not None:
+        document_id = resolve_document_id(document_id, "")
+    notice = NEW_DOCUMENT_NOTICE if save_to_s3 and document_id is None else None
+
     try:
-        content = await file.read()
-        text = ""
-        
-        # Extract text based on file type
-        if file.filename.endswith(".pdf"):
-            pdf_reader = pypdf.PdfReader(io.BytesIO(content))
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        
-        elif file.filename.endswith(".docx"):
-            doc = docx.Document(io.BytesIO(content))
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-        
-        elif file.filename.endswith(".txt"):
-            text = content.decode("utf-8")
-        
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type. Use PDF, DOCX, or TXT.")
-        
-        # Chunk the text
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP
-        )
-        chunks = splitter.split_text(text)
+        # Spool to disk instead of holding the whole upload in memory
+        path, content_hash = await spool_upload(file)
+        if save_to_s3 and document_id is None:
+            # Keyed on the content, not the file name: uploads that share a name stay separate documents
+            document_id = resolve_document_id(None, f"file:{content_hash}")
+        try:
+            # Chunking starts while later pages are still being extracted
+            with span("chunk.extract", kind=KIND_INTERNAL, file=file.filename):
+                records = [
+                    record async for record in iter_document_chunks(path, file.filename, CHUNK_SIZE, CHUNK_OVERLAP, unit)
+                ]
+        finally:
+            os.unlink(path)
         
-        document_id = None
+        chunks = [r.text for r in records]
         s3_path = None
+        job_id = None
         if save_to_s3:
-            document_id, s3_path = save_chunks_to_s3(chunks, file.filename)
+            document_id, s3_path, s3_key = await asyncio.to_thread(save_chunks_to_s3, records, document_id,
+                                                                   file.filename)
         
-            # Trigger Embedding Service
-            try:
-                # Service name 'embeddings-engine' resolves to the Service IP in K8s
-                trigger_url = "http://embeddings-engine/process/s3"
-                requests.post(trigger_url, json={"s3_key": f"chunks/{document_id}.json", "s3_bucket": S3_BUCKET}, timeout=5)
-                print(f"Triggered embedding for {document_id}")
-            except Exception as e:
-                print(f"Warning: Failed to trigger embedding service: {e}")
+            # Queue the embedding job; the engine's workers pick it up
+            job_id = await enqueue_embedding(document_id, s3_key)
         
         return {
             "chunks": chunks, 
             "total_chunks": len(chunks),
             "document_id": document_id,
-            "s3_path": s3_path
+            "s3_path": s3_path,
+            "job_id": job_id,
+            "notice": notice
         }
     
     except HTTPException:
@@ -161,6 +296,149 @@ async def chunk_file(file: UploadFile = File(...), save_to_s3: bool = True):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# --- Batch chunking ---
+
+def read_manifest(bucket: str, key: str) -> List[str]:
+    body = get_s3_client().get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+    return [line.strip() for line in body.splitlines() if line.strip() and not line.startswith("#")]
+
+def download_source(bucket: str, key: str) -> str:
+    fd, path = tempfile.mkstemp(prefix="source-", suffix=os.path.splitext(key)[1])
+    os.close(fd)
+    try:
+        # download_file fetches parts on its own threads, outside the trace; time the whole download here
+        with span("s3.download", key=key):
+            get_s3_client().download_file(bucket, key, path)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path
+
+async def chunk_batch_item(item: BatchItem, bucket: str, chunk_size: int, chunk_overlap: int, unit: str,
+                           save_to_s3: bool, include_chunks: bool, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    """Chunks (and saves and queues) one document of a batch; errors end up in the result, not raised"""
+    result: Dict[str, Any] = {"index": item.index, "name": item.name, "document_id": item.document_id}
+    if item.notice:
+        result["notice"] = item.notice
+    path = item.path
+    try:
+        async with semaphore:
+            t0 = time.perf_counter()
+            if item.text is not None:
+                loop = asyncio.get_running_loop()
+                with span("chunk.split", kind=KIND_INTERNAL, chars=len(item.text)):
+                    records = await loop.run_in_executor(get_pool(), split_text_records, item.text,
+                                                         chunk_size, chunk_overlap, unit)
+            else:
+                if item.s3_key is not None:
+                    if not item.s3_key.endswith(SUPPORTED_EXTENSIONS):
+                        raise ValueError("Unsupported file type. Use PDF, DOCX, or TXT.")
+                    path = await asyncio.to_thread(download_source, bucket, item.s3_key)
+                with span("chunk.extract", kind=KIND_INTERNAL, file=item.name):
+                    records = [record async for record in
+                               iter_document_chunks(path, item.name, chunk_size, chunk_overlap, unit)]
+
+            result.update(status="completed", total_chunks=len(records), s3_path=None, job_id=None)
+            if save_to_s3:
+                _, result["s3_path"], s3_key = await asyncio.to_thread(
+                    save_chunks_to_s3, records, item.document_id, os.path.basename(item.name))
+                result["job_id"] = await enqueue_embedding(item.document_id, s3_key)
+            if include_chunks:
+                result["chunks"] = [r.text for r in records]
+            result["seconds"] = round(time.perf_counter() - t0, 3)
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        print(f"Warning: batch document {item.name} failed: {detail}")
+        result.update(status="failed", error=detail)
+    finally:
+        if path:
+            os.unlink(path)
+    return result
+
+async def stream_batch(items: List[BatchItem], **options) -> AsyncIterator[str]:
+    """NDJSON: one line per document in completion order, then a summary line"""
+    semaphore = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+    tasks = [asyncio.create_task(chunk_batch_item(item, semaphore=semaphore, **options)) for item in items]
+    t0 = time.perf_counter()
+    failed = chunks = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            failed += result["status"] == "failed"
+            chunks += result.get("total_chunks", 0)
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"summary": {"documents": len(items), "failed": failed, "chunks": chunks,
+                                      "seconds": round(time.perf_counter() - t0, 3)}}) + "\n"
+    finally:
+        # Client went away: stop the remaining documents (their temp files are removed by the tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def batch_response(items: List[BatchItem], **options) -> StreamingResponse:
+    print(f"Chunking batch of {len(items)} documents")
+    return StreamingResponse(stream_batch(items, **options), media_type="application/x-ndjson")
+
+@app.post("/chunk/batch")
+async def chunk_batch(request: BatchRequest):
+    """Chunks many texts and/or S3 objects concurrently; results are streamed back as NDJSON as they finish"""
+    unit = check_settings(request.chunk_size, request.chunk_overlap, request.unit)
+    if request.save_to_s3 and not S3_ENABLED:
+        raise HTTPException(status_code=400, detail="S3 storage is not enabled. Set S3_ENABLED=true")
+    bucket = request.source_bucket or S3_BUCKET
+    s3_keys = list(request.s3_keys)
+    if request.manifest_key:
+        try:
+            s3_keys += await asyncio.to_thread(read_manifest, bucket, request.manifest_key)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to read manifest: {str(e)}")
+    if not request.documents and not s3_keys:
+        raise HTTPException(status_code=400, detail="Nothing to chunk: pass documents, s3_keys or manifest_key")
+
+    # Ids are validated up front, so a bad one fails the request before any work starts
+    items = []
+    for doc in request.documents:
+        text_hash = hashlib.sha256(doc.text.encode("utf-8")).hexdigest()
+        document_id = resolve_document_id(doc.document_id, f"text:{text_hash}") if request.save_to_s3 else None
+        notice = NEW_DOCUMENT_NOTICE if request.save_to_s3 and doc.document_id is None else None
+        items.append(BatchItem(len(items), doc.name or f"text:{text_hash[:12]}", document_id, text=doc.text,
+                               notice=notice))
+    for key in s3_keys:
+        document_id = resolve_document_id(None, f"s3:{bucket}/{key}") if request.save_to_s3 else None
+        items.append(BatchItem(len(items), key, document_id, s3_key=key))
+
+    return batch_response(items, bucket=bucket, chunk_size=request.chunk_size, chunk_overlap=request.chunk_overlap,
+                          unit=unit, save_to_s3=request.save_to_s3, include_chunks=request.include_chunks)
+
+@app.post("/chunk/batch/files")
+async def chunk_batch_files(files: List[UploadFile] = File(...), save_to_s3: bool = True, unit: Optional[str] = None,
+                            include_chunks: bool = False):
+    """Multipart variant of /chunk/batch for uploads (PDF, DOCX, TXT); document ids follow the file contents"""
+    unit = check_settings(CHUNK_SIZE, CHUNK_OVERLAP, unit)
+    if len(files) > BATCH_MAX_DOCUMENTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_DOCUMENTS} files per batch")
+    if save_to_s3 and not S3_ENABLED:
+        raise HTTPException(status_code=400, detail="S3 storage is not enabled. Set S3_ENABLED=true")
+    for file in files:
+        if not (file.filename or "").endswith(SUPPORTED_EXTENSIONS):
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.filename}. Use PDF, DOCX, or TXT.")
+
+    # Spooled before the response starts: the uploads are closed once this handler returns
+    items = []
+    try:
+        for file in files:
+            path, content_hash = await spool_upload(file)
+            document_id = resolve_document_id(None, f"file:{content_hash}") if save_to_s3 else None
+            items.append(BatchItem(len(items), file.filename, document_id, path=path,
+                                   notice=NEW_DOCUMENT_NOTICE if save_to_s3 else None))
+    except BaseException:
+        for item in items:
+            os.unlink(item.path)
+        raise
+
+    return batch_response(items, bucket=S3_BUCKET, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, unit=unit,
+                          save_to_s3=save_to_s3, include_chunks=include_chunks)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
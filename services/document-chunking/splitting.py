@@ -0,0 +1,98 @@
+import os
+import math
+from functools import lru_cache
+from typing import Callable, List, Tuple
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from chunk_format import ChunkRecord
+
+# --- Configuration ---
+# chars = chunk_size/overlap in characters (default); tokens = in tokens of CHUNK_TOKENIZER
+CHUNK_UNIT = os.getenv("CHUNK_UNIT", "chars")
+# Tokenizer of the embedding model: a tiktoken encoding (cl100k_base = OpenAI embedding models) or
+# hf:<model> for a Hugging Face tokenizer (e.g. hf:BAAI/bge-m3, needs the `tokenizers` package)
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "cl100k_base")
+# Largest chunk the embedding model takes without truncating; token-mode requests above it are rejected.
+# 8191 for OpenAI embeddings; set it to LOCAL_EMBEDDING_MAX_LENGTH with the local provider
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "8191"))
+# Used when the tokenizer cannot be loaded; low, so estimated chunks stay within the model limit
+CHUNK_CHARS_PER_TOKEN = float(os.getenv("CHUNK_CHARS_PER_TOKEN", "3"))
+
+UNITS = ("chars", "tokens")
+
+
+@lru_cache(maxsize=1)
+def token_length_function(tokenizer: str = CHUNK_TOKENIZER) -> Callable[[str], int]:
+    """Token counter for the splitter, loaded once per process"""
+    try:
+        if tokenizer.startswith("hf:"):
+            from tokenizers import Tokenizer
+            hf = Tokenizer.from_pretrained(tokenizer[3:])
+            return lambda text: len(hf.encode(text, add_special_tokens=False).ids)
+        import tiktoken
+        encoding = tiktoken.get_encoding(tokenizer)
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        # Missing package, or the tokenizer files could not be downloaded
+        print(f"Warning: tokenizer '{tokenizer}' unavailable, estimating {CHUNK_CHARS_PER_TOKEN:g} chars/token: {e}")
+        return lambda text: math.ceil(len(text) / CHUNK_CHARS_PER_TOKEN)
+
+
+@lru_cache(maxsize=32)
+def get_splitter(chunk_size: int, chunk_overlap: int, unit: str = CHUNK_UNIT) -> RecursiveCharacterTextSplitter:
+    """Splitters are cached per setting; every pool worker keeps its own"""
+    if unit == "tokens":
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                              length_function=token_length_function())
+    if unit == "chars":
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    raise ValueError(f"Unknown chunk unit '{unit}', use one of {', '.join(UNITS)}")
+
+
+def validate_settings(chunk_size: int, chunk_overlap: int, unit: str):
+    """Raises ValueError for settings the splitter or the embedding model cannot use"""
+    if unit not in UNITS:
+        raise ValueError(f"Unknown chunk unit '{unit}', use one of {', '.join(UNITS)}")
+    if chunk_size < 1 or not 0 <= chunk_overlap < chunk_size:
+        raise ValueError("chunk_overlap must be at least 0 and smaller than chunk_size")
+    if unit == "tokens" and chunk_size > CHUNK_MAX_TOKENS:
+        raise ValueError(f"chunk_size exceeds the embedding model limit of {CHUNK_MAX_TOKENS} tokens")
+
+
+def flush_chars(chunk_size: int, unit: str) -> int:
+    """Text buffered before a split during incremental chunking: about eight chunks"""
+    return chunk_size * 8 * (4 if unit == "tokens" else 1)
+
+
+def locate_chunks(text: str, chunks: List[str]) -> List[Tuple[int, int]]:
+    """Character span of every chunk in `text`; chunks are in order and may overlap"""
+    spans = []
+    cursor = 0
+    approximate = 0
+    for chunk in chunks:
+        pos = text.find(chunk, cursor)
+        if pos == -1:
+            # Not a verbatim substring (should not happen with the recursive splitter); keep the order
+            pos = cursor
+            approximate += 1
+        spans.append((pos, pos + len(chunk)))
+        cursor = pos + 1
+    if approximate:
+        # Logged, not counted: this runs in the pool workers, whose metrics are never scraped
+        print(f"Warning: {approximate} of {len(chunks)} chunks not found verbatim in the text, "
+              f"their character spans are approximate")
+    return spans
+
+
+# --- Worker-side functions (run in the process pool, must be top-level) ---
+
+def split_text(text: str, chunk_size: int, chunk_overlap: int, unit: str = CHUNK_UNIT) -> List[str]:
+    return get_splitter(chunk_size, chunk_overlap, unit).split_text(text)
+
+
+def split_text_records(text: str, chunk_size: int, chunk_overlap: int, unit: str = CHUNK_UNIT) -> List[ChunkRecord]:
+    """Chunks of a whole text with their character spans"""
+    chunks = split_text(text, chunk_size, chunk_overlap, unit)
+    return [ChunkRecord(i, chunk, None, start, end)
+            for i, (chunk, (start, end)) in enumerate(zip(chunks, locate_chunks(text, chunks)))]
@@ -0,0 +1,77 @@
+import os
+import json
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+from main import BatchItem, stream_batch
+
+TEXT = "Pump P-101 trips on low suction pressure. Check the strainer first. " * 20
+
+
+@pytest.fixture(autouse=True)
+def thread_pool(monkeypatch):
+    # Splitting normally runs in the process pool; threads keep the test in one process
+    with ThreadPoolExecutor(2) as pool:
+        monkeypatch.setattr(main, "get_pool", lambda: pool)
+        yield pool
+
+
+def run_batch(items, **options):
+    async def collect():
+        return [line async for line in stream_batch(items, **options)]
+
+    options = {"bucket": "bucket", "chunk_size": 200, "chunk_overlap": 20, "unit": "chars", "save_to_s3": False,
+               "include_chunks": False, **options}
+    return asyncio.run(collect())
+
+
+def spooled_text_file(text):
+    fd, path = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    return path
+
+
+def test_one_line_per_document_then_summary():
+    path = spooled_text_file(TEXT)
+    items = [
+        BatchItem(0, "a", None, text=TEXT),
+        BatchItem(1, "manual.txt", None, path=path),
+        BatchItem(2, "drawing.dwg", None, s3_key="drawing.dwg"),
+    ]
+    lines = run_batch(items)
+
+    assert all(line.endswith("\n") for line in lines)
+    results = [json.loads(line) for line in lines]
+    summary = results.pop()["summary"]
+    by_index = {r["index"]: r for r in results}
+    assert sorted(by_index) == [0, 1, 2]
+
+    assert by_index[0]["status"] == "completed" and by_index[0]["total_chunks"] > 1
+    assert by_index[1]["status"] == "completed"
+    assert by_index[1]["total_chunks"] == by_index[0]["total_chunks"]
+    assert "chunks" not in by_index[0]
+    assert by_index[2]["status"] == "failed" and "Unsupported file type" in by_index[2]["error"]
+
+    assert summary["documents"] == 3 and summary["failed"] == 1
+    assert summary["chunks"] == by_index[0]["total_chunks"] * 2
+    # Spooled uploads are removed once processed
+    assert not os.path.exists(path)
+
+
+def test_include_chunks_and_notice_are_echoed():
+    lines = run_batch([BatchItem(0, "a", "doc-a", text=TEXT, notice="new document")], include_chunks=True)
+    result = json.loads(lines[0])
+    assert result["document_id"] == "doc-a"
+    assert result["notice"] == "new document"
+    assert len(result["chunks"]) == result["total_chunks"]
+    assert all(chunk in TEXT for chunk in result["chunks"])
+
+
+def test_empty_batch_only_has_summary():
+    lines = run_batch([])
+    assert [json.loads(line)["summary"]["documents"] for line in lines] == [0]
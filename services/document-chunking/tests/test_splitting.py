@@ -0,0 +1,52 @@
+import pytest
+
+from splitting import CHUNK_MAX_TOKENS, locate_chunks, split_text_records, validate_settings
+
+TEXT = ("Pump P-101 trips on low suction pressure. Check the strainer first.\n\n"
+        "Error E42 means the seal flush is blocked. Flush the line and reset the alarm.\n\n"
+        "Valve V-7 must stay open during start-up. ") * 5
+
+
+def test_validate_settings_accepts_usable_settings():
+    validate_settings(1000, 200, "chars")
+    validate_settings(10, 0, "chars")
+    validate_settings(CHUNK_MAX_TOKENS, 100, "tokens")
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap, unit", [
+    (1000, 200, "words"),
+    (0, 0, "chars"),
+    (100, 100, "chars"),
+    (100, -1, "chars"),
+    (CHUNK_MAX_TOKENS + 1, 0, "tokens"),
+])
+def test_validate_settings_rejects(chunk_size, chunk_overlap, unit):
+    with pytest.raises(ValueError):
+        validate_settings(chunk_size, chunk_overlap, unit)
+
+
+def test_locate_overlapping_and_repeated_chunks():
+    text = "abc abc abcd"
+    assert locate_chunks(text, ["abc", "abc", "c abcd"]) == [(0, 3), (4, 7), (6, 12)]
+
+
+def test_locate_falls_back_to_cursor_and_warns(capsys):
+    assert locate_chunks("hello world", ["hello", "w0rld"]) == [(0, 5), (1, 6)]
+    assert "1 of 2 chunks not found verbatim" in capsys.readouterr().out
+
+
+def test_located_chunks_do_not_warn(capsys):
+    locate_chunks("hello world", ["hello", "world"])
+    assert capsys.readouterr().out == ""
+
+
+def test_split_text_records_spans_point_into_the_text():
+    records = split_text_records(TEXT, 120, 30, "chars")
+    assert len(records) > 3
+    assert [r.position for r in records] == list(range(len(records)))
+    for record in records:
+        assert len(record.text) <= 120
+        assert TEXT[record.start:record.end] == record.text
+        assert record.page is None
+    starts = [r.start for r in records]
+    assert starts == sorted(starts)
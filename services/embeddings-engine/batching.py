@@ -0,0 +1,155 @@
+import os
+import time
+import random
+import asyncio
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+from prometheus_client import Histogram
+
+from tracing import KIND_CLIENT, start_span
+
+# --- Configuration ---
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "8000"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_BACKOFF_BASE = float(os.getenv("EMBED_BACKOFF_BASE", "0.5"))
+EMBED_BACKOFF_MAX = float(os.getenv("EMBED_BACKOFF_MAX", "20"))
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "30"))
+
+# Rate limits, timeouts and server-side failures are worth another attempt
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+# Errors that can be caused by a single input (too long, malformed); other 4xx
+# (auth, unknown model or endpoint) fail every request alike
+BISECT_STATUS = {400, 413, 422}
+
+# --- Metrics ---
+EMBED_API_LATENCY = Histogram(
+    "embedding_api_latency_seconds",
+    "Latency of upstream embedding API requests",
+    ["outcome"]
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English/Dutch text)"""
+    return max(1, len(text) // 4)
+
+
+def pack_batches(texts: Sequence[str], max_items: int = EMBED_BATCH_SIZE,
+                 max_tokens: int = EMBED_BATCH_MAX_TOKENS) -> List[List[int]]:
+    """Groups text indices into batches bounded by item count and token budget.
+
+    A single text larger than the budget still gets a batch of its own.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    if retry_after:
+        try:
+            return min(float(retry_after), EMBED_BACKOFF_MAX)
+        except ValueError:
+            pass
+    delay = min(EMBED_BACKOFF_BASE * (2 ** attempt), EMBED_BACKOFF_MAX)
+    # Full jitter so parallel batches don't retry in lockstep
+    return random.uniform(0, delay)
+
+
+async def _embed_batch(client: httpx.AsyncClient, url: str, headers: Dict[str, str],
+                       texts: Sequence[str], indices: List[int],
+                       results: List[Optional[List[float]]],
+                       semaphore: asyncio.Semaphore):
+    """Embeds one batch, retrying only the items that did not come back"""
+    pending = list(indices)
+    attempt = 0
+
+    while pending:
+        retry_after = None
+        halves = None
+        async with semaphore:
+            t0 = time.perf_counter()
+            call = start_span("embedding_api.request", kind=KIND_CLIENT, inputs=len(pending), attempt=attempt)
+            try:
+                payload = {"input": [texts[i] for i in pending], "encoding_format": "float"}
+                res = await client.post(url, json=payload, headers=headers, timeout=EMBED_TIMEOUT)
+            except httpx.TransportError as e:
+                print(f"Embedding batch of {len(pending)} failed (transport): {e}")
+                res = None
+            outcome = "error" if res is None or res.status_code >= 400 else "ok"
+            EMBED_API_LATENCY.labels(outcome=outcome).observe(time.perf_counter() - t0)
+            call.end(error=None if outcome == "ok" else f"HTTP {res.status_code}" if res is not None else "transport error")
+
+            if res is not None and res.status_code < 400:
+                try:
+                    data = res.json().get("data", [])
+                except ValueError:
+                    data = []
+                # Providers return one entry per input; "index" points back into the batch
+                for pos, item in enumerate(data):
+                    idx = item.get("index", pos)
+                    vector = item.get("embedding")
+                    if vector and 0 <= idx < len(pending):
+                        results[pending[idx]] = vector
+                pending = [i for i in pending if results[i] is None]
+                if not pending:
+                    return
+                print(f"Embedding batch returned incomplete data, retrying {len(pending)} items")
+            elif res is not None and res.status_code in BISECT_STATUS:
+                # Rejected input (e.g. one oversized text): bisect to isolate the bad items
+                if len(pending) == 1:
+                    print(f"Embedding failed for chunk {pending[0]}: {res.status_code} {res.text[:200]}")
+                    return
+                mid = len(pending) // 2
+                halves = [pending[:mid], pending[mid:]]
+            elif res is not None and res.status_code not in RETRYABLE_STATUS:
+                print(f"Embedding batch of {len(pending)} failed: {res.status_code} {res.text[:200]}")
+                return
+            else:
+                if res is not None:
+                    retry_after = res.headers.get("retry-after")
+                    print(f"Embedding batch of {len(pending)} got {res.status_code}, backing off")
+
+        if halves:
+            # Semaphore is released before recursing so the halves can run
+            await asyncio.gather(*(_embed_batch(client, url, headers, texts, h, results, semaphore) for h in halves))
+            return
+
+        attempt += 1
+        if attempt > EMBED_MAX_RETRIES:
+            print(f"Giving up on {len(pending)} chunks after {EMBED_MAX_RETRIES} retries")
+            return
+        await asyncio.sleep(_backoff_delay(attempt, retry_after))
+
+
+async def embed_texts(client: httpx.AsyncClient, url: str, headers: Dict[str, str],
+                      texts: Sequence[str], batch_size: int = EMBED_BATCH_SIZE,
+                      max_tokens: int = EMBED_BATCH_MAX_TOKENS,
+                      concurrency: int = EMBED_CONCURRENCY) -> List[Optional[List[float]]]:
+    """Embeds all texts using multi-input requests with bounded concurrency.
+
+    Returns vectors in input order; entries stay None when an item could not be embedded.
+    """
+    results: List[Optional[List[float]]] = [None] * len(texts)
+    if not texts:
+        return results
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    batches = pack_batches(texts, max_items=batch_size, max_tokens=max_tokens)
+    await asyncio.gather(*(_embed_batch(client, url, headers, texts, b, results, semaphore) for b in batches))
+    return results
@@ -0,0 +1,212 @@
+import os
+import gzip
+import json
+import bisect
+import asyncio
+import hashlib
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from tracing import span
+
+# Shared by document-chunking (writer) and embeddings-engine (reader): keep both copies identical
+
+# --- Configuration ---
+# Chunks per gzip member; a block is the smallest unit a reader downloads
+CHUNK_BLOCK_SIZE = int(os.getenv("CHUNK_BLOCK_SIZE", "32"))
+# Upper bound of one ranged GET when reading consecutive blocks
+CHUNK_RANGE_BYTES = int(os.getenv("CHUNK_RANGE_BYTES", str(512 * 1024)))
+# Unwanted bytes between two wanted blocks that are read anyway to save a request;
+# at ~200 Mbit/s this is cheaper than the latency of one more GET
+CHUNK_RANGE_GAP_BYTES = int(os.getenv("CHUNK_RANGE_GAP_BYTES", str(256 * 1024)))
+# Ranged GETs in flight ahead of the one being consumed
+CHUNK_PREFETCH = int(os.getenv("CHUNK_PREFETCH", "2"))
+
+FORMAT_VERSION = 1
+STREAM_SUFFIX = ".ndjson.gz"
+INDEX_SUFFIX = ".index.json.gz"
+
+
+@dataclass
+class ChunkRecord:
+    position: int
+    text: str
+    page: Optional[int] = None   # 1-based page the chunk starts on (PDF only)
+    start: Optional[int] = None  # character span in the extracted document text
+    end: Optional[int] = None
+
+    def metadata(self) -> Dict[str, int]:
+        """Payload fields for the vector store"""
+        fields = {"page": self.page, "char_start": self.start, "char_end": self.end}
+        return {k: v for k, v in fields.items() if v is not None}
+
+
+def chunk_hash(text: str) -> str:
+    # Same as manifest.chunk_hash in the embeddings-engine: the index is diffed against manifests
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def stream_key(document_id: str) -> str:
+    return f"chunks/{document_id}{STREAM_SUFFIX}"
+
+
+def legacy_key(document_id: str) -> str:
+    return f"chunks/{document_id}.json"
+
+
+def is_stream_key(key: str) -> bool:
+    return key.endswith(STREAM_SUFFIX)
+
+
+def index_key(key: str) -> str:
+    return key[:-len(STREAM_SUFFIX)] + INDEX_SUFFIX
+
+
+# --- Writer ---
+
+def encode_chunk_file(records: Sequence[ChunkRecord], document_id: str, filename: str, created_at: str,
+                      block_size: int = CHUNK_BLOCK_SIZE) -> Tuple[bytes, Dict[str, Any]]:
+    """Returns (data, index) for a streamed chunk file.
+
+    The data object is gzip-compressed NDJSON, one JSON object per chunk, cut
+    into blocks that are each a complete gzip member. The whole object is still
+    one valid .gz file, and any run of consecutive blocks can be downloaded
+    with a ranged GET and decompressed on its own. The index (a separate, small
+    gzipped JSON object) holds the byte range of every block and the hash, page and
+    character span of every chunk.
+    """
+    members: List[bytes] = []
+    blocks: List[Dict[str, int]] = []
+    offset = 0
+    for first in range(0, len(records), max(1, block_size)):
+        block = records[first:first + block_size]
+        lines = "".join(json.dumps({"i": first + n, "text": r.text, **r.metadata()}, ensure_ascii=False) + "\n"
+                        for n, r in enumerate(block))
+        member = gzip.compress(lines.encode("utf-8"), compresslevel=6, mtime=0)
+        blocks.append({"offset": offset, "length": len(member), "first": first, "count": len(block)})
+        members.append(member)
+        offset += len(member)
+
+    index = {
+        "version": FORMAT_VERSION,
+        "document_id": document_id,
+        "filename": filename,
+        "created_at": created_at,
+        "total_chunks": len(records),
+        "chunks": [{"hash": chunk_hash(r.text), **r.metadata()} for r in records],
+        "blocks": blocks,
+    }
+    return b"".join(members), index
+
+
+def encode_index(index: Dict[str, Any]) -> bytes:
+    return gzip.compress(json.dumps(index).encode("utf-8"), mtime=0)
+
+
+# --- Reader ---
+
+def plan_ranges(blocks: Sequence[Dict[str, int]], wanted: Sequence[int], max_bytes: int = CHUNK_RANGE_BYTES,
+                max_gap: int = CHUNK_RANGE_GAP_BYTES) -> List[Tuple[int, int]]:
+    """Groups wanted block numbers into (first_block, last_block) runs, one ranged GET each.
+
+    A run may span unwanted blocks of up to `max_gap` bytes. The first run is
+    a single block, so the first chunks are available without waiting for a
+    large download.
+    """
+    runs: List[Tuple[int, int]] = []
+    for b in sorted(set(wanted)):
+        if len(runs) > 1:
+            first, last = runs[-1]
+            gap = blocks[b]["offset"] - (blocks[last]["offset"] + blocks[last]["length"])
+            if gap <= max_gap and blocks[b]["offset"] + blocks[b]["length"] - blocks[first]["offset"] <= max_bytes:
+                runs[-1] = (first, b)
+                continue
+        runs.append((b, b))
+    return runs
+
+
+class ChunkFile:
+    """A chunk file in S3, streamed (.ndjson.gz + index) or legacy JSON.
+
+    `open` reads only what is needed to diff the document: the index, or the
+    whole object for legacy files. `iter_records` then yields the wanted
+    chunks in file order as their blocks arrive, fetching the next range while
+    the caller works on the current one (up to CHUNK_PREFETCH ranges ahead).
+    """
+
+    def __init__(self, client, bucket: str, key: str):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.streamed = is_stream_key(key)
+        self.document_id: Optional[str] = None
+        self.hashes: List[str] = []
+        self.stats = {"requests": 0, "bytes": 0}
+        self._index: Optional[Dict[str, Any]] = None
+        self._records: List[ChunkRecord] = []
+
+    def _get(self, key: str, byte_range: Optional[Tuple[int, int]] = None) -> bytes:
+        params = {"Bucket": self.bucket, "Key": key}
+        if byte_range:
+            params["Range"] = f"bytes={byte_range[0]}-{byte_range[1] - 1}"
+        # Unlike the s3.GetObject span of the client hooks, this one includes reading the body
+        with span("s3.read", ranged=byte_range is not None) as read:
+            data = self.client.get_object(**params)["Body"].read()
+            read.attributes["bytes"] = len(data)
+        self.stats["requests"] += 1
+        self.stats["bytes"] += len(data)
+        return data
+
+    async def open(self) -> "ChunkFile":
+        if self.streamed:
+            self._index = json.loads(gzip.decompress(await asyncio.to_thread(self._get, index_key(self.key))))
+            self.document_id = self._index.get("document_id")
+            self.hashes = [c["hash"] for c in self._index["chunks"]]
+        else:
+            data = json.loads(await asyncio.to_thread(self._get, self.key))
+            self.document_id = data.get("document_id")
+            self._records = [ChunkRecord(i, text) for i, text in enumerate(data.get("chunks", []))]
+            self.hashes = [chunk_hash(r.text) for r in self._records]
+        return self
+
+    async def iter_records(self, positions: Sequence[int],
+                           max_bytes: int = CHUNK_RANGE_BYTES) -> AsyncIterator[List[ChunkRecord]]:
+        wanted = set(positions)
+        if not self.streamed:
+            if wanted:
+                yield [r for r in self._records if r.position in wanted]
+            return
+
+        blocks = self._index["blocks"]
+        firsts = [b["first"] for b in blocks]
+        runs = plan_ranges(blocks, [bisect.bisect_right(firsts, p) - 1 for p in wanted], max_bytes)
+        if not runs:
+            return
+
+        def fetch(run: Tuple[int, int]) -> bytes:
+            first, last = blocks[run[0]], blocks[run[1]]
+            return self._get(self.key, (first["offset"], last["offset"] + last["length"]))
+
+        pending = deque(asyncio.create_task(asyncio.to_thread(fetch, run)) for run in runs[:1 + CHUNK_PREFETCH])
+        queued = len(pending)
+        try:
+            while pending:
+                data = await pending.popleft()
+                if queued < len(runs):
+                    pending.append(asyncio.create_task(asyncio.to_thread(fetch, runs[queued])))
+                    queued += 1
+                # Consecutive gzip members decompress as one stream. Split on "\n" only:
+                # json.dumps escapes it, but not other characters splitlines() breaks on
+                records = []
+                for line in gzip.decompress(data).decode("utf-8").split("\n"):
+                    if not line:
+                        continue
+                    item = json.loads(line)
+                    if item["i"] in wanted:
+                        records.append(ChunkRecord(item["i"], item["text"], item.get("page"),
+                                                   item.get("char_start"), item.get("char_end")))
+                yield records
+        finally:
+            for task in pending:
+                task.cancel()
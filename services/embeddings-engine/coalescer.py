@@ -0,0 +1,133 @@
+import os
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from prometheus_client import Histogram
+
+# --- Configuration ---
+EMBED_COALESCE_ENABLED = os.getenv("EMBED_COALESCE_ENABLED", "true").lower() == "true"
+# How long the first /embed call of a batch waits for others to join it
+EMBED_COALESCE_WINDOW_MS = float(os.getenv("EMBED_COALESCE_WINDOW_MS", "5"))
+# A batch is sent as soon as it holds this many texts
+EMBED_COALESCE_MAX_BATCH = int(os.getenv("EMBED_COALESCE_MAX_BATCH", "64"))
+# Upstream requests in flight; while all are busy, new calls keep filling the next batch
+EMBED_COALESCE_CONCURRENCY = int(os.getenv("EMBED_COALESCE_CONCURRENCY", "4"))
+
+# --- Metrics ---
+COALESCE_BATCH = Histogram(
+    "embedding_coalesce_batch_size",
+    "Texts per upstream request made for coalesced /embed calls",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+COALESCE_WAIT = Histogram(
+    "embedding_coalesce_queue_seconds",
+    "Time an /embed call waited before its batch was sent upstream",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+
+EmbedFn = Callable[[Sequence[str]], Awaitable[List[Optional[List[float]]]]]
+
+
+@dataclass
+class _Call:
+    text: str
+    queued_at: float
+    future: asyncio.Future
+
+
+class EmbedCoalescer:
+    """Merges single-text embedding calls that arrive close together into one upstream request.
+
+    Calls are queued; the worker sends a batch when it holds `max_batch`
+    texts or the first call has waited `window_ms`. Identical texts in a batch
+    are embedded once. `embed_fn` returns vectors in input order, None for
+    texts that could not be embedded.
+    """
+
+    def __init__(self, embed_fn: EmbedFn, window_ms: float = EMBED_COALESCE_WINDOW_MS,
+                 max_batch: int = EMBED_COALESCE_MAX_BATCH, concurrency: int = EMBED_COALESCE_CONCURRENCY):
+        self.embed_fn = embed_fn
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._task: Optional[asyncio.Task] = None
+        self._batches: set = set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await asyncio.gather(*self._batches, return_exceptions=True)
+
+    async def embed(self, text: str) -> List[float]:
+        """Raises RuntimeError when the text could not be embedded"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Call(text, time.perf_counter(), future))
+        return await future
+
+    async def _next_batch(self) -> List[_Call]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        send_at = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = send_at - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Callers that went away (client disconnect) are not embedded
+        return [c for c in batch if not c.future.done()]
+
+    async def _run(self):
+        while True:
+            # Wait for a free upstream slot first, so calls pile up into a bigger batch meanwhile
+            await self._slots.acquire()
+            try:
+                batch = await self._next_batch()
+            except BaseException:
+                self._slots.release()
+                raise
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._send(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _send(self, batch: List[_Call]):
+        try:
+            now = time.perf_counter()
+            for call in batch:
+                COALESCE_WAIT.observe(now - call.queued_at)
+            by_text: Dict[str, List[_Call]] = {}
+            for call in batch:
+                by_text.setdefault(call.text, []).append(call)
+            texts = list(by_text)
+            COALESCE_BATCH.observe(len(texts))
+
+            try:
+                vectors = await self.embed_fn(texts)
+            except Exception as e:
+                print(f"Coalesced embedding batch of {len(texts)} failed: {e}")
+                vectors = [None] * len(texts)
+            for text, vector in zip(texts, vectors):
+                for call in by_text[text]:
+                    if call.future.done():
+                        continue
+                    if vector is None:
+                        call.future.set_exception(RuntimeError("embedding API returned no vector"))
+                    else:
+                        call.future.set_result(vector)
+        finally:
+            self._slots.release()
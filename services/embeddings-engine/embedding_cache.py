@@ -0,0 +1,215 @@
+import os
+import time
+import sqlite3
+import hashlib
+import asyncio
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+import numpy as np
+from prometheus_client import Counter, Gauge
+
+# --- Configuration ---
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "10000"))
+# Empty path disables the persistent tier
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "/tmp/embedding-cache.sqlite3")
+EMBED_CACHE_DISK_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_DISK_MAX_ENTRIES", "500000"))
+EMBED_CACHE_TTL_SECONDS = int(os.getenv("EMBED_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+# --- Metrics ---
+CACHE_HITS = Counter("embedding_cache_hits_total", "Embedding cache hits", ["tier"])
+CACHE_MISSES = Counter("embedding_cache_misses_total", "Embedding cache misses (API calls needed)")
+CACHE_EVICTIONS = Counter("embedding_cache_evictions_total", "Embedding cache evictions", ["tier", "reason"])
+CACHE_ENTRIES = Gauge("embedding_cache_entries", "Entries currently held per cache tier", ["tier"])
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes unicode and whitespace so trivially different inputs share a key"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache: in-process LRU in front of a SQLite file.
+
+    Vectors are stored as float32; entries older than `ttl` are treated as misses
+    and removed. Both tiers are bounded by entry count.
+    """
+
+    def __init__(self, model: str, max_entries: int = EMBED_CACHE_MAX_ENTRIES,
+                 path: str = EMBED_CACHE_PATH, disk_max_entries: int = EMBED_CACHE_DISK_MAX_ENTRIES,
+                 ttl: int = EMBED_CACHE_TTL_SECONDS):
+        self.model = model
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self.ttl = ttl
+
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._writes_since_prune = 0
+
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute("""
+                    CREATE TABLE IF NOT EXISTS embedding_cache (
+                        key TEXT PRIMARY KEY,
+                        vector BLOB NOT NULL,
+                        created_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                """)
+                self._db.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON embedding_cache (accessed_at)")
+                self._db.commit()
+                print(f"Embedding cache persistent tier at {path}")
+            except Exception as e:
+                print(f"Embedding cache SQLite init failed, using memory only: {e}")
+                self._db = None
+
+    # --- Memory tier ---
+
+    def _lru_get(self, key: str) -> Optional[np.ndarray]:
+        entry = self._lru.get(key)
+        if entry is None:
+            return None
+        vector, created_at = entry
+        if time.time() - created_at > self.ttl:
+            del self._lru[key]
+            CACHE_EVICTIONS.labels(tier="memory", reason="ttl").inc()
+            return None
+        self._lru.move_to_end(key)
+        return vector
+
+    def _lru_put(self, key: str, vector: np.ndarray, created_at: float):
+        self._lru[key] = (vector, created_at)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+            CACHE_EVICTIONS.labels(tier="memory", reason="size").inc()
+        CACHE_ENTRIES.labels(tier="memory").set(len(self._lru))
+
+    # --- Persistent tier (called from worker threads) ---
+
+    def _disk_get_many(self, keys: List[str]) -> dict:
+        if not self._db or not keys:
+            return {}
+        now = time.time()
+        found = {}
+        expired = []
+        with self._db_lock:
+            # SQLite limits bound parameters, so look keys up in slices
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector, created_at FROM embedding_cache WHERE key IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                for key, blob, created_at in rows:
+                    if now - created_at > self.ttl:
+                        expired.append(key)
+                    else:
+                        found[key] = (np.frombuffer(blob, dtype=np.float32), created_at)
+            if found:
+                self._db.executemany("UPDATE embedding_cache SET accessed_at = ? WHERE key = ?",
+                                     [(now, k) for k in found])
+            if expired:
+                self._db.executemany("DELETE FROM embedding_cache WHERE key = ?", [(k,) for k in expired])
+                CACHE_EVICTIONS.labels(tier="disk", reason="ttl").inc(len(expired))
+            self._db.commit()
+        return found
+
+    def _disk_put_many(self, items: List[tuple]):
+        if not self._db or not items:
+            return
+        now = time.time()
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (key, vector, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(key, vector.tobytes(), now, now) for key, vector in items],
+            )
+            self._db.commit()
+            self._writes_since_prune += len(items)
+            if self._writes_since_prune >= 1000:
+                self._writes_since_prune = 0
+                self._prune()
+
+    def _prune(self):
+        """Drops expired rows, then least recently used rows above the size bound"""
+        cur = self._db.execute("DELETE FROM embedding_cache WHERE created_at < ?", (time.time() - self.ttl,))
+        if cur.rowcount > 0:
+            CACHE_EVICTIONS.labels(tier="disk", reason="ttl").inc(cur.rowcount)
+        total = self._db.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        excess = total - self.disk_max_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM embedding_cache WHERE key IN "
+                "(SELECT key FROM embedding_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (excess,),
+            )
+            CACHE_EVICTIONS.labels(tier="disk", reason="size").inc(excess)
+            total -= excess
+        self._db.commit()
+        CACHE_ENTRIES.labels(tier="disk").set(total)
+
+    # --- Public API ---
+
+    async def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Returns cached vectors in input order, None where the text is not cached"""
+        keys = [cache_key(t, self.model) for t in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        missing = {}
+        for i, key in enumerate(keys):
+            vector = self._lru_get(key)
+            if vector is not None:
+                results[i] = vector.tolist()
+                CACHE_HITS.labels(tier="memory").inc()
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing and self._db:
+            try:
+                found = await asyncio.to_thread(self._disk_get_many, list(missing))
+            except Exception as e:
+                print(f"Embedding cache lookup failed: {e}")
+                found = {}
+            for key, (vector, created_at) in found.items():
+                self._lru_put(key, vector, created_at)
+                for i in missing.pop(key):
+                    results[i] = vector.tolist()
+                    CACHE_HITS.labels(tier="disk").inc()
+
+        CACHE_MISSES.inc(sum(len(idx) for idx in missing.values()))
+        return results
+
+    async def get(self, text: str) -> Optional[List[float]]:
+        return (await self.get_many([text]))[0]
+
+    async def put_many(self, texts: Sequence[str], vectors: Sequence[Optional[List[float]]]):
+        now = time.time()
+        items = []
+        for text, vector in zip(texts, vectors):
+            if vector is None:
+                continue
+            key = cache_key(text, self.model)
+            arr = np.asarray(vector, dtype=np.float32)
+            self._lru_put(key, arr, now)
+            items.append((key, arr))
+
+        if items and self._db:
+            try:
+                await asyncio.to_thread(self._disk_put_many, items)
+            except Exception as e:
+                print(f"Embedding cache write failed: {e}")
+
+    async def put(self, text: str, vector: List[float]):
+        await self.put_many([text], [vector])
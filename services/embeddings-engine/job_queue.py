@@ -0,0 +1,415 @@
+import os
+import time
+import uuid
+import random
+import sqlite3
+import asyncio
+import threading
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from psycopg.rows import dict_row
+from prometheus_client import Counter, Gauge, Histogram
+
+from pools import pg_connection
+from tracing import KIND_INTERNAL, parse_traceparent, span
+
+# --- Configuration ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2.0"))
+# A running job whose lease expires (pod died) is picked up again by another worker
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "10"))
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "600"))
+# Only used when Postgres is not configured; a local file is not shared between replicas
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "/tmp/embedding-jobs.sqlite3")
+
+JOB_STATUSES = ("queued", "running", "completed", "dead_letter")
+
+# --- Metrics ---
+JOBS_TOTAL = Counter("ingest_job_attempts_total", "Ingestion job attempts by outcome", ["outcome"])
+JOB_DURATION = Histogram(
+    "ingest_job_duration_seconds",
+    "Duration of one ingestion job attempt",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+)
+JOBS_BY_STATUS = Gauge("ingest_jobs", "Ingestion jobs per status", ["status"])
+
+# Columns added after the table was first created; init() adds them to existing tables
+ADDED_COLUMNS = ("chunks_unchanged", "chunks_removed")
+# Trace context of the request that queued the job, so its processing shows up in the same trace
+ADDED_TEXT_COLUMNS = ("traceparent", "request_id")
+
+JOB_COLUMNS = (
+    "id, s3_bucket, s3_key, status, attempts, max_attempts, chunks_total, chunks_embedded, "
+    "chunks_written, chunks_failed, chunks_unchanged, chunks_removed, error, traceparent, request_id, "
+    "created_at, updated_at"
+)
+
+
+def _iso(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        value = datetime.fromtimestamp(value, tz=timezone.utc)
+    return value.isoformat()
+
+
+def _job(row) -> Dict[str, Any]:
+    job = dict(row)
+    job["id"] = str(job["id"])
+    job["created_at"] = _iso(job["created_at"])
+    job["updated_at"] = _iso(job["updated_at"])
+    return job
+
+
+class PostgresJobStore:
+    """Job table in the shared vector database; replicas claim with SKIP LOCKED"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def init(self):
+        async with pg_connection(self.pool) as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS ingest_jobs (
+                    id UUID PRIMARY KEY,
+                    s3_bucket TEXT NOT NULL,
+                    s3_key TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INT NOT NULL DEFAULT 0,
+                    max_attempts INT NOT NULL,
+                    chunks_total INT,
+                    chunks_embedded INT NOT NULL DEFAULT 0,
+                    chunks_written INT NOT NULL DEFAULT 0,
+                    chunks_failed INT NOT NULL DEFAULT 0,
+                    chunks_unchanged INT NOT NULL DEFAULT 0,
+                    chunks_removed INT NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    available_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    locked_until TIMESTAMPTZ
+                );
+            """)
+            for column in ADDED_COLUMNS:
+                await conn.execute(f"ALTER TABLE ingest_jobs ADD COLUMN IF NOT EXISTS {column} INT NOT NULL DEFAULT 0")
+            for column in ADDED_TEXT_COLUMNS:
+                await conn.execute(f"ALTER TABLE ingest_jobs ADD COLUMN IF NOT EXISTS {column} TEXT")
+            await conn.execute("""
+                CREATE INDEX IF NOT EXISTS ingest_jobs_pending
+                ON ingest_jobs (available_at) WHERE status IN ('queued', 'running');
+            """)
+
+    async def _fetch(self, sql: str, params=()) -> List[Dict[str, Any]]:
+        async with pg_connection(self.pool) as conn:
+            async with conn.cursor(row_factory=dict_row) as cur:
+                await cur.execute(sql, params)
+                rows = await cur.fetchall() if cur.description else []
+        return [_job(r) for r in rows]
+
+    async def enqueue(self, s3_bucket: str, s3_key: str, max_attempts: int,
+                      traceparent: Optional[str] = None, request_id: Optional[str] = None) -> Dict[str, Any]:
+        rows = await self._fetch(
+            "INSERT INTO ingest_jobs (id, s3_bucket, s3_key, max_attempts, traceparent, request_id) "
+            f"VALUES (%s, %s, %s, %s, %s, %s) RETURNING {JOB_COLUMNS}",
+            (uuid.uuid4(), s3_bucket, s3_key, max_attempts, traceparent, request_id),
+        )
+        return rows[0]
+
+    async def claim(self, lease_seconds: int) -> Optional[Dict[str, Any]]:
+        rows = await self._fetch(f"""
+            UPDATE ingest_jobs
+            SET status = 'running', attempts = attempts + 1, updated_at = now(),
+                locked_until = now() + make_interval(secs => %s)
+            WHERE id = (
+                SELECT id FROM ingest_jobs
+                WHERE (status = 'queued' AND available_at <= now())
+                   OR (status = 'running' AND locked_until < now())
+                ORDER BY available_at
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {JOB_COLUMNS}
+        """, (lease_seconds,))
+        return rows[0] if rows else None
+
+    async def progress(self, job_id: str, lease_seconds: int, **counts: int):
+        sets = ", ".join(f"{name} = %s" for name in counts)
+        await self._fetch(
+            f"UPDATE ingest_jobs SET {sets}, updated_at = now(), "
+            f"locked_until = now() + make_interval(secs => %s) WHERE id = %s",
+            (*counts.values(), lease_seconds, job_id),
+        )
+
+    async def finish(self, job_id: str, status: str, error: Optional[str] = None, retry_delay: float = 0.0,
+                     attempts_delta: int = 0):
+        await self._fetch(
+            "UPDATE ingest_jobs SET status = %s, error = %s, attempts = attempts + %s, locked_until = NULL, "
+            "updated_at = now(), available_at = now() + make_interval(secs => %s) WHERE id = %s",
+            (status, error, attempts_delta, retry_delay, job_id),
+        )
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            uuid.UUID(job_id)
+        except ValueError:
+            return None
+        rows = await self._fetch(f"SELECT {JOB_COLUMNS} FROM ingest_jobs WHERE id = %s", (job_id,))
+        return rows[0] if rows else None
+
+    async def list(self, status: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        if status:
+            return await self._fetch(
+                f"SELECT {JOB_COLUMNS} FROM ingest_jobs WHERE status = %s ORDER BY created_at DESC LIMIT %s",
+                (status, limit),
+            )
+        return await self._fetch(f"SELECT {JOB_COLUMNS} FROM ingest_jobs ORDER BY created_at DESC LIMIT %s", (limit,))
+
+    async def counts(self) -> Dict[str, int]:
+        async with pg_connection(self.pool) as conn:
+            cur = await conn.execute("SELECT status, count(*) FROM ingest_jobs GROUP BY status")
+            return {status: n for status, n in await cur.fetchall()}
+
+
+class SQLiteJobStore:
+    """Single-replica fallback for local runs without Postgres"""
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        print(f"Job queue using local SQLite file {path} (not shared between replicas)")
+
+    def _run(self, sql: str, params=()) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+            self._db.commit()
+        return [_job(r) for r in rows]
+
+    async def _exec(self, sql: str, params=()) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._run, sql, params)
+
+    async def init(self):
+        def create():
+            with self._lock:
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("""
+                    CREATE TABLE IF NOT EXISTS ingest_jobs (
+                        id TEXT PRIMARY KEY,
+                        s3_bucket TEXT NOT NULL,
+                        s3_key TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'queued',
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        max_attempts INTEGER NOT NULL,
+                        chunks_total INTEGER,
+                        chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                        chunks_written INTEGER NOT NULL DEFAULT 0,
+                        chunks_failed INTEGER NOT NULL DEFAULT 0,
+                        chunks_unchanged INTEGER NOT NULL DEFAULT 0,
+                        chunks_removed INTEGER NOT NULL DEFAULT 0,
+                        error TEXT,
+                        created_at REAL NOT NULL,
+                        updated_at REAL NOT NULL,
+                        available_at REAL NOT NULL,
+                        locked_until REAL
+                    )
+                """)
+                existing = {row[1] for row in self._db.execute("PRAGMA table_info(ingest_jobs)")}
+                for column in ADDED_COLUMNS:
+                    if column not in existing:
+                        self._db.execute(f"ALTER TABLE ingest_jobs ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+                for column in ADDED_TEXT_COLUMNS:
+                    if column not in existing:
+                        self._db.execute(f"ALTER TABLE ingest_jobs ADD COLUMN {column} TEXT")
+                self._db.execute("CREATE INDEX IF NOT EXISTS ingest_jobs_pending ON ingest_jobs (status, available_at)")
+                self._db.commit()
+        await asyncio.to_thread(create)
+
+    async def enqueue(self, s3_bucket: str, s3_key: str, max_attempts: int,
+                      traceparent: Optional[str] = None, request_id: Optional[str] = None) -> Dict[str, Any]:
+        now = time.time()
+        rows = await self._exec(
+            "INSERT INTO ingest_jobs (id, s3_bucket, s3_key, max_attempts, traceparent, request_id, "
+            f"created_at, updated_at, available_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) RETURNING {JOB_COLUMNS}",
+            (str(uuid.uuid4()), s3_bucket, s3_key, max_attempts, traceparent, request_id, now, now, now),
+        )
+        return rows[0]
+
+    async def claim(self, lease_seconds: int) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        rows = await self._exec(f"""
+            UPDATE ingest_jobs
+            SET status = 'running', attempts = attempts + 1, updated_at = ?, locked_until = ?
+            WHERE id = (
+                SELECT id FROM ingest_jobs
+                WHERE (status = 'queued' AND available_at <= ?)
+                   OR (status = 'running' AND locked_until < ?)
+                ORDER BY available_at
+                LIMIT 1
+            )
+            RETURNING {JOB_COLUMNS}
+        """, (now, now + lease_seconds, now, now))
+        return rows[0] if rows else None
+
+    async def progress(self, job_id: str, lease_seconds: int, **counts: int):
+        now = time.time()
+        sets = ", ".join(f"{name} = ?" for name in counts)
+        await self._exec(
+            f"UPDATE ingest_jobs SET {sets}, updated_at = ?, locked_until = ? WHERE id = ?",
+            (*counts.values(), now, now + lease_seconds, job_id),
+        )
+
+    async def finish(self, job_id: str, status: str, error: Optional[str] = None, retry_delay: float = 0.0,
+                     attempts_delta: int = 0):
+        now = time.time()
+        await self._exec(
+            "UPDATE ingest_jobs SET status = ?, error = ?, attempts = attempts + ?, locked_until = NULL, "
+            "updated_at = ?, available_at = ? WHERE id = ?",
+            (status, error, attempts_delta, now, now + retry_delay, job_id),
+        )
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = await self._exec(f"SELECT {JOB_COLUMNS} FROM ingest_jobs WHERE id = ?", (job_id,))
+        return rows[0] if rows else None
+
+    async def list(self, status: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        if status:
+            return await self._exec(
+                f"SELECT {JOB_COLUMNS} FROM ingest_jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?",
+                (status, limit),
+            )
+        return await self._exec(f"SELECT {JOB_COLUMNS} FROM ingest_jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+
+    async def counts(self) -> Dict[str, int]:
+        def count():
+            with self._lock:
+                return dict(self._db.execute("SELECT status, count(*) FROM ingest_jobs GROUP BY status").fetchall())
+        return await asyncio.to_thread(count)
+
+
+def create_job_store(pg_pool):
+    if pg_pool:
+        return PostgresJobStore(pg_pool)
+    return SQLiteJobStore(JOB_QUEUE_PATH)
+
+
+# handler(job, report) -> result counts; report(**counts) records progress
+ProgressReporter = Callable[..., Awaitable[None]]
+JobHandler = Callable[[Dict[str, Any], ProgressReporter], Awaitable[Dict[str, int]]]
+
+
+class JobWorker:
+    """Pulls ingestion jobs from the store with bounded concurrency.
+
+    Failed attempts are retried with exponential backoff; after `max_attempts`
+    the job moves to the dead-letter status where it stays until it is
+    requeued by hand. Jobs interrupted by a shutdown go back to the queue
+    without using up an attempt. A job whose status could not be recorded
+    stays leased and is retried after the lease expires.
+    """
+
+    def __init__(self, store, handler: JobHandler, workers: int = JOB_WORKERS,
+                 poll_interval: float = JOB_POLL_INTERVAL, lease_seconds: int = JOB_LEASE_SECONDS):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._report_depth()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wakes idle workers after a local enqueue instead of waiting for the next poll"""
+        self._wakeup.set()
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self.store.claim(self.lease_seconds)
+            except Exception as e:
+                print(f"ERROR: Claiming job failed: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(job)
+            except Exception as e:
+                # Bookkeeping failed (e.g. the store went away); the job stays
+                # processing and is picked up again once its lease expires
+                print(f"ERROR: Job {job['id']} could not be processed: {type(e).__name__}: {e}")
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        if job["attempts"] > job["max_attempts"]:
+            # Lease expired on the last attempt (the worker died mid-job)
+            await self.store.finish(job_id, "dead_letter", error=job["error"] or "lease expired")
+            JOBS_TOTAL.labels(outcome="dead_letter").inc()
+            return
+
+        # Continues the trace of the request that queued the job
+        parent = parse_traceparent(job["traceparent"], job["request_id"])
+        with span("job.ingest", parent, KIND_INTERNAL, job_id=job_id, attempt=job["attempts"],
+                  s3_key=job["s3_key"]) as job_span:
+            await self._attempt(job, job_span)
+
+    async def _attempt(self, job: Dict[str, Any], job_span):
+        job_id = job["id"]
+
+        async def report(**counts: int):
+            await self.store.progress(job_id, self.lease_seconds, **counts)
+
+        t0 = time.perf_counter()
+        try:
+            result = await self.handler(job, report)
+        except asyncio.CancelledError:
+            # Shutdown: hand the job back without counting the attempt
+            await asyncio.shield(self.store.finish(job_id, "queued", error=job["error"], attempts_delta=-1))
+            raise
+        except Exception as e:
+            JOB_DURATION.observe(time.perf_counter() - t0)
+            error = f"{type(e).__name__}: {e}"
+            job_span.error = error
+            if job["attempts"] >= job["max_attempts"]:
+                await self.store.finish(job_id, "dead_letter", error=error)
+                JOBS_TOTAL.labels(outcome="dead_letter").inc()
+                print(f"ERROR: Job {job_id} moved to dead letter after {job['attempts']} attempts: {error}")
+            else:
+                delay = min(JOB_RETRY_MAX_DELAY, JOB_RETRY_BASE_DELAY * 2 ** (job["attempts"] - 1))
+                delay *= random.uniform(0.8, 1.2)
+                await self.store.finish(job_id, "queued", error=error, retry_delay=delay)
+                JOBS_TOTAL.labels(outcome="retried").inc()
+                print(f"WARNING: Job {job_id} attempt {job['attempts']} failed, retrying in {delay:.0f}s: {error}")
+            return
+
+        JOB_DURATION.observe(time.perf_counter() - t0)
+        await report(**result)
+        await self.store.finish(job_id, "completed")
+        JOBS_TOTAL.labels(outcome="completed").inc()
+        print(f"Job {job_id} completed: {result}")
+
+    async def _report_depth(self):
+        while True:
+            try:
+                counts = await self.store.counts()
+                for status in JOB_STATUSES:
+                    JOBS_BY_STATUS.labels(status=status).set(counts.get(status, 0))
+            except Exception as e:
+                print(f"WARNING: Job queue depth check failed: {e}")
+            await asyncio.sleep(15)
@@ -1,79 +1,157 @@
 import os
 import httpx
 import boto3
-import json
+from botocore.exceptions import ClientError
+import re
 import uuid
-import psycopg2
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
+import base64
+import asyncio
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
 from qdrant_client import QdrantClient
-from qdrant_client.http import models
+from prometheus_fastapi_instrumentator import Instrumentator
+
+from coalescer import EmbedCoalescer, EMBED_COALESCE_ENABLED
+from write_buffer import VectorWriteBuffer
+from providers import create_provider, EMBEDDING_DIM
+from embedding_cache import EmbeddingCache, EMBED_CACHE_ENABLED
+from pools import create_pg_pool, create_http_client, pg_connection
+from job_queue import JobWorker, create_job_store, JOB_MAX_ATTEMPTS, JOB_STATUSES
+from chunk_format import ChunkFile
+from manifest import diff_chunks, load_manifest, save_manifest, chunk_point_id
+from pg_index import IndexManager, INDEX_TYPES
+from qdrant_profile import (QDRANT_PROFILE_AUTO_MIGRATE, create_collection, describe as describe_collection,
+                            ensure_payload_indexes, migrate as migrate_collection, resolve_profile)
+from tracing import (KIND_INTERNAL, TracingMiddleware, current_request_id, current_traceparent, instrument_boto3, span,
+                     start_tracing, stop_tracing)
+from profiler import profile_response
+from vector_codec import DTYPES, VECTOR_MEDIA_TYPE, SCALE_HEADER, encode_vector, encode_vector_b64, vector_headers
 
 app = FastAPI(title="Embeddings Engine Service")
+app.add_middleware(TracingMiddleware)
 
-# --- Configuration ---
-PORTKEY_API_URL = "https://api.portkey.ai/v1/embeddings"
-PORTKEY_API_KEY = os.getenv("PORTKEY_API_KEY")
+Instrumentator().instrument(app).expose(app)
 
+# --- Configuration ---
 # Qdrant Config
 QDRANT_URL = os.getenv("QDRANT_URL", "http://10.0.11.10:6333")
 QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "faro_docs")
+# Quantization, on-disk storage and HNSW settings (QDRANT_PROFILE, see qdrant_profile.py)
+QDRANT_PROFILE = resolve_profile()
 
 # AWS Config
 AWS_REGION = os.getenv("AWS_REGION", "eu-central-1")
-S3_CLIENT = boto3.client('s3', region_name=AWS_REGION)
+S3_CLIENT = instrument_boto3(boto3.client('s3', region_name=AWS_REGION))
 
 # Postgres Config
 PG_HOST = os.getenv("PG_HOST")
 PG_DB = os.getenv("PG_DB", "vectordb")
 PG_USER = os.getenv("PG_USER", "vectoradmin")
 PG_PASSWORD = os.getenv("PG_PASSWORD")
+# Text search configuration of the lexical `tsv` column; rag-query must use the same one
+PG_TS_CONFIG = os.getenv("PG_TS_CONFIG", "english")
+if not re.fullmatch(r"[a-z_]+", PG_TS_CONFIG):
+    raise ValueError(f"Invalid PG_TS_CONFIG '{PG_TS_CONFIG}'")
+
+# Largest number of texts accepted by /embed/batch
+EMBED_BATCH_MAX_TEXTS = int(os.getenv("EMBED_BATCH_MAX_TEXTS", "2048"))
+# Raw /embed/batch responses: number of vectors in the body
+COUNT_HEADER = "X-Vector-Count"
+
+# Ingestion jobs: progress is written after every slice of this many chunks
+JOB_PROGRESS_CHUNKS = int(os.getenv("JOB_PROGRESS_CHUNKS", "512"))
 
 # Global Client Placeholder
 _qdrant_client = None
 
-def get_postgres_conn():
-    """Establishes connection to PostgreSQL"""
-    try:
-        
-        host = PG_HOST.split(":")[0] if PG_HOST else None
-        
-        conn = psycopg2.connect(
-            host=host,
-            database=PG_DB,
-            user=PG_USER,
-            password=PG_PASSWORD
-        )
-        return conn
-    except Exception as e:
-        print(f"Postgres connection failed: {e}")
-        return None
+# Created at startup, closed at shutdown
+pg_pool = None
+http_client: Optional[httpx.AsyncClient] = None
+job_store = None
+job_worker: Optional[JobWorker] = None
+index_manager: Optional[IndexManager] = None
+coalescer: Optional[EmbedCoalescer] = None
+
+# Remote API or local model (EMBEDDING_PROVIDER); the model is loaded at startup
+provider = create_provider()
+embedding_cache = EmbeddingCache(provider.model_id) if EMBED_CACHE_ENABLED else None
 
-def init_postgres():
+async def init_postgres():
     """Ensures vector extension and table exist"""
-    conn = get_postgres_conn()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-            cur.execute("""
+    if not pg_pool:
+        return
+    try:
+        async with pg_connection(pg_pool) as conn:
+            await conn.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+            await conn.execute(f"""
                 CREATE TABLE IF NOT EXISTS embeddings (
                     id UUID PRIMARY KEY,
-                    vector vector(1024),
+                    vector vector({EMBEDDING_DIM}),
                     text TEXT,
-                    source_file TEXT
+                    source_file TEXT,
+                    -- Lexical leg of hybrid retrieval in rag-query, kept in sync with `text` by Postgres itself
+                    tsv tsvector GENERATED ALWAYS AS (to_tsvector('{PG_TS_CONFIG}', coalesce(text, ''))) STORED
                 );
             """)
-            conn.commit()
-            print("Postgres table initialized")
-            cur.close()
-            conn.close()
-        except Exception as e:
-            print(f"Postgres init failed: {e}")
+            # Tables from before hybrid retrieval lack the column; adding it rewrites the table under an
+            # exclusive lock, so that is a one-time migration run by hand (see the README), not at startup
+            cur = await conn.execute("""
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'embeddings' AND column_name = 'tsv'
+            """)
+            if not await cur.fetchone():
+                print("Warning: embeddings.tsv is missing; lexical searches in rag-query fail until it is migrated")
+            # Bumped after every write or delete of points; rag-query's semantic cache keys answers on it
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS ingest_generation (
+                    collection TEXT PRIMARY KEY,
+                    generation BIGINT NOT NULL,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+            """)
+        print("Postgres table initialized")
+    except Exception as e:
+        print(f"Postgres init failed: {e}")
+        return
+    # Builds the lexical (GIN) index concurrently in the background if it is missing; the vector
+    # index waits until enough rows are loaded, it is built after the bulk load, not before
+    await index_manager.maybe_build()
+
+@app.on_event("startup")
+async def startup():
+    global pg_pool, http_client, job_store, job_worker, index_manager, coalescer
+    start_tracing("embeddings-engine")
+    http_client = create_http_client(timeout=30.0)
+    await provider.start(http_client)
+    if EMBED_COALESCE_ENABLED:
+        coalescer = EmbedCoalescer(provider.embed)
+        coalescer.start()
+    pg_pool = create_pg_pool(PG_HOST, PG_DB, PG_USER, PG_PASSWORD)
+    if pg_pool:
+        await pg_pool.open()
+        index_manager = IndexManager(pg_pool)
+    await init_postgres()
+
+    job_store = create_job_store(pg_pool)
+    await job_store.init()
+    job_worker = JobWorker(job_store, run_ingest_job)
+    job_worker.start()
 
-# Initialize Postgres on startup
-init_postgres()
+@app.on_event("shutdown")
+async def shutdown():
+    if coalescer:
+        await coalescer.stop()
+    if job_worker:
+        await job_worker.stop()
+    if index_manager:
+        await index_manager.stop()
+    await provider.close()
+    if http_client:
+        await http_client.aclose()
+    if pg_pool:
+        await pg_pool.close()
+    stop_tracing()
 
 def get_qdrant_client():
     """Tries to connect to Qdrant. Returns client or None."""
@@ -90,19 +168,24 @@ def get_qdrant_client():
         
         if exists:
              print(f"Connected to existing collection '{QDRANT_COLLECTION}'")
+             sync_collection_profile(client)
         else:
             try:
-                client.create_collection(
-                    collection_name=QDRANT_COLLECTION,
-                    vectors_config=models.VectorParams(size=1024, distance=models.Distance.COSINE),
-                )
-                print(f"Created new collection '{QDRANT_COLLECTION}'")
+                create_collection(client, QDRANT_COLLECTION, EMBEDDING_DIM, QDRANT_PROFILE)
+                print(f"Created new collection '{QDRANT_COLLECTION}' with profile '{QDRANT_PROFILE.name}'")
             except Exception as e:
                 # If another pod created it in the meantime, ignore the error
                 if "already exists" in str(e) or "Conflict" in str(e):
                     print(f"✅ Collection '{QDRANT_COLLECTION}' already exists (race condition handled)")
                 else:
                     raise e
+
+        try:
+            added = ensure_payload_indexes(client, QDRANT_COLLECTION)
+            if added:
+                print(f"Creating payload indexes on {', '.join(added)}")
+        except Exception as e:
+            print(f"Warning: could not create payload indexes: {e}")
         
         _qdrant_client = client
         return _qdrant_client
@@ -110,15 +193,55 @@ def get_qdrant_client():
         print(f"Qdrant connection failed: {e}")
         return None
 
+def sync_collection_profile(client: QdrantClient):
+    """Reports (or, with QDRANT_PROFILE_AUTO_MIGRATE, applies) differences from the configured profile"""
+    try:
+        status = describe_collection(client, QDRANT_COLLECTION, QDRANT_PROFILE, EMBEDDING_DIM)
+        if not status["compatible"]:
+            print(f"Warning: collection '{QDRANT_COLLECTION}' has {status['vector_size']}-dim vectors, "
+                  f"EMBEDDING_DIM is {EMBEDDING_DIM}")
+        if not status["diff"]:
+            return
+        if QDRANT_PROFILE_AUTO_MIGRATE:
+            migrate_collection(client, QDRANT_COLLECTION, QDRANT_PROFILE)
+            print(f"Migrating collection '{QDRANT_COLLECTION}' to profile '{QDRANT_PROFILE.name}': {status['diff']}")
+        else:
+            print(f"Collection '{QDRANT_COLLECTION}' differs from profile '{QDRANT_PROFILE.name}': {status['diff']} "
+                  f"(POST /admin/qdrant-profile to migrate)")
+    except Exception as e:
+        print(f"Warning: could not check the collection profile: {e}")
+
 # --- Models ---
 class EmbeddingRequest(BaseModel):
     text: str
     metadata: Optional[dict] = {}
+    # json = float list; base64 = packed vector in `embedding_b64`.
+    # `Accept: application/octet-stream` returns the packed vector as the raw body instead.
+    encoding: str = Field("json", pattern="^(json|base64)$")
+    dtype: str = Field("float32", pattern=f"^({'|'.join(DTYPES)})$")
 
 class EmbeddingResponse(BaseModel):
-    embedding: List[float]
+    embedding: Optional[List[float]] = None
+    embedding_b64: Optional[str] = None
+    dtype: Optional[str] = None
+    scale: Optional[float] = None  # int8 only: value = int8 * scale
+    dim: Optional[int] = None
     stored_id: Optional[str] = None
 
+class EmbeddingBatchRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1, max_length=EMBED_BATCH_MAX_TEXTS)
+    encoding: str = Field("json", pattern="^(json|base64)$")
+    dtype: str = Field("float32", pattern=f"^({'|'.join(DTYPES)})$")
+
+class EmbeddingBatchResponse(BaseModel):
+    # Vectors in the order of `texts`
+    embeddings: Optional[List[List[float]]] = None
+    embeddings_b64: Optional[List[str]] = None
+    dtype: Optional[str] = None
+    scales: Optional[List[float]] = None  # int8 only, one per vector
+    dim: int
+    count: int
+
 class S3ProcessRequest(BaseModel):
     s3_key: str
     s3_bucket: str
@@ -127,103 +250,354 @@ class ProcessResponse(BaseModel):
     status: str
     chunks_processed: int
     doc_id: str
+    document_id: Optional[str] = None
+    written: Dict[str, int] = {}
+    diff: Dict[str, int] = {}  # added / unchanged / removed chunks
+
+class IndexBuildRequest(BaseModel):
+    type: Optional[str] = None  # hnsw | ivfflat, defaults to PG_INDEX_TYPE
+    m: Optional[int] = Field(None, ge=2, le=100)
+    ef_construction: Optional[int] = Field(None, ge=4, le=1000)
+    lists: Optional[int] = Field(None, ge=1, le=100000)
+    force: bool = False  # rebuild even when the current index already matches
+
+class CollectionProfileRequest(BaseModel):
+    profile: Optional[str] = None  # defaults to QDRANT_PROFILE
+    dry_run: bool = False  # only report what would change
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    s3_bucket: str
+    s3_key: str
+    attempts: int
+    max_attempts: int
+    chunks_total: Optional[int] = None
+    chunks_embedded: int = 0
+    chunks_written: int = 0
+    chunks_failed: int = 0
+    chunks_unchanged: int = 0
+    chunks_removed: int = 0
+    progress: float = 0.0
+    error: Optional[str] = None
+    request_id: Optional[str] = None  # X-Request-ID of the request that queued the job
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+def job_response(job: Dict[str, Any]) -> JobResponse:
+    total = job["chunks_total"]
+    done = job["chunks_embedded"] + job["chunks_unchanged"]
+    progress = done / total if total else (1.0 if job["status"] == "completed" else 0.0)
+    return JobResponse(job_id=job["id"], progress=round(progress, 4), **{k: v for k, v in job.items() if k != "id"})
 
 # --- Endpoints ---
 
 @app.get("/health")
-def health_check():
+async def health_check():
     # Attempt to connect now if we aren't already
     q_client = get_qdrant_client()
-    pg_conn = get_postgres_conn()
-    
-    status = {
+
+    pg_ok = False
+    if pg_pool:
+        try:
+            async with pg_connection(pg_pool, timeout=2.0) as conn:
+                await conn.execute("SELECT 1")
+            pg_ok = True
+        except Exception as e:
+            print(f"Postgres health check failed: {e}")
+
+    return {
         "status": "healthy", 
         "qdrant": "connected" if q_client else "disconnected",
-        "postgres": "connected" if pg_conn else "disconnected"
+        "postgres": "connected" if pg_ok else "disconnected"
     }
-    
-    if pg_conn:
-        pg_conn.close()
-        
-    return status
 
-@app.post("/embed", response_model=EmbeddingResponse)
-async def generate_embedding(request: EmbeddingRequest):
-    headers = {
-        "Content-Type": "application/json",
-        "x-portkey-api-key": PORTKEY_API_KEY
-    }
-    payload = { "input": [request.text], "encoding_format": "float" }
+async def embed_one(text: str) -> List[float]:
+    """Single text; concurrent calls share one upstream request through the coalescer"""
+    if coalescer:
+        return await coalescer.embed(text)
+    vector = (await provider.embed([text]))[0]
+    if vector is None:
+        raise RuntimeError("embedding API returned no vector")
+    return vector
 
-    async with httpx.AsyncClient() as client:
+def embedding_error(e: Exception) -> HTTPException:
+    """Invalid input (ValueError) is the caller's fault; anything else failed upstream"""
+    if isinstance(e, ValueError):
+        return HTTPException(status_code=400, detail=f"Invalid embedding input: {str(e)}")
+    return HTTPException(status_code=502, detail=f"Embedding API Error: {str(e)}")
+
+@app.post("/embed", response_model=EmbeddingResponse, response_model_exclude_none=True)
+async def generate_embedding(request: EmbeddingRequest, http_request: Request):
+    vector = await embedding_cache.get(request.text) if embedding_cache else None
+    if vector is None:
         try:
-            response = await client.post(PORTKEY_API_URL, json=payload, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            vector = response.json()["data"][0]["embedding"]
+            vector = await embed_one(request.text)
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Embedding API Error: {str(e)}")
+            raise embedding_error(e)
+        if embedding_cache:
+            await embedding_cache.put(request.text, vector)
 
     point_id = str(uuid.uuid4())
     stored_id = point_id
 
+    # Internal callers skip float formatting/parsing: raw float32 (or float16/int8) bytes
+    if VECTOR_MEDIA_TYPE in http_request.headers.get("accept", ""):
+        data, scale = encode_vector(vector, request.dtype)
+        headers = vector_headers(len(vector), request.dtype, scale)
+        headers["X-Stored-Id"] = stored_id
+        return Response(content=data, media_type=VECTOR_MEDIA_TYPE, headers=headers)
+    if request.encoding == "base64":
+        packed, scale = encode_vector_b64(vector, request.dtype)
+        return {"embedding_b64": packed, "dtype": request.dtype, "scale": scale, "dim": len(vector),
+                "stored_id": stored_id}
     return {"embedding": vector, "stored_id": stored_id}
 
-@app.post("/process/s3", response_model=ProcessResponse)
-async def process_s3_file(request: S3ProcessRequest):
-    # This endpoint checks database connections
+@app.post("/embed/batch", response_model=EmbeddingBatchResponse, response_model_exclude_none=True)
+async def generate_embeddings_batch(request: EmbeddingBatchRequest, http_request: Request):
+    """Many texts in one call, embedded in multi-input upstream requests.
+
+    `Accept: application/octet-stream` returns the vectors back to back as one
+    raw body (count x dim values of `dtype`).
+    """
+    texts = request.texts
+    vectors = await embedding_cache.get_many(texts) if embedding_cache else [None] * len(texts)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        try:
+            fresh = await provider.embed([texts[i] for i in missing])
+        except Exception as e:
+            raise embedding_error(e)
+        failed = [i for i, v in zip(missing, fresh) if v is None]
+        if failed:
+            raise HTTPException(status_code=502,
+                                detail=f"Embedding API Error: no vector for {len(failed)} texts, first index {failed[0]}")
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+        if embedding_cache:
+            await embedding_cache.put_many([texts[i] for i in missing], fresh)
+
+    dim = len(vectors[0])
+    raw = VECTOR_MEDIA_TYPE in http_request.headers.get("accept", "")
+    if not raw and request.encoding == "json":
+        return {"embeddings": vectors, "dim": dim, "count": len(vectors)}
+
+    packed = [encode_vector(v, request.dtype) for v in vectors]
+    scales = [scale for _, scale in packed] if request.dtype == "int8" else None
+    if raw:
+        headers = vector_headers(dim, request.dtype, 1.0)
+        headers[COUNT_HEADER] = str(len(vectors))
+        if scales:
+            headers[SCALE_HEADER] = ",".join(repr(scale) for scale in scales)
+        return Response(content=b"".join(data for data, _ in packed), media_type=VECTOR_MEDIA_TYPE, headers=headers)
+    return {"embeddings_b64": [base64.b64encode(data).decode("ascii") for data, _ in packed],
+            "dtype": request.dtype, "scales": scales, "dim": dim, "count": len(vectors)}
+
+async def ingest_document(s3_bucket: str, s3_key: str, report=None) -> Dict[str, Any]:
+    """Brings the stored vectors of one document in line with its chunk file.
+
+    Only chunks whose hash is not in the document's manifest are embedded and
+    upserted; chunks that disappeared are deleted. Point ids are derived from
+    document id + chunk hash, so re-running an ingestion never duplicates.
+    Streamed chunk files are diffed on their index, and only the blocks with
+    new chunks are downloaded, while earlier ones are being embedded.
+    """
+    chunk_file = await ChunkFile(S3_CLIENT, s3_bucket, s3_key).open()
+    # Chunk files written before document ids were stable have none; fall back to the key
+    document_id = chunk_file.document_id or s3_key
+    previous = await asyncio.to_thread(load_manifest, S3_CLIENT, s3_bucket, document_id)
+    diff = diff_chunks(previous, chunk_file.hashes)
+    if report:
+        await report(chunks_total=len(diff.added) + len(diff.unchanged), chunks_unchanged=len(diff.unchanged))
+
     q_db = get_qdrant_client()
     if not q_db:
         print("Warning: Qdrant unavailable, proceeding anyway...")
 
+    embedded = failed = cached = 0
+    stored: Dict[str, str] = {}
+
+    async with VectorWriteBuffer(q_db, pg_pool, QDRANT_COLLECTION) as buffer:
+        async for records in chunk_file.iter_records(list(diff.added.values())):
+            for start in range(0, len(records), JOB_PROGRESS_CHUNKS):
+                part = records[start:start + JOB_PROGRESS_CHUNKS]
+                texts = [r.text for r in part]
+
+                # Serve previously embedded chunks from the cache, embed the rest in batches
+                vectors = await embedding_cache.get_many(texts) if embedding_cache else [None] * len(texts)
+                missing = [i for i, v in enumerate(vectors) if v is None]
+                cached += len(texts) - len(missing)
+                if missing:
+                    # One stage span per slice; the provider adds a span per upstream request
+                    with span("ingest.embed", kind=KIND_INTERNAL, texts=len(missing)):
+                        fresh = await provider.embed([texts[i] for i in missing])
+                    for i, vector in zip(missing, fresh):
+                        vectors[i] = vector
+                    if embedding_cache:
+                        await embedding_cache.put_many([texts[i] for i in missing], fresh)
+
+                for record, vector in zip(part, vectors):
+                    if vector is None:
+                        failed += 1
+                        continue
+                    content_hash = chunk_file.hashes[record.position]
+                    pid = chunk_point_id(document_id, content_hash)
+                    await buffer.add(pid, vector, {
+                        "text": record.text,
+                        "source_file": s3_key,
+                        "document_id": document_id,
+                        "chunk_hash": content_hash,
+                        **record.metadata(),
+                    })
+                    stored[content_hash] = pid
+                    embedded += 1
+
+                if report:
+                    await report(chunks_embedded=embedded, chunks_failed=failed,
+                                 chunks_written=buffer.written["qdrant"])
+
+        deleted = await buffer.delete(list(diff.removed.values()))
+
+    # Record only what actually reached Qdrant, so failed chunks are retried next time
+    manifest = dict(diff.unchanged)
+    manifest.update({h: pid for h, pid in stored.items() if pid not in buffer.failed_ids})
+    if diff.removed and deleted["qdrant"] < len(diff.removed):
+        manifest.update(diff.removed)
+    await asyncio.to_thread(save_manifest, S3_CLIENT, s3_bucket, document_id, manifest)
+
+    print(f"Document {document_id}: {diff.counts()}, embedded {len(diff.added) - cached} chunks, "
+          f"{cached} served from cache, read {chunk_file.stats['bytes']} bytes in {chunk_file.stats['requests']} requests")
+    if failed:
+        print(f"Warning: {failed}/{len(diff.added)} chunks could not be embedded for {s3_key}")
+    return {
+        "document_id": document_id,
+        "embedded": embedded,
+        "failed": failed,
+        "written": buffer.written,
+        "diff": diff.counts(),
+    }
+
+async def run_ingest_job(job: Dict[str, Any], report) -> Dict[str, int]:
+    """Job handler: raising makes the worker retry (and eventually dead-letter) the job"""
+    result = await ingest_document(job["s3_bucket"], job["s3_key"], report)
+    if result["diff"]["added"] and not result["embedded"]:
+        raise RuntimeError(f"none of the {result['diff']['added']} new chunks could be embedded")
+    if index_manager and result["embedded"]:
+        await index_manager.maybe_build()
+    return {"chunks_embedded": result["embedded"], "chunks_failed": result["failed"],
+            "chunks_written": result["written"]["qdrant"], "chunks_removed": result["diff"]["removed"]}
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def enqueue_job(request: S3ProcessRequest):
+    """Queues a chunk file for embedding and returns immediately"""
     try:
-        response = S3_CLIENT.get_object(Bucket=request.s3_bucket, Key=request.s3_key)
-        file_content = response['Body'].read().decode('utf-8')
-        data = json.loads(file_content)
-        chunks = data.get("chunks", [])
+        job = await job_store.enqueue(request.s3_bucket, request.s3_key, JOB_MAX_ATTEMPTS,
+                                      current_traceparent(), current_request_id())
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to read S3 file: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Job queue unavailable: {str(e)}")
+    job_worker.notify()
+    print(f"Queued job {job['id']} for {request.s3_key}")
+    return job_response(job)
 
-    processed_count = 0
-    headers = { "Content-Type": "application/json", "x-portkey-api-key": PORTKEY_API_KEY }
-    
-    # Establish PG connection for the batch
-    pg_conn = get_postgres_conn()
+@app.get("/jobs", response_model=List[JobResponse])
+async def list_jobs(status: Optional[str] = None, limit: int = 50):
+    if status and status not in JOB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Unknown status, use one of {', '.join(JOB_STATUSES)}")
+    return [job_response(job) for job in await job_store.list(status, min(limit, 500))]
 
-    async with httpx.AsyncClient() as client:
-        for chunk_text in chunks:
-            try:
-                payload = { "input": [chunk_text], "encoding_format": "float" }
-                api_res = await client.post(PORTKEY_API_URL, json=payload, headers=headers, timeout=30.0)
-                api_res.raise_for_status()
-                vector = api_res.json()["data"][0]["embedding"]
-                
-                point_id = str(uuid.uuid4())
-
-                # Save Qdrant
-                if q_db:
-                    q_db.upsert(
-                        collection_name=QDRANT_COLLECTION,
-                        points=[models.PointStruct(id=point_id, vector=vector, payload={"text": chunk_text, "source_file": request.s3_key})]
-                    )
-
-                # Save Postgres
-                if pg_conn:
-                    with pg_conn.cursor() as cur:
-                        cur.execute(
-                            "INSERT INTO embeddings (id, vector, text, source_file) VALUES (%s, %s, %s, %s)",
-                            (point_id, str(vector), chunk_text, request.s3_key)
-                        )
-                    pg_conn.commit()
-
-                processed_count += 1
-            except Exception as e:
-                print(f"Error processing chunk: {e}")
-                continue 
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    job = await job_store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(job)
+
+@app.post("/jobs/{job_id}/retry", response_model=JobResponse)
+async def retry_job(job_id: str):
+    """Moves a dead-lettered job back onto the queue with a fresh set of attempts"""
+    job = await job_store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "dead_letter":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}, only dead_letter jobs can be retried")
+    await job_store.finish(job_id, "queued", error=job["error"], attempts_delta=-job["attempts"])
+    job_worker.notify()
+    return job_response(await job_store.get(job_id))
+
+@app.get("/admin/pg-index")
+async def pg_index_status():
+    """Current pgvector index, build progress and the last build result"""
+    if not index_manager:
+        raise HTTPException(status_code=503, detail="Postgres not configured")
+    return await index_manager.describe()
+
+@app.post("/admin/pg-index", status_code=202)
+async def build_pg_index(request: IndexBuildRequest):
+    """(Re)builds the pgvector index in the background, e.g. after a bulk load"""
+    if not index_manager:
+        raise HTTPException(status_code=503, detail="Postgres not configured")
+    if request.type and request.type not in INDEX_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown index type, use one of {', '.join(INDEX_TYPES)}")
+    params = {k: v for k, v in (("m", request.m), ("ef_construction", request.ef_construction),
+                                ("lists", request.lists)) if v is not None}
+    if not index_manager.schedule(request.type, request.force, **params):
+        raise HTTPException(status_code=409, detail="An index build is already running")
+    return {"status": "building", "type": request.type or index_manager.index_type}
+
+@app.get("/admin/qdrant-profile")
+async def qdrant_profile_status():
+    """Collection settings versus the configured profile, and the optimizer status of a running migration"""
+    q_db = get_qdrant_client()
+    if not q_db:
+        raise HTTPException(status_code=503, detail="Qdrant unavailable")
+    return await asyncio.to_thread(describe_collection, q_db, QDRANT_COLLECTION, QDRANT_PROFILE, EMBEDDING_DIM)
+
+@app.post("/admin/qdrant-profile", status_code=202)
+async def migrate_qdrant_profile(request: CollectionProfileRequest):
+    """Applies a profile to the existing collection in place; Qdrant rebuilds the segments in the background"""
+    q_db = get_qdrant_client()
+    if not q_db:
+        raise HTTPException(status_code=503, detail="Qdrant unavailable")
+    try:
+        profile = resolve_profile(request.profile) if request.profile else QDRANT_PROFILE
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request.profile and request.profile != QDRANT_PROFILE.name:
+        print(f"Warning: migrating to profile '{profile.name}' while QDRANT_PROFILE is '{QDRANT_PROFILE.name}'")
+
+    if request.dry_run:
+        status = await asyncio.to_thread(describe_collection, q_db, QDRANT_COLLECTION, profile, EMBEDDING_DIM)
+        return {"status": "dry_run", "profile": profile.name, "diff": status["diff"]}
+    try:
+        diff = await asyncio.to_thread(migrate_collection, q_db, QDRANT_COLLECTION, profile)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Qdrant rejected the update: {str(e)}")
+    print(f"Migrating collection '{QDRANT_COLLECTION}' to profile '{profile.name}': {diff}")
+    return {"status": "migrating" if diff else "unchanged", "profile": profile.name,
+            "diff": {k: {"current": c, "target": t} for k, (c, t) in diff.items()}}
 
-    if pg_conn:
-        pg_conn.close()
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 30, hz: int = 100, idle: bool = False,
+                        x_profiler_token: Optional[str] = Header(None)):
+    """Samples the stacks of this worker for `seconds` and returns them folded, for a flame graph (PROFILER_ENABLED)"""
+    return await profile_response(seconds, hz, idle, x_profiler_token)
 
-    return { "status": "completed", "chunks_processed": processed_count, "doc_id": request.s3_key }
+@app.post("/process/s3", response_model=ProcessResponse)
+async def process_s3_file(request: S3ProcessRequest):
+    """Synchronous variant of /jobs, kept for manual runs"""
+    try:
+        result = await ingest_document(request.s3_bucket, request.s3_key)
+    except (ClientError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Failed to read S3 file: {str(e)}")
+
+    return {
+        "status": "completed",
+        "chunks_processed": result["embedded"],
+        "doc_id": request.s3_key,
+        "document_id": result["document_id"],
+        "written": result["written"],
+        "diff": result["diff"],
+    }
 
 if __name__ == "__main__":
     import uvicorn
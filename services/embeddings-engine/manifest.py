@@ -0,0 +1,62 @@
+import json
+import uuid
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+# Fixed namespace: the same document + chunk text always maps to the same point id
+POINT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, "chunks.faro-rag")
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_point_id(document_id: str, content_hash: str) -> str:
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{document_id}:{content_hash}"))
+
+
+def manifest_key(document_id: str) -> str:
+    return f"manifests/{document_id}.json"
+
+
+def load_manifest(s3_client, bucket: str, document_id: str) -> Dict[str, str]:
+    """Returns {chunk_hash: point_id} of the last ingestion, {} for a new document"""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=manifest_key(document_id))
+    except s3_client.exceptions.NoSuchKey:
+        return {}
+    return json.loads(response["Body"].read().decode("utf-8")).get("chunks", {})
+
+
+def save_manifest(s3_client, bucket: str, document_id: str, chunks: Dict[str, str]):
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=manifest_key(document_id),
+        Body=json.dumps({"document_id": document_id, "chunks": chunks}),
+        ContentType="application/json",
+    )
+
+
+@dataclass
+class ChunkDiff:
+    """What changed between the stored manifest and the current chunk list"""
+    added: Dict[str, int] = field(default_factory=dict)      # chunk_hash -> position in the chunk file
+    unchanged: Dict[str, str] = field(default_factory=dict)  # chunk_hash -> point_id
+    removed: Dict[str, str] = field(default_factory=dict)    # chunk_hash -> point_id
+
+    def counts(self) -> Dict[str, int]:
+        return {"added": len(self.added), "unchanged": len(self.unchanged), "removed": len(self.removed)}
+
+
+def diff_chunks(previous: Dict[str, str], hashes: List[str]) -> ChunkDiff:
+    """Diffs by chunk hash only, so a streamed chunk file is compared using its index"""
+    diff = ChunkDiff()
+    for position, h in enumerate(hashes):
+        if h in previous:
+            diff.unchanged[h] = previous[h]
+        else:
+            # Repeated chunks within one document collapse into one point
+            diff.added.setdefault(h, position)
+    diff.removed = {h: pid for h, pid in previous.items() if h not in diff.unchanged}
+    return diff
@@ -0,0 +1,260 @@
+import os
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import psycopg
+from prometheus_client import Gauge
+
+from pools import pg_connection
+
+# --- Configuration ---
+# hnsw | ivfflat | none
+PG_INDEX_TYPE = os.getenv("PG_INDEX_TYPE", "hnsw").lower()
+PG_HNSW_M = int(os.getenv("PG_HNSW_M", "16"))
+PG_HNSW_EF_CONSTRUCTION = int(os.getenv("PG_HNSW_EF_CONSTRUCTION", "64"))
+# 0 = derive from the row count (rows / 1000, sqrt(rows) above 1M rows)
+PG_IVFFLAT_LISTS = int(os.getenv("PG_IVFFLAT_LISTS", "0"))
+# Build automatically once the table holds this many rows; building on an empty table
+# gives IVFFlat useless centroids and makes every bulk insert pay for HNSW maintenance
+PG_INDEX_MIN_ROWS = int(os.getenv("PG_INDEX_MIN_ROWS", "10000"))
+PG_INDEX_AUTO_BUILD = os.getenv("PG_INDEX_AUTO_BUILD", "true").lower() == "true"
+PG_MAINTENANCE_WORK_MEM = os.getenv("PG_MAINTENANCE_WORK_MEM", "512MB")
+PG_INDEX_PARALLEL_WORKERS = int(os.getenv("PG_INDEX_PARALLEL_WORKERS", "2"))
+
+INDEX_TYPES = ("hnsw", "ivfflat")
+INDEX_NAME = "embeddings_vector_idx"
+TABLE_NAME = "embeddings"
+# GIN index on the generated `tsv` column that rag-query's lexical leg searches
+LEXICAL_INDEX_NAME = "embeddings_tsv_idx"
+# Cosine distance, matching the `<=>` operator used by rag-query
+OPCLASS = "vector_cosine_ops"
+
+# --- Metrics ---
+INDEX_BUILD_SECONDS = Gauge("pgvector_index_build_seconds", "Duration of the last pgvector index build")
+INDEX_SIZE = Gauge("pgvector_index_size_bytes", "Size of the pgvector index")
+
+
+def ivfflat_lists(rows: int) -> int:
+    """pgvector's guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond"""
+    if rows <= 1_000_000:
+        return max(10, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+def index_options(index_type: str, rows: int, m: Optional[int] = None, ef_construction: Optional[int] = None,
+                  lists: Optional[int] = None) -> Dict[str, int]:
+    if index_type == "hnsw":
+        return {"m": m or PG_HNSW_M, "ef_construction": ef_construction or PG_HNSW_EF_CONSTRUCTION}
+    if index_type == "ivfflat":
+        return {"lists": lists or PG_IVFFLAT_LISTS or ivfflat_lists(rows)}
+    raise ValueError(f"Unknown index type '{index_type}', use one of {', '.join(INDEX_TYPES)}")
+
+
+def index_ddl(index_type: str, options: Dict[str, int], name: str = INDEX_NAME, table: str = TABLE_NAME,
+              concurrently: bool = True) -> str:
+    with_clause = ", ".join(f"{key} = {int(value)}" for key, value in options.items())
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}{name} ON {table} "
+        f"USING {index_type} (vector {OPCLASS}) WITH ({with_clause})"
+    )
+
+
+class IndexManager:
+    """Creates and replaces the ANN index on the embeddings table.
+
+    Builds run on their own autocommit connection with CREATE INDEX
+    CONCURRENTLY, so ingestion and shadow queries keep working. A new index is
+    built under a temporary name and swapped in when it is valid. An advisory
+    lock makes sure only one replica builds at a time. The GIN index of the
+    lexical `tsv` column is built the same way.
+    """
+
+    def __init__(self, pool, index_type: str = PG_INDEX_TYPE):
+        self.pool = pool
+        self.index_type = index_type
+        self.last_build: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def building(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def describe(self) -> Dict[str, Any]:
+        async with pg_connection(self.pool) as conn:
+            cur = await conn.execute("""
+                SELECT am.amname, c.reloptions, i.indisvalid, pg_relation_size(c.oid)
+                FROM pg_class c
+                JOIN pg_index i ON i.indexrelid = c.oid
+                JOIN pg_am am ON am.oid = c.relam
+                WHERE c.relname = %s
+            """, (INDEX_NAME,))
+            row = await cur.fetchone()
+            cur = await conn.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s", (TABLE_NAME,)
+            )
+            estimate = await cur.fetchone()
+            cur = await conn.execute("""
+                SELECT phase, blocks_done, blocks_total, tuples_done, tuples_total
+                FROM pg_stat_progress_create_index WHERE relid = %s::regclass
+            """, (TABLE_NAME,))
+            progress = await cur.fetchone()
+            lexical = await self._lexical_state(conn)
+
+        index = None
+        if row:
+            amname, reloptions, valid, size = row
+            options = dict(opt.split("=", 1) for opt in (reloptions or []))
+            index = {"type": amname, "options": {k: int(v) for k, v in options.items()}, "valid": valid,
+                     "size_bytes": size}
+            INDEX_SIZE.set(size)
+        return {
+            "index": index,
+            # Planner estimate; -1 when the table was never analyzed
+            "rows_estimate": estimate[0] if estimate else 0,
+            "building": self.building,
+            "progress": dict(zip(("phase", "blocks_done", "blocks_total", "tuples_done", "tuples_total"),
+                                 progress)) if progress else None,
+            "last_build": self.last_build,
+            "lexical": lexical,
+        }
+
+    @staticmethod
+    async def _lexical_state(conn) -> Dict[str, Any]:
+        cur = await conn.execute("""
+            SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'tsv'),
+                   (SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+                    WHERE c.relname = %s)
+        """, (TABLE_NAME, LEXICAL_INDEX_NAME))
+        column, valid = await cur.fetchone()
+        # index_valid is None when there is no index, False after an interrupted concurrent build
+        return {"column": column, "index_valid": valid}
+
+    async def _count_rows(self) -> int:
+        async with pg_connection(self.pool) as conn:
+            cur = await conn.execute(f"SELECT count(*) FROM {TABLE_NAME}")
+            return (await cur.fetchone())[0]
+
+    async def build(self, index_type: Optional[str] = None, force: bool = False, **params) -> Dict[str, Any]:
+        index_type = index_type or self.index_type
+        rows = await self._count_rows()
+        options = index_options(index_type, rows, **params)
+
+        current = (await self.describe())["index"]
+        if not force and current and current["valid"] and current["type"] == index_type \
+                and current["options"] == options:
+            return {"status": "unchanged", "type": index_type, "options": options}
+
+        temp_name = f"{INDEX_NAME}_new"
+        async with self._build_connection() as conn:
+            if conn is None:
+                return {"status": "skipped", "reason": "another replica is building the index"}
+            # Leftover of an interrupted build (invalid index)
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {temp_name}")
+
+            print(f"Building pgvector {index_type} index {options} over {rows} rows...")
+            t0 = time.perf_counter()
+            await conn.execute(index_ddl(index_type, options, name=temp_name))
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}")
+            await conn.execute(f"ALTER INDEX {temp_name} RENAME TO {INDEX_NAME}")
+            await conn.execute(f"ANALYZE {TABLE_NAME}")
+            elapsed = time.perf_counter() - t0
+
+        INDEX_BUILD_SECONDS.set(elapsed)
+        self.last_build = {
+            "status": "built",
+            "type": index_type,
+            "options": options,
+            "rows": rows,
+            "seconds": round(elapsed, 2),
+            "finished_at": time.time(),
+        }
+        print(f"pgvector index built in {elapsed:.1f}s")
+        await self.describe()
+        return self.last_build
+
+    async def build_lexical(self) -> Dict[str, Any]:
+        """Builds the GIN index of the `tsv` column if it is missing or was left invalid"""
+        async with self._build_connection() as conn:
+            if conn is None:
+                return {"status": "skipped", "reason": "another replica is building an index"}
+            state = await self._lexical_state(conn)
+            if not state["column"]:
+                return {"status": "skipped", "reason": "the tsv column is missing, see the README migration"}
+            if state["index_valid"]:
+                return {"status": "unchanged"}
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {LEXICAL_INDEX_NAME}")
+            print("Building the lexical (tsv) index...")
+            t0 = time.perf_counter()
+            await conn.execute(f"CREATE INDEX CONCURRENTLY {LEXICAL_INDEX_NAME} ON {TABLE_NAME} USING gin (tsv)")
+            elapsed = time.perf_counter() - t0
+        print(f"Lexical index built in {elapsed:.1f}s")
+        return {"status": "built", "seconds": round(elapsed, 2)}
+
+    @asynccontextmanager
+    async def _build_connection(self) -> AsyncIterator[Optional[psycopg.AsyncConnection]]:
+        """Autocommit connection holding the build lock; None while another replica builds"""
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction, so use a dedicated autocommit connection
+        async with await psycopg.AsyncConnection.connect(self.pool.conninfo, autocommit=True) as conn:
+            cur = await conn.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (INDEX_NAME,))
+            if not (await cur.fetchone())[0]:
+                yield None
+                return
+            try:
+                await conn.execute(f"SET maintenance_work_mem = '{PG_MAINTENANCE_WORK_MEM}'")
+                await conn.execute(f"SET max_parallel_maintenance_workers = {PG_INDEX_PARALLEL_WORKERS}")
+                yield conn
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock(hashtext(%s))", (INDEX_NAME,))
+
+    def schedule(self, index_type: Optional[str] = None, force: bool = False, **params) -> bool:
+        """Starts a build in the background; False when one is already running"""
+        if self.building:
+            return False
+        self._task = asyncio.create_task(self._build_logged(index_type, force, **params))
+        return True
+
+    async def _build_logged(self, index_type: Optional[str], force: bool, **params):
+        try:
+            await self.build(index_type, force, **params)
+        except Exception as e:
+            self.last_build = {"status": "failed", "error": str(e), "finished_at": time.time()}
+            print(f"pgvector index build failed: {e}")
+
+    async def _build_lexical_logged(self):
+        try:
+            await self.build_lexical()
+        except Exception as e:
+            print(f"Lexical index build failed: {e}")
+
+    async def maybe_build(self):
+        """Builds a missing lexical index, and the configured vector index once enough rows are loaded"""
+        if self.building:
+            return
+        try:
+            status = await self.describe()
+            lexical = status["lexical"]
+            if lexical["column"] and not lexical["index_valid"]:
+                # Cheap next to the vector index; a pending vector build follows on the next check
+                self._task = asyncio.create_task(self._build_lexical_logged())
+                return
+            if not PG_INDEX_AUTO_BUILD or self.index_type not in INDEX_TYPES:
+                return
+            if status["index"] and status["index"]["valid"]:
+                return
+            # The planner estimate avoids a full count on every check; it is -1 before the first ANALYZE
+            rows = status["rows_estimate"]
+            if rows < PG_INDEX_MIN_ROWS:
+                rows = await self._count_rows()
+            if rows >= PG_INDEX_MIN_ROWS:
+                self.schedule()
+        except Exception as e:
+            print(f"pgvector index check failed: {e}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
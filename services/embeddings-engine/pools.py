@@ -0,0 +1,92 @@
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+from prometheus_client import Gauge, Histogram
+
+from tracing import inject_headers
+
+# --- Configuration ---
+PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "1"))
+PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "10"))
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+
+# --- Metrics ---
+PG_POOL_CONNECTIONS = Gauge(
+    "pg_pool_connections",
+    "Postgres pool connections by state (size, available, waiting requests)",
+    ["state"]
+)
+PG_POOL_WAIT = Histogram(
+    "pg_pool_wait_seconds",
+    "Time spent waiting for a pooled Postgres connection",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_pg_pool(host: Optional[str], dbname: str, user: str, password: str) -> Optional[AsyncConnectionPool]:
+    """Builds a (not yet opened) async pool, or None when Postgres is not configured"""
+    if not host:
+        print("Postgres not configured (PG_HOST unset), pool disabled")
+        return None
+
+    host, _, port = host.partition(":")
+    conninfo = make_conninfo(host=host, port=port or None, dbname=dbname, user=user, password=password)
+    pool = AsyncConnectionPool(
+        conninfo,
+        min_size=PG_POOL_MIN_SIZE,
+        max_size=PG_POOL_MAX_SIZE,
+        timeout=PG_POOL_TIMEOUT,
+        open=False,
+    )
+
+    # Read pool stats at scrape time instead of tracking them by hand
+    PG_POOL_CONNECTIONS.labels(state="size").set_function(lambda: pool.get_stats().get("pool_size", 0))
+    PG_POOL_CONNECTIONS.labels(state="available").set_function(lambda: pool.get_stats().get("pool_available", 0))
+    PG_POOL_CONNECTIONS.labels(state="waiting").set_function(lambda: pool.get_stats().get("requests_waiting", 0))
+    return pool
+
+
+@asynccontextmanager
+async def pg_connection(pool: AsyncConnectionPool, timeout: Optional[float] = None):
+    """Borrows a connection from the pool and records how long the wait took"""
+    t0 = time.perf_counter()
+    async with pool.connection(timeout=timeout) as conn:
+        PG_POOL_WAIT.observe(time.perf_counter() - t0)
+        yield conn
+
+
+def create_http_client(timeout: float = 30.0, propagate: bool = False) -> httpx.AsyncClient:
+    """Long-lived client that keeps connections (and TLS sessions) alive between calls.
+
+    `propagate` passes the trace context (traceparent, X-Request-ID) on; only
+    for calls to our own services, external APIs get no internal ids.
+    """
+    http2 = HTTP2_ENABLED and _http2_available()
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=timeout,
+        event_hooks={"request": [inject_headers]} if propagate else None,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+from collections import Counter
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import PlainTextResponse
+
+# Shared by all three services; keep all copies identical.
+
+# --- Configuration ---
+# Off by default: GET /debug/profile answers 404 unless this is set
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+# When set, callers must send it in the X-Profiler-Token header
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "120"))
+PROFILER_MAX_HZ = int(os.getenv("PROFILER_MAX_HZ", "1000"))
+
+IDLE_FRAMES = ("select", "poll", "wait", "_worker")
+
+_busy = threading.Lock()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, hz: int, include_idle: bool = False) -> Dict[str, int]:
+    """Samples the stacks of all threads of this process; returns {folded stack: samples}.
+
+    Pure Python and in-process: sys._current_frames() is read `hz` times per
+    second, which costs a few percent CPU at 100 Hz while it runs. The asyncio
+    event loop thread shows the coroutine that is running; a loop waiting in
+    select() is idle and skipped unless `include_idle` is set.
+    """
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks: Counter = Counter()
+    interval = 1.0 / hz
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        t0 = time.monotonic()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(_frame_name(frame))
+                frame = frame.f_back
+            # Innermost frame of a thread blocked in a selector, a lock or an empty executor queue
+            if not include_idle and frames and frames[0].split(" ", 1)[0] in IDLE_FRAMES:
+                continue
+            if ident not in names:
+                names.update((t.ident, t.name) for t in threading.enumerate())
+            frames.append(names.get(ident, f"thread-{ident}"))
+            stacks[";".join(reversed(frames))] += 1
+        time.sleep(max(0.0, interval - (time.monotonic() - t0)))
+    return stacks
+
+
+def fold(stacks: Dict[str, int]) -> str:
+    """Collapsed stack format, for flamegraph.pl, speedscope or inferno"""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+async def profile_response(seconds: float, hz: int, include_idle: bool, token: Optional[str]) -> PlainTextResponse:
+    """Handler body of GET /debug/profile: samples this worker process for `seconds`"""
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if PROFILER_TOKEN and token != PROFILER_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid profiler token")
+    if not 0 < seconds <= PROFILER_MAX_SECONDS or not 1 <= hz <= PROFILER_MAX_HZ:
+        raise HTTPException(status_code=400,
+                            detail=f"seconds must be in (0, {PROFILER_MAX_SECONDS:g}] and hz in [1, {PROFILER_MAX_HZ}]")
+    if not _busy.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile is already being captured in this worker")
+    try:
+        # The sampler runs in a thread so the event loop (the thing being profiled) keeps serving
+        stacks = await asyncio.to_thread(sample_stacks, seconds, hz, include_idle)
+    finally:
+        _busy.release()
+    return PlainTextResponse(fold(stacks), headers={
+        "X-Profile-Samples": str(sum(stacks.values())),
+        "X-Profile-Pid": str(os.getpid()),
+    })
@@ -0,0 +1,163 @@
+import os
+import time
+import asyncio
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+import numpy as np
+from prometheus_client import Histogram
+
+from batching import embed_texts
+from tracing import span
+
+# --- Configuration ---
+# portkey = remote OpenAI-compatible API through Portkey; local = sentence-transformers model on this pod
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "portkey")
+# Dimension of the Qdrant collection and the pgvector column
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "1024"))
+
+PORTKEY_API_URL = os.getenv("PORTKEY_API_URL", "https://api.portkey.ai/v1/embeddings")
+PORTKEY_API_KEY = os.getenv("PORTKEY_API_KEY")
+# Model identifier used in cache keys; change it when the Portkey config switches models
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "portkey-default")
+
+# bge-m3 is multilingual, needs no query/passage prefixes and outputs 1024 dimensions
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "BAAI/bge-m3")
+LOCAL_EMBEDDING_DEVICE = os.getenv("LOCAL_EMBEDDING_DEVICE", "cpu")
+# Texts longer than this many model tokens are truncated; inference cost grows with it
+LOCAL_EMBEDDING_MAX_LENGTH = int(os.getenv("LOCAL_EMBEDDING_MAX_LENGTH", "512"))
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+# Model calls running at once; each uses LOCAL_EMBEDDING_THREADS torch threads
+LOCAL_EMBEDDING_WORKERS = int(os.getenv("LOCAL_EMBEDDING_WORKERS", "1"))
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", str(os.cpu_count() or 1)))
+# Zero-pad smaller models (e.g. 384-dim MiniLM for CI) to EMBEDDING_DIM; cosine similarity is unchanged
+LOCAL_EMBEDDING_PAD = os.getenv("LOCAL_EMBEDDING_PAD", "false").lower() == "true"
+
+# --- Metrics ---
+LOCAL_INFERENCE_LATENCY = Histogram(
+    "embedding_local_inference_seconds",
+    "Duration of one local model call",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+
+class EmbeddingProvider(ABC):
+    """Turns texts into vectors of EMBEDDING_DIM.
+
+    `embed` returns vectors in input order, None for texts that could not be
+    embedded. `model_id` goes into embedding cache keys, so vectors of
+    different models never mix.
+    """
+    name = "base"
+    model_id = ""
+
+    async def start(self, http_client: httpx.AsyncClient):
+        pass
+
+    @abstractmethod
+    async def embed(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        ...
+
+    async def close(self):
+        pass
+
+
+class PortkeyProvider(EmbeddingProvider):
+    """Remote embedding API; multi-input requests with retries (see batching.py)"""
+    name = "portkey"
+
+    def __init__(self, url: str = PORTKEY_API_URL, api_key: Optional[str] = PORTKEY_API_KEY,
+                 model_id: str = EMBEDDING_MODEL):
+        self.url = url
+        self.api_key = api_key
+        self.model_id = model_id
+        self.client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Content-Type": "application/json", "x-portkey-api-key": self.api_key}
+
+    async def start(self, http_client: httpx.AsyncClient):
+        self.client = http_client
+
+    async def embed(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        return await embed_texts(self.client, self.url, self.headers, texts)
+
+
+class LocalProvider(EmbeddingProvider):
+    """sentence-transformers model on CPU (or LOCAL_EMBEDDING_DEVICE).
+
+    Model calls run on a small thread pool; torch releases the GIL during
+    inference, so the event loop keeps serving requests. Vectors are L2
+    normalized like the remote API's.
+    """
+    name = "local"
+
+    def __init__(self, model_name: str = LOCAL_EMBEDDING_MODEL, device: str = LOCAL_EMBEDDING_DEVICE,
+                 batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE, workers: int = LOCAL_EMBEDDING_WORKERS,
+                 dim: int = EMBEDDING_DIM, pad: bool = LOCAL_EMBEDDING_PAD):
+        self.model_name = model_name
+        self.model_id = f"local:{model_name}"
+        self.device = device
+        self.batch_size = batch_size
+        self.dim = dim
+        self.pad = pad
+        self.model = None
+        self._pad_width = 0
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="embed")
+
+    def load(self):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        torch.set_num_threads(max(1, LOCAL_EMBEDDING_THREADS))
+        model = SentenceTransformer(self.model_name, device=self.device)
+        model.max_seq_length = LOCAL_EMBEDDING_MAX_LENGTH
+        model_dim = model.get_sentence_embedding_dimension()
+        if model_dim > self.dim or (model_dim < self.dim and not self.pad):
+            raise ValueError(f"Model {self.model_name} outputs {model_dim} dimensions, the collections use "
+                             f"{self.dim} (set LOCAL_EMBEDDING_PAD=true to zero-pad smaller models)")
+        self._pad_width = self.dim - model_dim
+        self.model = model
+
+    async def start(self, http_client: httpx.AsyncClient):
+        loop = asyncio.get_running_loop()
+        t0 = time.perf_counter()
+        await loop.run_in_executor(self._executor, self.load)
+        # First calls allocate buffers and pick kernels; pay that before the pod takes traffic
+        await self.embed(["warm up"])
+        await self.embed(["warm up"] * self.batch_size)
+        print(f"Local embedding model {self.model_name} ready on {self.device} in {time.perf_counter() - t0:.1f}s")
+
+    def _encode(self, texts: Sequence[str]) -> np.ndarray:
+        t0 = time.perf_counter()
+        vectors = self.model.encode(list(texts), batch_size=self.batch_size, normalize_embeddings=True,
+                                    convert_to_numpy=True, show_progress_bar=False)
+        LOCAL_INFERENCE_LATENCY.observe(time.perf_counter() - t0)
+        if self._pad_width:
+            vectors = np.pad(vectors, ((0, 0), (0, self._pad_width)))
+        return vectors
+
+    async def embed(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        try:
+            with span("embedding.local", texts=len(texts)):
+                vectors = await loop.run_in_executor(self._executor, self._encode, texts)
+        except Exception as e:
+            print(f"Local embedding of {len(texts)} texts failed: {e}")
+            return [None] * len(texts)
+        return vectors.tolist()
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def create_provider(name: str = EMBEDDING_PROVIDER) -> EmbeddingProvider:
+    if name == "portkey":
+        return PortkeyProvider()
+    if name == "local":
+        return LocalProvider()
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER '{name}', use portkey or local")
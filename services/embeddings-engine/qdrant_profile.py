@@ -0,0 +1,160 @@
+import os
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+# --- Configuration ---
+# baseline | scalar | scalar-disk | binary-disk, see PROFILES
+QDRANT_PROFILE = os.getenv("QDRANT_PROFILE", "baseline")
+# 0 = the profile's value
+QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", "0"))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "0"))
+# Keyword indexes for filters and deletes by document; cheap, so created regardless of the profile
+QDRANT_PAYLOAD_INDEXES = [f.strip() for f in os.getenv("QDRANT_PAYLOAD_INDEXES", "document_id,source_file").split(",")
+                          if f.strip()]
+# Apply the profile to an existing collection at startup. Off by default: changing quantization,
+# HNSW or on-disk settings makes Qdrant rebuild segments in the background
+QDRANT_PROFILE_AUTO_MIGRATE = os.getenv("QDRANT_PROFILE_AUTO_MIGRATE", "false").lower() == "true"
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    """Storage and index settings of the Qdrant collection.
+
+    Quantized vectors are kept in RAM for the HNSW search, the original
+    float32 vectors are only read to rescore the oversampled candidates, so
+    they can live on disk (page cache) without slowing every search.
+    """
+    name: str
+    quantization: str = "none"  # none | scalar (int8) | binary (1 bit per dimension)
+    on_disk_vectors: bool = False
+    on_disk_payload: bool = False
+    m: int = 16
+    ef_construct: int = 100
+    quantile: float = 0.99  # scalar only: outliers beyond this quantile are clipped
+
+    def settings(self) -> Dict[str, Any]:
+        return {k: v for k, v in asdict(self).items() if k not in ("name", "quantile")}
+
+    def quantization_config(self):
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=self.quantile, always_ram=True))
+        if self.quantization == "binary":
+            return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+        return None
+
+
+PROFILES = {
+    # What the collection was created with before profiles existed: everything in RAM
+    "baseline": CollectionProfile("baseline"),
+    # int8 vectors (4x smaller) for search, originals in RAM for fast rescoring
+    "scalar": CollectionProfile("scalar", quantization="scalar", on_disk_payload=True),
+    "scalar-disk": CollectionProfile("scalar-disk", quantization="scalar", on_disk_vectors=True, on_disk_payload=True),
+    # 32x smaller; needs oversampling (2-4x) with rescoring to keep recall, works best from ~1024 dimensions
+    "binary-disk": CollectionProfile("binary-disk", quantization="binary", on_disk_vectors=True, on_disk_payload=True),
+}
+
+
+def resolve_profile(name: str = QDRANT_PROFILE) -> CollectionProfile:
+    if name not in PROFILES:
+        raise ValueError(f"Unknown Qdrant profile '{name}', use one of {', '.join(PROFILES)}")
+    profile = PROFILES[name]
+    return replace(profile, m=QDRANT_HNSW_M or profile.m, ef_construct=QDRANT_HNSW_EF_CONSTRUCT or profile.ef_construct)
+
+
+def create_collection(client: QdrantClient, collection: str, dim: int, profile: CollectionProfile):
+    client.create_collection(
+        collection_name=collection,
+        vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE,
+                                           on_disk=profile.on_disk_vectors),
+        hnsw_config=models.HnswConfigDiff(m=profile.m, ef_construct=profile.ef_construct),
+        quantization_config=profile.quantization_config(),
+        on_disk_payload=profile.on_disk_payload,
+    )
+
+
+def current_settings(info: models.CollectionInfo) -> Dict[str, Any]:
+    """The profile settings of an existing collection, in the shape of CollectionProfile.settings()"""
+    config = info.config
+    vectors = config.params.vectors
+    quantization = config.quantization_config
+    if isinstance(quantization, models.ScalarQuantization):
+        kind = "scalar"
+    elif isinstance(quantization, models.BinaryQuantization):
+        kind = "binary"
+    else:
+        kind = "none" if quantization is None else type(quantization).__name__
+    return {
+        "quantization": kind,
+        "on_disk_vectors": bool(vectors.on_disk),
+        "on_disk_payload": bool(config.params.on_disk_payload),
+        "m": config.hnsw_config.m,
+        "ef_construct": config.hnsw_config.ef_construct,
+    }
+
+
+def profile_diff(info: models.CollectionInfo, profile: CollectionProfile) -> Dict[str, Tuple[Any, Any]]:
+    """Settings that differ, as {setting: (current, target)}"""
+    current = current_settings(info)
+    return {k: (current[k], v) for k, v in profile.settings().items() if current[k] != v}
+
+
+def migrate(client: QdrantClient, collection: str, profile: CollectionProfile) -> Dict[str, Tuple[Any, Any]]:
+    """Brings an existing collection in line with `profile` and returns what changed.
+
+    Qdrant applies the update in place: the optimizer rebuilds segments in the
+    background (collection status yellow) while searches and upserts keep
+    working on the old segments. Vector size and distance cannot be changed
+    this way; that needs a new collection and a re-ingestion.
+    """
+    diff = profile_diff(client.get_collection(collection), profile)
+    if not diff:
+        return diff
+
+    update: Dict[str, Any] = {}
+    if "on_disk_vectors" in diff:
+        # "" is the default (unnamed) vector
+        update["vectors_config"] = {"": models.VectorParamsDiff(on_disk=profile.on_disk_vectors)}
+    if "on_disk_payload" in diff:
+        update["collection_params"] = models.CollectionParamsDiff(on_disk_payload=profile.on_disk_payload)
+    if "m" in diff or "ef_construct" in diff:
+        update["hnsw_config"] = models.HnswConfigDiff(m=profile.m, ef_construct=profile.ef_construct)
+    if "quantization" in diff:
+        update["quantization_config"] = profile.quantization_config() or models.Disabled.DISABLED
+    client.update_collection(collection_name=collection, **update)
+    return diff
+
+
+def ensure_payload_indexes(client: QdrantClient, collection: str, fields: List[str] = QDRANT_PAYLOAD_INDEXES) -> List[str]:
+    """Creates missing keyword indexes and returns the fields that were added"""
+    existing = client.get_collection(collection).payload_schema or {}
+    added = []
+    for field in fields:
+        if field not in existing:
+            # Indexing an existing collection takes a while; don't hold up startup for it
+            client.create_payload_index(collection, field, models.PayloadSchemaType.KEYWORD, wait=False)
+            added.append(field)
+    return added
+
+
+def describe(client: QdrantClient, collection: str, profile: CollectionProfile, dim: Optional[int] = None) -> Dict[str, Any]:
+    info = client.get_collection(collection)
+    vectors = info.config.params.vectors
+    return {
+        "collection": collection,
+        # yellow while the optimizer is still rebuilding segments after a migration
+        "status": str(getattr(info.status, "value", info.status)),
+        "optimizer_status": str(getattr(info.optimizer_status, "value", info.optimizer_status)),
+        "points_count": info.points_count,
+        "indexed_vectors_count": info.indexed_vectors_count,
+        "segments_count": info.segments_count,
+        "vector_size": vectors.size,
+        "compatible": dim is None or vectors.size == dim,
+        "current": current_settings(info),
+        "profile": profile.name,
+        "target": profile.settings(),
+        "diff": {k: {"current": c, "target": t} for k, (c, t) in profile_diff(info, profile).items()},
+        "payload_indexes": sorted((info.payload_schema or {}).keys()),
+    }
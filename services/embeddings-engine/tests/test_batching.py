@@ -0,0 +1,62 @@
+import json
+import asyncio
+
+import httpx
+
+from batching import embed_texts, estimate_tokens, pack_batches
+
+
+def test_pack_batches_by_item_count():
+    assert pack_batches(["a"] * 5, max_items=2, max_tokens=1000) == [[0, 1], [2, 3], [4]]
+
+
+def test_pack_batches_by_token_budget():
+    texts = ["x" * 40, "x" * 40, "x" * 40]  # 10 tokens each
+    assert pack_batches(texts, max_items=10, max_tokens=20) == [[0, 1], [2]]
+
+
+def test_oversized_text_gets_its_own_batch():
+    texts = ["short", "x" * 400, "short"]
+    assert pack_batches(texts, max_items=10, max_tokens=20) == [[0], [1], [2]]
+
+
+def test_pack_batches_keeps_every_index_once():
+    texts = ["x" * (i * 7 % 50) for i in range(100)]
+    batches = pack_batches(texts, max_items=8, max_tokens=60)
+    assert [i for b in batches for i in b] == list(range(100))
+    assert all(len(b) <= 8 for b in batches)
+    assert all(sum(estimate_tokens(texts[i]) for i in b) <= 60 for b in batches if len(b) > 1)
+
+
+def test_pack_batches_empty():
+    assert pack_batches([]) == []
+
+
+def run_embed(handler, texts, batch_size=8):
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await embed_texts(client, "http://embeddings.test/v1/embeddings", {}, texts, batch_size=batch_size)
+    return asyncio.run(go())
+
+
+def test_rejected_input_is_isolated_by_bisecting():
+    def handler(request):
+        inputs = json.loads(request.content)["input"]
+        if "bad" in inputs:
+            return httpx.Response(413, text="input too long")
+        data = [{"index": i, "embedding": [float(len(text))]} for i, text in enumerate(inputs)]
+        return httpx.Response(200, json={"data": data})
+
+    vectors = run_embed(handler, ["a", "bb", "bad", "dddd"])
+    assert vectors == [[1.0], [2.0], None, [4.0]]
+
+
+def test_auth_error_fails_the_batch_without_bisecting():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(401, text="invalid api key")
+
+    assert run_embed(handler, ["a"] * 8) == [None] * 8
+    assert len(calls) == 1
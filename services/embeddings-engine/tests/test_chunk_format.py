@@ -0,0 +1,115 @@
+import io
+import gzip
+import json
+import asyncio
+
+from chunk_format import (ChunkFile, ChunkRecord, chunk_hash, encode_chunk_file, encode_index, index_key,
+                          plan_ranges, stream_key)
+
+
+def records(n):
+    return [ChunkRecord(i, f"chunk {i} " + "text " * (i % 7), page=1 + i // 10, start=i * 100, end=i * 100 + 50)
+            for i in range(n)]
+
+
+def blocks_of(sizes):
+    """Index blocks with the given byte lengths, back to back"""
+    blocks, offset = [], 0
+    for length in sizes:
+        blocks.append({"offset": offset, "length": length})
+        offset += length
+    return blocks
+
+
+class MemoryS3:
+    """get_object over a dict of objects, with Range support; counts requests"""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.ranges = []
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self.objects[Key]
+        if Range:
+            start, end = map(int, Range[len("bytes="):].split("-"))
+            self.ranges.append((start, end))
+            data = data[start:end + 1]
+        return {"Body": io.BytesIO(data)}
+
+
+def test_blocks_are_independent_gzip_members():
+    data, index = encode_chunk_file(records(10), "doc", "a.pdf", "2024-01-01T00:00:00", block_size=4)
+    assert [(b["first"], b["count"]) for b in index["blocks"]] == [(0, 4), (4, 4), (8, 2)]
+    assert sum(b["length"] for b in index["blocks"]) == len(data)
+    block = index["blocks"][1]
+    lines = gzip.decompress(data[block["offset"]:block["offset"] + block["length"]]).decode("utf-8").splitlines()
+    assert [json.loads(line)["i"] for line in lines] == [4, 5, 6, 7]
+    # The whole object is still one valid .gz file
+    assert len(gzip.decompress(data).decode("utf-8").splitlines()) == 10
+
+
+def test_index_holds_hash_and_position_per_chunk():
+    recs = records(3)
+    _, index = encode_chunk_file(recs, "doc", "a.pdf", "2024-01-01T00:00:00")
+    assert index["total_chunks"] == 3 and index["document_id"] == "doc"
+    assert index["chunks"][2] == {"hash": chunk_hash(recs[2].text), "page": 1, "char_start": 200, "char_end": 250}
+
+
+def test_empty_document():
+    data, index = encode_chunk_file([], "doc", "a.pdf", "2024-01-01T00:00:00")
+    assert data == b"" and index["blocks"] == [] and index["total_chunks"] == 0
+
+
+def test_plan_ranges_first_run_is_a_single_block():
+    blocks = blocks_of([100] * 6)
+    assert plan_ranges(blocks, range(6), max_bytes=10_000, max_gap=0) == [(0, 0), (1, 5)]
+
+
+def test_plan_ranges_respects_max_bytes():
+    blocks = blocks_of([100] * 6)
+    assert plan_ranges(blocks, range(6), max_bytes=200, max_gap=0) == [(0, 0), (1, 2), (3, 4), (5, 5)]
+
+
+def test_plan_ranges_bridges_small_gaps_only():
+    blocks = blocks_of([100] * 8)
+    # Block 3 is unwanted but small enough to read along; blocks 4-5 are not
+    assert plan_ranges(blocks, [0, 1, 2, 4, 7], max_bytes=10_000, max_gap=100) == [(0, 0), (1, 4), (7, 7)]
+    assert plan_ranges(blocks, [0, 1, 2, 4], max_bytes=10_000, max_gap=0) == [(0, 0), (1, 2), (4, 4)]
+
+
+def test_plan_ranges_sorts_and_deduplicates():
+    blocks = blocks_of([100] * 4)
+    assert plan_ranges(blocks, [3, 1, 1, 2], max_bytes=10_000, max_gap=0) == [(1, 1), (2, 3)]
+    assert plan_ranges(blocks, [], max_bytes=10_000, max_gap=0) == []
+
+
+def read_records(objects, key, positions, max_bytes=1024):
+    async def go():
+        chunk_file = await ChunkFile(s3, "bucket", key).open()
+        out = [r async for batch in chunk_file.iter_records(positions, max_bytes) for r in batch]
+        return chunk_file, out
+    s3 = MemoryS3(objects)
+    chunk_file, out = asyncio.run(go())
+    return s3, chunk_file, out
+
+
+def test_chunk_file_reads_only_the_wanted_blocks():
+    recs = records(40)
+    data, index = encode_chunk_file(recs, "doc", "a.pdf", "2024-01-01T00:00:00", block_size=4)
+    key = stream_key("doc")
+    s3, chunk_file, out = read_records({key: data, index_key(key): encode_index(index)}, key, [5, 6, 33])
+    assert chunk_file.document_id == "doc"
+    assert chunk_file.hashes == [chunk_hash(r.text) for r in recs]
+    assert out == [recs[5], recs[6], recs[33]]
+    # Blocks 1 and 8 only, not the whole object
+    blocks = index["blocks"]
+    assert s3.ranges == [(blocks[1]["offset"], blocks[1]["offset"] + blocks[1]["length"] - 1),
+                         (blocks[8]["offset"], blocks[8]["offset"] + blocks[8]["length"] - 1)]
+
+
+def test_chunk_file_reads_legacy_json():
+    key = "chunks/doc.json"
+    body = json.dumps({"document_id": "doc", "chunks": ["one", "two", "three"]}).encode("utf-8")
+    s3, chunk_file, out = read_records({key: body}, key, [0, 2])
+    assert chunk_file.hashes == [chunk_hash(t) for t in ("one", "two", "three")]
+    assert [(r.position, r.text) for r in out] == [(0, "one"), (2, "three")]
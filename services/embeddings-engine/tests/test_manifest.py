@@ -0,0 +1,44 @@
+from manifest import chunk_hash, chunk_point_id, diff_chunks
+
+
+def manifest_for(document_id, texts):
+    return {chunk_hash(t): chunk_point_id(document_id, chunk_hash(t)) for t in texts}
+
+
+def test_new_document_adds_everything():
+    hashes = [chunk_hash(t) for t in ("a", "b")]
+    diff = diff_chunks({}, hashes)
+    assert diff.added == {hashes[0]: 0, hashes[1]: 1}
+    assert diff.unchanged == {} and diff.removed == {}
+
+
+def test_unchanged_document_is_a_no_op():
+    previous = manifest_for("doc", ["a", "b"])
+    diff = diff_chunks(previous, [chunk_hash("a"), chunk_hash("b")])
+    assert diff.counts() == {"added": 0, "unchanged": 2, "removed": 0}
+    assert diff.unchanged == previous
+
+
+def test_edited_document():
+    previous = manifest_for("doc", ["a", "b", "c"])
+    hashes = [chunk_hash(t) for t in ("a", "B", "c", "d")]
+    diff = diff_chunks(previous, hashes)
+    assert diff.added == {chunk_hash("B"): 1, chunk_hash("d"): 3}
+    assert set(diff.unchanged) == {chunk_hash("a"), chunk_hash("c")}
+    assert diff.removed == {chunk_hash("b"): previous[chunk_hash("b")]}
+
+
+def test_repeated_chunks_collapse_into_one_point():
+    diff = diff_chunks({}, [chunk_hash("same"), chunk_hash("other"), chunk_hash("same")])
+    assert diff.added == {chunk_hash("same"): 0, chunk_hash("other"): 1}
+
+
+def test_emptied_document_removes_everything():
+    previous = manifest_for("doc", ["a", "b"])
+    assert diff_chunks(previous, []).removed == previous
+
+
+def test_point_ids_are_stable_per_document():
+    h = chunk_hash("text")
+    assert chunk_point_id("doc", h) == chunk_point_id("doc", h)
+    assert chunk_point_id("doc", h) != chunk_point_id("other-doc", h)
@@ -0,0 +1,72 @@
+import struct
+
+import numpy as np
+import pytest
+
+from vector_codec import (DTYPES, PgVector, decode_vector, decode_vector_b64, encode_vector, encode_vector_b64,
+                          vector_headers)
+
+
+@pytest.fixture
+def vector():
+    rng = np.random.default_rng(7)
+    v = rng.standard_normal(384).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_float32_round_trip_is_exact(vector):
+    data, scale = encode_vector(vector, "float32")
+    assert len(data) == 384 * 4 and scale == 1.0
+    np.testing.assert_array_equal(decode_vector(data, "float32", scale), vector)
+
+
+@pytest.mark.parametrize("dtype,size,tolerance", [("float16", 2, 1e-3), ("int8", 1, 1e-2)])
+def test_compact_dtypes_round_trip_closely(vector, dtype, size, tolerance):
+    data, scale = encode_vector(vector, dtype)
+    assert len(data) == 384 * size
+    decoded = decode_vector(data, dtype, scale, dim=384)
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, vector, atol=tolerance)
+    assert float(decoded @ vector) / float(np.linalg.norm(decoded)) == pytest.approx(1.0, abs=1e-3)
+
+
+def test_int8_uses_the_full_range(vector):
+    data, scale = encode_vector(vector, "int8")
+    assert np.abs(np.frombuffer(data, dtype=np.int8)).max() == 127
+    assert scale == pytest.approx(float(np.abs(vector).max()) / 127)
+
+
+def test_int8_zero_vector():
+    data, scale = encode_vector([0.0, 0.0], "int8")
+    assert scale == 1.0
+    np.testing.assert_array_equal(decode_vector(data, "int8", scale), [0.0, 0.0])
+
+
+@pytest.mark.parametrize("dtype", DTYPES)
+def test_base64_round_trip(vector, dtype):
+    text, scale = encode_vector_b64(vector, dtype)
+    data, _ = encode_vector(vector, dtype)
+    np.testing.assert_array_equal(decode_vector_b64(text, dtype, scale), decode_vector(data, dtype, scale))
+
+
+def test_wire_format_is_little_endian():
+    data, _ = encode_vector([1.0], "float32")
+    assert data == struct.pack("<f", 1.0)
+
+
+def test_rejects_unknown_dtype_and_wrong_dim():
+    with pytest.raises(ValueError):
+        encode_vector([1.0], "float64")
+    with pytest.raises(ValueError):
+        decode_vector(b"\x00" * 8, "bfloat16")
+    with pytest.raises(ValueError):
+        decode_vector(b"\x00" * 8, "float32", dim=3)
+
+
+def test_headers():
+    assert vector_headers(384, "int8", 0.5) == {"X-Vector-Dtype": "int8", "X-Vector-Scale": "0.5", "X-Vector-Dim": "384"}
+
+
+def test_pgvector_binary_format():
+    # vector_recv: int16 dim, int16 unused, big-endian float4 values
+    assert PgVector([1.0, -2.0]).data == struct.pack(">HHff", 2, 0, 1.0, -2.0)
@@ -0,0 +1,335 @@
+import os
+import re
+import time
+import queue
+import random
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional
+
+import httpx
+from prometheus_client import Counter, Histogram
+
+# Shared by all three services; keep all copies identical.
+
+# --- Configuration ---
+# Overrides the name passed to start_tracing()
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "")
+# OTLP/HTTP collector, e.g. http://otel-collector:4318; unset = spans only feed the histogram
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+# Share of new traces that are exported; callers that send a traceparent decide for themselves
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+TRACE_EXPORT_BATCH = int(os.getenv("TRACE_EXPORT_BATCH", "512"))
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "5"))
+# Spans waiting for export; beyond this they are dropped rather than slowing requests down
+TRACE_EXPORT_MAX_QUEUE = int(os.getenv("TRACE_EXPORT_MAX_QUEUE", "8192"))
+# Requests to these paths get ids but are never exported (probes and scrapes)
+TRACE_EXCLUDE_PATHS = {p.strip() for p in os.getenv("TRACE_EXCLUDE_PATHS", "/health,/metrics").split(",") if p.strip()}
+
+TRACEPARENT_HEADER = "traceparent"
+REQUEST_ID_HEADER = "X-Request-ID"
+
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+REQUEST_ID_PATTERN = re.compile(r"^[\x21-\x7e]{1,128}$")
+
+# --- Metrics ---
+SPAN_DURATION = Histogram(
+    "span_duration_seconds",
+    "Duration of external calls and processing stages, by span name",
+    ["span", "outcome"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+SPANS_DROPPED = Counter(
+    "trace_spans_dropped_total",
+    "Spans not exported because the export queue was full or the collector failed"
+)
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    trace_id: str  # 32 hex chars
+    span_id: str  # 16 hex chars
+    sampled: bool
+    request_id: str
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+@dataclass
+class Span:
+    name: str
+    context: SpanContext
+    parent_id: Optional[str]
+    kind: int
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    start_ns: int = field(default_factory=time.time_ns)
+    _t0: float = field(default_factory=time.perf_counter)
+
+    def end(self, error: Optional[str] = None, record: bool = True):
+        """Observes the duration and queues the span for export when its trace is sampled"""
+        self.error = error or self.error
+        duration = time.perf_counter() - self._t0
+        if record:
+            SPAN_DURATION.labels(span=self.name, outcome="error" if self.error else "ok").observe(duration)
+        if self.context.sampled and _exporter:
+            _exporter.submit(self, self.start_ns + int(duration * 1e9))
+
+
+_current: ContextVar[Optional[SpanContext]] = ContextVar("trace_context", default=None)
+_exporter: Optional["OtlpExporter"] = None
+
+
+def _new_id(length: int) -> str:
+    # Ids only need to be unique, not unpredictable; getrandbits avoids a syscall per span
+    return f"{random.getrandbits(length * 4) or 1:0{length}x}"
+
+
+def parse_traceparent(value: Optional[str], request_id: Optional[str] = None) -> Optional[SpanContext]:
+    """Remote parent from a W3C traceparent header, None when absent or malformed"""
+    match = TRACEPARENT_PATTERN.match((value or "").strip().lower())
+    if not match or set(match.group(1)) == {"0"} or set(match.group(2)) == {"0"}:
+        return None
+    trace_id, span_id, flags = match.groups()
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1), request_id or trace_id)
+
+
+def current_context() -> Optional[SpanContext]:
+    return _current.get()
+
+
+def current_traceparent() -> Optional[str]:
+    ctx = _current.get()
+    return ctx.traceparent() if ctx else None
+
+
+def current_request_id() -> Optional[str]:
+    ctx = _current.get()
+    return ctx.request_id if ctx else None
+
+
+def start_span(name: str, parent: Optional[SpanContext] = None, kind: int = KIND_INTERNAL, **attributes) -> Span:
+    """Span under `parent` (default: the current one); end() it yourself, it is not made current.
+
+    A client span without any parent (a background flush, a thread without
+    context) is timed but not exported: on its own it is not worth a trace.
+    """
+    parent = parent or _current.get()
+    if parent:
+        ctx = SpanContext(parent.trace_id, _new_id(16), parent.sampled, parent.request_id)
+    else:
+        trace_id = _new_id(32)
+        sampled = kind != KIND_CLIENT and random.random() < TRACE_SAMPLE_RATIO
+        ctx = SpanContext(trace_id, _new_id(16), sampled, trace_id)
+    return Span(name, ctx, parent.span_id if parent else None, kind, attributes)
+
+
+@contextmanager
+def span(name: str, parent: Optional[SpanContext] = None, kind: int = KIND_CLIENT, **attributes):
+    """Times the block as a child of the current span and makes it current meanwhile.
+
+    Works in sync code, in coroutines and in threads started with
+    asyncio.to_thread (which copies the context). Do not wrap a `yield`.
+    """
+    s = start_span(name, parent, kind, **attributes)
+    token = _current.set(s.context)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = s.error or f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+
+class TracingMiddleware:
+    """Gives every request a trace context and echoes its ids in the response.
+
+    Reads `traceparent` and `X-Request-ID` from the caller (or starts a new
+    trace), so the ids follow a document from chunking through the embedding
+    job, and a question through rag-query into the embeddings engine. The
+    request span itself is only exported; HTTP latency is already measured by
+    the instrumentator.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        request_id = headers.get(REQUEST_ID_HEADER.lower(), "")
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = ""
+        parent = parse_traceparent(headers.get(TRACEPARENT_HEADER), request_id)
+        s = start_span(f"{scope.get('method', 'GET')} {scope.get('path', '')}", parent, KIND_SERVER)
+        s.context = replace(s.context, request_id=request_id or s.context.request_id,
+                            sampled=s.context.sampled and scope.get("path") not in TRACE_EXCLUDE_PATHS)
+        status = 500
+
+        async def send_with_ids(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (REQUEST_ID_HEADER.lower().encode(), s.context.request_id.encode()),
+                    (TRACEPARENT_HEADER.encode(), s.context.traceparent().encode()),
+                ]
+            await send(message)
+
+        token = _current.set(s.context)
+        try:
+            await self.app(scope, receive, send_with_ids)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                s.name = f"{scope.get('method', 'GET')} {route.path}"
+            s.attributes.update({"http.status_code": status, "request_id": s.context.request_id})
+            s.end(error=f"HTTP {status}" if status >= 500 else None, record=False)
+
+
+async def inject_headers(request: httpx.Request):
+    """httpx request hook: passes the trace context on to internal services"""
+    ctx = _current.get()
+    if ctx:
+        request.headers.setdefault(TRACEPARENT_HEADER, ctx.traceparent())
+        request.headers.setdefault(REQUEST_ID_HEADER, ctx.request_id)
+
+
+def instrument_boto3(client, prefix: str = "s3"):
+    """Times every API call of a boto3 client as span `<prefix>.<Operation>`.
+
+    Covers the request up to the response headers; reading a streamed body
+    (get_object()["Body"].read()) happens after the span ends. Calls made
+    from threads without a trace context (s3transfer) only feed the histogram.
+    """
+    def before_call(model, context, **kwargs):
+        context["trace_span"] = start_span(f"{prefix}.{model.name}", kind=KIND_CLIENT)
+
+    def after_call(http_response, context, **kwargs):
+        s = context.pop("trace_span", None)
+        if s:
+            s.attributes["http.status_code"] = http_response.status_code
+            s.end(error=f"HTTP {http_response.status_code}" if http_response.status_code >= 300 else None)
+
+    def after_call_error(exception, context, **kwargs):
+        s = context.pop("trace_span", None)
+        if s:
+            s.end(error=f"{type(exception).__name__}: {exception}")
+
+    events = client.meta.events
+    events.register("before-call", before_call)
+    events.register("after-call", after_call)
+    events.register("after-call-error", after_call_error)
+    return client
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(s: Span, end_ns: int) -> Dict[str, Any]:
+    data = {
+        "traceId": s.context.trace_id,
+        "spanId": s.context.span_id,
+        "name": s.name,
+        "kind": s.kind,
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(end_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items() if v is not None],
+        "status": {"code": 2, "message": s.error} if s.error else {},
+    }
+    if s.parent_id:
+        data["parentSpanId"] = s.parent_id
+    return data
+
+
+class OtlpExporter:
+    """Posts finished spans to an OTLP/HTTP collector (JSON encoding) from a background thread.
+
+    Requests never wait on the collector: spans go into a bounded queue that
+    the thread drains every TRACE_EXPORT_INTERVAL seconds, or sooner when a
+    batch is full. Spans that do not fit, or that the collector rejects, are
+    counted in trace_spans_dropped_total.
+    """
+
+    def __init__(self, endpoint: str, service_name: str):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.resource = {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]}
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=TRACE_EXPORT_MAX_QUEUE)
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, s: Span, end_ns: int):
+        try:
+            self._queue.put_nowait(_otlp_span(s, end_ns))
+        except queue.Full:
+            SPANS_DROPPED.inc()
+
+    def shutdown(self, timeout: float = 5.0):
+        """Sends what is queued and stops the thread"""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def _run(self):
+        with httpx.Client(timeout=10) as client:
+            stopping = False
+            while not stopping:
+                batch: List[Dict[str, Any]] = []
+                deadline = time.monotonic() + TRACE_EXPORT_INTERVAL
+                while len(batch) < TRACE_EXPORT_BATCH:
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                if batch:
+                    self._post(client, batch)
+
+    def _post(self, client: httpx.Client, spans: List[Dict[str, Any]]):
+        body = {"resourceSpans": [{"resource": self.resource,
+                                   "scopeSpans": [{"scope": {"name": "faro-rag.tracing"}, "spans": spans}]}]}
+        try:
+            res = client.post(self.url, json=body)
+            if res.status_code >= 400:
+                raise RuntimeError(f"{res.status_code} {res.text[:200]}")
+        except Exception as e:
+            SPANS_DROPPED.inc(len(spans))
+            print(f"Warning: exporting {len(spans)} spans to {self.url} failed: {e}")
+
+
+def start_tracing(service_name: str):
+    """Starts the OTLP exporter when a collector is configured; spans are timed either way"""
+    global _exporter
+    if OTEL_EXPORTER_OTLP_ENDPOINT and _exporter is None:
+        _exporter = OtlpExporter(OTEL_EXPORTER_OTLP_ENDPOINT, OTEL_SERVICE_NAME or service_name)
+        print(f"Exporting traces to {_exporter.url} (sample ratio {TRACE_SAMPLE_RATIO:g})")
+
+
+def stop_tracing():
+    global _exporter
+    if _exporter:
+        exporter, _exporter = _exporter, None
+        exporter.shutdown()
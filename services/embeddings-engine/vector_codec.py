@@ -0,0 +1,93 @@
+import base64
+import struct
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+from psycopg import adapters
+from psycopg.adapt import Dumper
+from psycopg.pq import Format
+
+# Shared with rag-query: keep both copies of this module identical
+
+VECTOR_MEDIA_TYPE = "application/octet-stream"
+# Response headers describing a binary vector body
+DTYPE_HEADER = "X-Vector-Dtype"
+SCALE_HEADER = "X-Vector-Scale"
+DIM_HEADER = "X-Vector-Dim"
+
+DTYPES = ("float32", "float16", "int8")
+# Explicit little-endian so the wire format does not depend on the host
+_WIRE_DTYPES = {"float32": "<f4", "float16": "<f2", "int8": "i1"}
+
+VectorLike = Union[Sequence[float], np.ndarray]
+
+
+def encode_vector(vector: VectorLike, dtype: str = "float32") -> Tuple[bytes, float]:
+    """Packs a vector into raw bytes; returns (data, scale).
+
+    float16 halves the size, int8 quarters it using one symmetric scale per
+    vector (value = int8 * scale). The scale is 1.0 for the float types.
+    """
+    if dtype not in _WIRE_DTYPES:
+        raise ValueError(f"Unknown vector dtype '{dtype}', use one of {', '.join(DTYPES)}")
+    arr = np.asarray(vector, dtype=np.float32)
+    if dtype != "int8":
+        return arr.astype(_WIRE_DTYPES[dtype], copy=False).tobytes(), 1.0
+    peak = float(np.abs(arr).max()) if arr.size else 0.0
+    scale = peak / 127 if peak else 1.0
+    return np.rint(arr / scale).astype(np.int8).tobytes(), scale
+
+
+def decode_vector(data: bytes, dtype: str = "float32", scale: float = 1.0,
+                  dim: Optional[int] = None) -> np.ndarray:
+    """Inverse of encode_vector; always returns float32"""
+    if dtype not in _WIRE_DTYPES:
+        raise ValueError(f"Unknown vector dtype '{dtype}', use one of {', '.join(DTYPES)}")
+    arr = np.frombuffer(data, dtype=_WIRE_DTYPES[dtype])
+    if dim is not None and arr.size != dim:
+        raise ValueError(f"Vector has {arr.size} dimensions, expected {dim}")
+    arr = arr.astype(np.float32)
+    if dtype == "int8":
+        arr *= np.float32(scale)
+    return arr
+
+
+def encode_vector_b64(vector: VectorLike, dtype: str = "float32") -> Tuple[str, float]:
+    data, scale = encode_vector(vector, dtype)
+    return base64.b64encode(data).decode("ascii"), scale
+
+
+def decode_vector_b64(text: str, dtype: str = "float32", scale: float = 1.0,
+                      dim: Optional[int] = None) -> np.ndarray:
+    return decode_vector(base64.b64decode(text), dtype, scale, dim)
+
+
+def vector_headers(dim: int, dtype: str, scale: float) -> dict:
+    return {DTYPE_HEADER: dtype, SCALE_HEADER: repr(scale), DIM_HEADER: str(dim)}
+
+
+# --- pgvector binary parameters ---
+
+class PgVector:
+    """Query parameter sent in pgvector's binary format instead of a text literal.
+
+    Use it with an explicit `::vector` cast or a vector column, so Postgres
+    resolves the parameter type itself and no per-connection type lookup is
+    needed.
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, vector: VectorLike):
+        arr = np.asarray(vector, dtype=">f4")
+        # vector_recv: int16 dim, int16 unused, float4 values, all big-endian
+        self.data = struct.pack(">HH", arr.size, 0) + arr.tobytes()
+
+
+class PgVectorBinaryDumper(Dumper):
+    format = Format.BINARY
+
+    def dump(self, obj: PgVector) -> bytes:
+        return obj.data
+
+
+adapters.register_dumper(PgVector, PgVectorBinaryDumper)
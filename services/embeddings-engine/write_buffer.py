@@ -0,0 +1,191 @@
+import os
+import time
+import asyncio
+from contextlib import suppress
+from typing import Dict, List, Optional, Set
+
+from qdrant_client.http import models
+
+from pools import pg_connection
+from tracing import span
+from vector_codec import PgVector
+
+# --- Configuration ---
+WRITE_BUFFER_SIZE = int(os.getenv("WRITE_BUFFER_SIZE", "256"))
+WRITE_BUFFER_MAX_DELAY = float(os.getenv("WRITE_BUFFER_MAX_DELAY", "2.0"))
+QDRANT_UPSERT_WAIT = os.getenv("QDRANT_UPSERT_WAIT", "true").lower() == "true"
+
+PG_INSERT_SQL = """
+    INSERT INTO embeddings (id, vector, text, source_file) VALUES (%s, %b, %s, %s)
+    ON CONFLICT (id) DO UPDATE
+    SET vector = EXCLUDED.vector, text = EXCLUDED.text, source_file = EXCLUDED.source_file
+"""
+PG_DELETE_SQL = "DELETE FROM embeddings WHERE id = ANY(%s::uuid[])"
+PG_BUMP_GENERATION_SQL = """
+    INSERT INTO ingest_generation (collection, generation) VALUES (%s, 1)
+    ON CONFLICT (collection) DO UPDATE
+    SET generation = ingest_generation.generation + 1, updated_at = now()
+"""
+
+
+class VectorWriteBuffer:
+    """Collects embedded chunks and writes them to Qdrant and Postgres in bulk.
+
+    A flush happens when `max_points` are buffered, when the oldest buffered point
+    is older than `max_delay` seconds, or on close(). Both sinks are written in
+    parallel and `written` keeps the per-sink success counts; ids that did not
+    reach Qdrant are collected in `failed_ids`. Every flush or delete that
+    changed a sink bumps the collection's ingestion generation in Postgres.
+    """
+
+    def __init__(self, q_client, pg_pool, collection: str,
+                 max_points: int = WRITE_BUFFER_SIZE,
+                 max_delay: float = WRITE_BUFFER_MAX_DELAY,
+                 qdrant_wait: bool = QDRANT_UPSERT_WAIT):
+        self.q_client = q_client
+        self.pg_pool = pg_pool
+        self.collection = collection
+        self.max_points = max_points
+        self.max_delay = max_delay
+        self.qdrant_wait = qdrant_wait
+
+        self.written: Dict[str, int] = {"qdrant": 0, "postgres": 0}
+        self.failed_ids: Set[str] = set()
+        self._points: List[dict] = []
+        self._oldest: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+
+    async def __aenter__(self):
+        self._timer = asyncio.create_task(self._flush_on_timeout())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def add(self, point_id: str, vector: List[float], payload: dict):
+        self._points.append({"id": point_id, "vector": vector, "payload": payload})
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if len(self._points) >= self.max_points:
+            await self.flush()
+
+    async def flush(self) -> Dict[str, int]:
+        """Writes everything buffered so far; returns counts for this flush"""
+        async with self._lock:
+            points, self._points = self._points, []
+            self._oldest = None
+            if not points:
+                return {"qdrant": 0, "postgres": 0}
+
+            q_count, pg_count = await asyncio.gather(
+                asyncio.to_thread(self._write_qdrant, points),
+                self._write_postgres(points),
+            )
+            self.written["qdrant"] += q_count
+            self.written["postgres"] += pg_count
+            if q_count or pg_count:
+                await self._bump_generation()
+            print(f"Flushed {len(points)} points (qdrant={q_count}, postgres={pg_count})")
+            return {"qdrant": q_count, "postgres": pg_count}
+
+    async def delete(self, point_ids: List[str]) -> Dict[str, int]:
+        """Removes points from both sinks right away (not buffered)"""
+        if not point_ids:
+            return {"qdrant": 0, "postgres": 0}
+        q_count, pg_count = await asyncio.gather(
+            asyncio.to_thread(self._delete_qdrant, point_ids),
+            self._delete_postgres(point_ids),
+        )
+        if q_count or pg_count:
+            await self._bump_generation()
+        print(f"Deleted {len(point_ids)} points (qdrant={q_count}, postgres={pg_count})")
+        return {"qdrant": q_count, "postgres": pg_count}
+
+    async def close(self):
+        if self._timer:
+            timer, self._timer = self._timer, None
+            # Cancel only between flushes: a flush cut short would lose points it already took
+            async with self._lock:
+                timer.cancel()
+            with suppress(asyncio.CancelledError):
+                await timer
+        await self.flush()
+
+    async def _flush_on_timeout(self):
+        while True:
+            await asyncio.sleep(self.max_delay / 2)
+            if self._oldest is not None and time.monotonic() - self._oldest >= self.max_delay:
+                await self.flush()
+
+    def _write_qdrant(self, points: List[dict]) -> int:
+        if not self.q_client:
+            self.failed_ids.update(p["id"] for p in points)
+            return 0
+        try:
+            with span("qdrant.upsert", points=len(points)):
+                self.q_client.upsert(
+                    collection_name=self.collection,
+                    points=[models.PointStruct(id=p["id"], vector=p["vector"], payload=p["payload"]) for p in points],
+                    wait=self.qdrant_wait,
+                )
+            return len(points)
+        except Exception as e:
+            print(f"Qdrant bulk upsert failed ({len(points)} points): {e}")
+            self.failed_ids.update(p["id"] for p in points)
+            return 0
+
+    def _delete_qdrant(self, point_ids: List[str]) -> int:
+        if not self.q_client:
+            return 0
+        try:
+            with span("qdrant.delete", points=len(point_ids)):
+                self.q_client.delete(
+                    collection_name=self.collection,
+                    points_selector=models.PointIdsList(points=point_ids),
+                    wait=self.qdrant_wait,
+                )
+            return len(point_ids)
+        except Exception as e:
+            print(f"Qdrant delete failed ({len(point_ids)} points): {e}")
+            return 0
+
+    async def _write_postgres(self, points: List[dict]) -> int:
+        if not self.pg_pool:
+            return 0
+        rows = [
+            (p["id"], PgVector(p["vector"]), p["payload"].get("text"), p["payload"].get("source_file"))
+            for p in points
+        ]
+        try:
+            # One transaction (and one commit/fsync) per flush; executemany pipelines the rows
+            with span("postgres.insert", rows=len(rows)):
+                async with pg_connection(self.pg_pool) as conn:
+                    async with conn.transaction():
+                        async with conn.cursor() as cur:
+                            await cur.executemany(PG_INSERT_SQL, rows)
+            return len(rows)
+        except Exception as e:
+            print(f"Postgres bulk insert failed ({len(rows)} rows): {e}")
+            return 0
+
+    async def _delete_postgres(self, point_ids: List[str]) -> int:
+        if not self.pg_pool:
+            return 0
+        try:
+            with span("postgres.delete", rows=len(point_ids)):
+                async with pg_connection(self.pg_pool) as conn:
+                    cur = await conn.execute(PG_DELETE_SQL, (point_ids,))
+            return cur.rowcount
+        except Exception as e:
+            print(f"Postgres delete failed ({len(point_ids)} rows): {e}")
+            return 0
+
+    async def _bump_generation(self):
+        if not self.pg_pool:
+            return
+        try:
+            async with pg_connection(self.pg_pool) as conn:
+                await conn.execute(PG_BUMP_GENERATION_SQL, (self.collection,))
+        except Exception as e:
+            print(f"Bumping the ingestion generation failed, cached answers may be stale: {e}")
@@ -0,0 +1,225 @@
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+
+from prometheus_client import Counter, Gauge, Histogram
+from starlette.responses import JSONResponse
+
+# --- Configuration ---
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_PATHS = {p.strip() for p in os.getenv("ADMISSION_PATHS", "/query,/query/stream").split(",") if p.strip()}
+# Concurrency limit at startup and the range it adapts in
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", "16"))
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "2"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "128"))
+# Longest a request waits for a slot; past it the request is shed with 503 + Retry-After
+ADMISSION_QUEUE_TARGET_MS = int(os.getenv("ADMISSION_QUEUE_TARGET_MS", "500"))
+# Requests waiting beyond this are shed at once
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+# Latency may grow to this multiple of the baseline latency before the limit shrinks
+ADMISSION_TOLERANCE = float(os.getenv("ADMISSION_TOLERANCE", "1.5"))
+# The baseline drops to any faster request at once and rises over about this many slower ones
+ADMISSION_BASELINE_WINDOW = int(os.getenv("ADMISSION_BASELINE_WINDOW", "500"))
+# Limit multiplier after a request failed on a dependency (5xx other than our own 503s)
+ADMISSION_BACKOFF = float(os.getenv("ADMISSION_BACKOFF", "0.9"))
+ADMISSION_RETRY_AFTER_MAX = int(os.getenv("ADMISSION_RETRY_AFTER_MAX", "30"))
+
+# Share of a new limit estimate that is applied per request
+SMOOTHING = 0.2
+
+# --- Metrics ---
+ADMISSION_IN_FLIGHT = Gauge("rag_admission_in_flight", "Admitted requests being processed")
+ADMISSION_QUEUED = Gauge("rag_admission_queued", "Requests waiting for a concurrency slot")
+ADMISSION_LIMIT = Gauge("rag_admission_limit", "Current adaptive concurrency limit")
+ADMISSION_SHED = Counter("rag_admission_shed_total", "Requests rejected with 503 (queue_timeout, queue_full)",
+                         ["reason"])
+ADMISSION_QUEUE_WAIT = Histogram(
+    "rag_admission_queue_wait_seconds",
+    "Time admitted requests waited for a concurrency slot",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Overloaded ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class Permit:
+    admitted_at: float
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that follows the latency of the requests it admits.
+
+    A gradient limiter in the style of Netflix's Gradient2: every completed
+    request compares its latency with a baseline, the latency without
+    queueing in front of the dependencies. While latency stays within
+    ADMISSION_TOLERANCE of it the limit grows by about sqrt(limit), past it
+    the limit shrinks in proportion (at most by half per step). The baseline
+    follows faster requests at once and slower ones gradually, so a
+    dependency that becomes slower for good becomes the new normal. Growth
+    only happens while the limit is actually in use. Requests over
+    the limit wait in FIFO order for at most the queue target and are shed
+    after that, so a slow dependency turns into fast 503s instead of a pile
+    of requests waiting for their timeouts. Single event loop, no locking.
+    """
+
+    def __init__(self, initial: int = ADMISSION_INITIAL_LIMIT, min_limit: int = ADMISSION_MIN_LIMIT,
+                 max_limit: int = ADMISSION_MAX_LIMIT, queue_target: float = ADMISSION_QUEUE_TARGET_MS / 1000,
+                 max_queue: int = ADMISSION_MAX_QUEUE):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.queue_target = queue_target
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.baseline = 0.0
+        self._waiters: deque = deque()
+        ADMISSION_LIMIT.set(int(self.limit))
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained"""
+        if not self.baseline:
+            return 1
+        drain = (len(self._waiters) + 1) * self.baseline / max(int(self.limit), 1)
+        return min(ADMISSION_RETRY_AFTER_MAX, max(1, math.ceil(drain)))
+
+    async def acquire(self) -> Permit:
+        t0 = time.monotonic()
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            ADMISSION_IN_FLIGHT.set(self.in_flight)
+            ADMISSION_QUEUE_WAIT.observe(0)
+            return Permit(admitted_at=t0)
+        if len(self._waiters) >= self.max_queue:
+            ADMISSION_SHED.labels(reason="queue_full").inc()
+            raise Overloaded("queue_full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        ADMISSION_QUEUED.set(len(self._waiters))
+        try:
+            await asyncio.wait_for(waiter, self.queue_target)
+        except asyncio.TimeoutError:
+            if waiter.cancelled():
+                self._remove(waiter)
+                ADMISSION_SHED.labels(reason="queue_timeout").inc()
+                raise Overloaded("queue_timeout", self.retry_after()) from None
+            # The slot was handed over just as the wait ran out; keep it
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            else:
+                self._remove(waiter)
+            raise
+        # _dispatch already counted the slot as in flight
+        now = time.monotonic()
+        ADMISSION_QUEUE_WAIT.observe(now - t0)
+        return Permit(admitted_at=now)
+
+    def release(self, permit: Permit, outcome: str = "ok"):
+        """outcome: ok (latency sample), dropped (failed on a dependency) or ignored (no signal)"""
+        latency = time.monotonic() - permit.admitted_at
+        if outcome == "ok":
+            self._on_sample(latency)
+        elif outcome == "dropped":
+            self._set_limit(self.limit * ADMISSION_BACKOFF)
+        self._release_slot()
+
+    def _on_sample(self, latency: float):
+        if latency <= 0:
+            return
+        if not self.baseline or latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline += (latency - self.baseline) / ADMISSION_BASELINE_WINDOW
+        # Limit not in use: latency says nothing about whether more concurrency would fit
+        if self.in_flight < self.limit / 2:
+            return
+        gradient = max(0.5, min(1.0, ADMISSION_TOLERANCE * self.baseline / latency))
+        estimate = self.limit * gradient + math.sqrt(self.limit)
+        self._set_limit(self.limit * (1 - SMOOTHING) + estimate * SMOOTHING)
+
+    def _set_limit(self, limit: float):
+        self.limit = float(min(max(limit, self.min_limit), self.max_limit))
+        ADMISSION_LIMIT.set(int(self.limit))
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        self._dispatch()
+        ADMISSION_IN_FLIGHT.set(self.in_flight)
+
+    def _dispatch(self):
+        """Hands free slots to waiting requests, oldest first"""
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            waiter.set_result(None)
+            self.in_flight += 1
+        ADMISSION_QUEUED.set(len(self._waiters))
+
+    def _remove(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        ADMISSION_QUEUED.set(len(self._waiters))
+
+
+def response_outcome(status: int) -> str:
+    """Limiter outcome of a finished request: fast client errors and our own 503s carry no latency signal"""
+    if status == 503 or 400 <= status < 500:
+        return "ignored"
+    return "dropped" if status >= 500 else "ok"
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware: requests to ADMISSION_PATHS hold a limiter slot until
+    their response has been sent, streamed responses included.
+
+    503 responses (shed requests, open circuits) are not latency samples; other
+    5xx responses and unhandled errors shrink the limit.
+    """
+
+    def __init__(self, app, limiter: AdaptiveLimiter, paths=ADMISSION_PATHS):
+        self.app = app
+        self.limiter = limiter
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if not ADMISSION_ENABLED or scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        try:
+            permit = await self.limiter.acquire()
+        except Overloaded as e:
+            response = JSONResponse({"detail": "Server overloaded, retry later"}, status_code=503,
+                                    headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        outcome = "dropped"
+        try:
+            await self.app(scope, receive, send_wrapper)
+            outcome = response_outcome(status)
+        except asyncio.CancelledError:
+            outcome = "ignored"
+            raise
+        finally:
+            self.limiter.release(permit, outcome)
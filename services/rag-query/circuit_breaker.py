@@ -0,0 +1,148 @@
+import os
+import math
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from prometheus_client import Counter, Gauge
+
+# --- Configuration ---
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() == "true"
+# Consecutive failed calls (errors, timeouts, 5xx/429 answers) that open a circuit
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+# How long an open circuit fails fast before trial calls are let through (half-open)
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "15"))
+# Trial calls in half-open; all of them must succeed to close the circuit, one failure reopens it
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# --- Metrics ---
+CIRCUIT_STATE = Gauge("rag_circuit_state", "Circuit state per dependency (0 closed, 1 half-open, 2 open)",
+                      ["dependency"])
+CIRCUIT_OPENED = Counter("rag_circuit_opened_total", "Times a dependency's circuit opened", ["dependency"])
+CIRCUIT_REJECTED = Counter("rag_circuit_rejected_total", "Calls failed fast because the circuit was open",
+                           ["dependency"])
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+    def __init__(self, dependency: str, retry_after: int):
+        super().__init__(f"{dependency} unavailable (circuit open)")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+@dataclass
+class BreakerCall:
+    """One guarded call. Set `failed` to classify the outcome yourself: a bad answer that raises
+    no exception, or an exception the block raises that is not the dependency's fault"""
+    generation: int
+    trial: bool
+    failed: Optional[bool] = None
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker around one dependency.
+
+    Single event loop, so no locking. Calls admitted before a state change
+    report into the generation they started in and are ignored afterwards,
+    so a slow call that started while closed cannot close a circuit that
+    opened in the meantime.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 open_seconds: float = BREAKER_OPEN_SECONDS, half_open_calls: int = BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = CLOSED
+        self._generation = 0
+        self._trials = 0
+        self._successes = 0
+        CIRCUIT_STATE.labels(dependency=name).set(STATE_VALUES[CLOSED])
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def retry_after(self) -> int:
+        """Whole seconds until trial calls are let through again"""
+        remaining = self.open_seconds - (time.monotonic() - self.opened_at)
+        return max(1, math.ceil(remaining))
+
+    @contextmanager
+    def guard(self) -> Iterator[BreakerCall]:
+        """Runs the block as a call to the dependency; raises CircuitOpenError when it may not run.
+
+        Exceptions from the block count as failures unless `failed` was set to False;
+        cancellation counts as nothing.
+        """
+        call = self._admit()
+        if call is None:
+            CIRCUIT_REJECTED.labels(dependency=self.name).inc()
+            raise CircuitOpenError(self.name, self.retry_after())
+        try:
+            yield call
+        except Exception:
+            self._record(call, failed=call.failed is not False)
+            raise
+        except BaseException:
+            self._release(call)
+            raise
+        self._record(call, failed=bool(call.failed))
+
+    def _admit(self) -> Optional[BreakerCall]:
+        if not BREAKER_ENABLED:
+            return BreakerCall(generation=-1, trial=False)
+        state = self.state
+        if state == CLOSED:
+            return BreakerCall(generation=self._generation, trial=False)
+        if state == HALF_OPEN and self._trials < self.half_open_calls:
+            self._trials += 1
+            return BreakerCall(generation=self._generation, trial=True)
+        return None
+
+    def _record(self, call: BreakerCall, failed: bool):
+        if call.generation != self._generation:
+            return
+        if call.trial:
+            self._trials -= 1
+            if failed:
+                self._open("a failed trial call")
+            else:
+                self._successes += 1
+                if self._successes >= self.half_open_calls:
+                    self._set_state(CLOSED)
+        elif self._state == CLOSED:
+            self.failures = self.failures + 1 if failed else 0
+            if self.failures >= self.failure_threshold:
+                self._open(f"{self.failures} consecutive failures")
+
+    def _release(self, call: BreakerCall):
+        if call.trial and call.generation == self._generation:
+            self._trials -= 1
+
+    def _open(self, reason: str):
+        print(f"WARNING: Circuit for {self.name} opened after {reason}, failing fast for {self.open_seconds:g}s")
+        self.opened_at = time.monotonic()
+        CIRCUIT_OPENED.labels(dependency=self.name).inc()
+        self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        if state == CLOSED and self._state != CLOSED:
+            print(f"INFO: Circuit for {self.name} closed")
+        self._state = state
+        self._generation += 1
+        self._trials = 0
+        self._successes = 0
+        self.failures = 0
+        CIRCUIT_STATE.labels(dependency=self.name).set(STATE_VALUES[state])
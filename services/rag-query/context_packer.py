@@ -0,0 +1,243 @@
+import os
+import re
+import math
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from prometheus_client import Counter, Histogram
+
+# --- Configuration ---
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3500"))
+# 1.0 = order by retrieval score only; lower values trade relevance for diversity (MMR)
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "1.0"))
+# A chunk that does not fit is truncated into the remaining budget if at least this many tokens are left
+CONTEXT_MIN_PARTIAL_TOKENS = int(os.getenv("CONTEXT_MIN_PARTIAL_TOKENS", "48"))
+# Shortest suffix/prefix match that counts as the overlap between two neighbouring chunks
+CONTEXT_MIN_OVERLAP_CHARS = int(os.getenv("CONTEXT_MIN_OVERLAP_CHARS", "20"))
+# tiktoken encoding (o200k_base = gpt-4o family); falls back to an estimate when unavailable
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "o200k_base")
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "4"))
+
+# Overlap is bounded by the chunker's CHUNK_OVERLAP (200); leave room for larger settings
+MAX_OVERLAP_CHARS = 2000
+PASSAGE_PREFIX = "Content: "
+PASSAGE_SEPARATOR = "\n\n---\n\n"
+
+# --- Metrics ---
+CONTEXT_TOKENS = Histogram(
+    "rag_context_tokens",
+    "Tokens in the packed LLM context",
+    buckets=(128, 256, 512, 1024, 1536, 2048, 3072, 4096, 6144, 8192, 16384)
+)
+CONTEXT_CHUNKS = Counter(
+    "rag_context_chunks_total",
+    "Retrieved chunks by packing outcome (packed, merged, duplicate, truncated, over_budget)",
+    ["outcome"]
+)
+CONTEXT_TOKENS_SAVED = Counter(
+    "rag_context_overlap_tokens_saved_total",
+    "Tokens not sent to the LLM because overlapping chunk text was merged"
+)
+
+
+class TokenCounter:
+    """Counts and truncates in LLM tokens; tiktoken when its encoding loads, else chars / N"""
+
+    def __init__(self, encoding: str = CONTEXT_TOKENIZER, chars_per_token: float = CONTEXT_CHARS_PER_TOKEN):
+        self.chars_per_token = chars_per_token
+        self._encoding = None
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(encoding)
+            self.name = encoding
+        except Exception as e:
+            # Missing package, or the encoding file could not be downloaded
+            print(f"WARNING: tiktoken encoding '{encoding}' unavailable, estimating tokens: {e}")
+            self.name = f"estimate({chars_per_token:g} chars/token)"
+
+    def count(self, text: str) -> int:
+        if self._encoding:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix within max_tokens, cut back to the last whitespace so no word is split"""
+        if max_tokens <= 0:
+            return ""
+        if self._encoding:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return text
+            cut = self._encoding.decode(tokens[:max_tokens])
+        else:
+            limit = int(max_tokens * self.chars_per_token)
+            if len(text) <= limit:
+                return text
+            cut = text[:limit]
+        space = cut.rfind(" ")
+        return cut[:space] if space > len(cut) // 2 else cut
+
+
+@dataclass
+class Candidate:
+    chunk_id: str
+    text: str
+    score: float
+    document_id: Optional[str] = None
+
+
+@dataclass
+class Passage:
+    """One or more chunks of the same document, merged on their overlap"""
+    document_id: Optional[str]
+    text: str
+    chunk_ids: List[str] = field(default_factory=list)
+    tokens: int = 0
+    truncated: bool = False
+
+
+@dataclass
+class PackedContext:
+    context: str
+    tokens: int
+    chunk_ids: List[str]
+    stats: Dict[str, int]
+
+
+def find_overlap(left: str, right: str, min_chars: int = CONTEXT_MIN_OVERLAP_CHARS) -> int:
+    """Length of the longest suffix of `left` that is also a prefix of `right` (0 below min_chars)"""
+    tail = left[-MAX_OVERLAP_CHARS:]
+    probe = right[:min_chars]
+    if len(probe) < min_chars:
+        return 0
+    # The earliest match in the tail is the longest overlap
+    pos = tail.find(probe)
+    while pos != -1:
+        if right.startswith(tail[pos:]):
+            return len(tail) - pos
+        pos = tail.find(probe, pos + 1)
+    return 0
+
+
+def _words(text: str) -> frozenset:
+    return frozenset(re.findall(r"\w+", text.lower()))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def mmr_order(candidates: Sequence[Candidate], mmr_lambda: float) -> List[Candidate]:
+    """Maximal marginal relevance over word-set similarity of the chunk texts.
+
+    Chunk vectors are not fetched from Qdrant, so similarity between chunks is
+    lexical; relevance is the retrieval score normalized to the best hit.
+    """
+    if mmr_lambda >= 1.0 or len(candidates) < 3:
+        return list(candidates)
+    top = max(c.score for c in candidates) or 1.0
+    words = [_words(c.text) for c in candidates]
+    remaining = list(range(len(candidates)))
+    chosen: List[int] = []
+    while remaining:
+        def gain(i: int) -> float:
+            redundancy = max((_jaccard(words[i], words[j]) for j in chosen), default=0.0)
+            return mmr_lambda * candidates[i].score / top - (1 - mmr_lambda) * redundancy
+        best = max(remaining, key=gain)
+        chosen.append(best)
+        remaining.remove(best)
+    return [candidates[i] for i in chosen]
+
+
+def _render(passages: Sequence[Passage]) -> str:
+    return PASSAGE_SEPARATOR.join(PASSAGE_PREFIX + p.text for p in passages)
+
+
+def pack_context(candidates: Sequence[Candidate], counter: TokenCounter,
+                 budget: int = CONTEXT_TOKEN_BUDGET, mmr_lambda: float = CONTEXT_MMR_LAMBDA) -> PackedContext:
+    """Fills `budget` tokens with the best chunks, in rank order.
+
+    Exact duplicates are dropped, chunks that overlap a chunk of the same
+    document already packed are merged into it (only the new text costs
+    tokens), and the first chunk that no longer fits is truncated into the
+    remaining budget. Later, smaller chunks may still fill what is left.
+    """
+    stats = {"packed": 0, "merged": 0, "duplicate": 0, "truncated": 0, "over_budget": 0, "overlap_tokens_saved": 0}
+    passages: List[Passage] = []
+    seen = set()
+    prefix_tokens = counter.count(PASSAGE_PREFIX)
+    separator_tokens = counter.count(PASSAGE_SEPARATOR)
+    used = 0
+
+    for cand in mmr_order(candidates, mmr_lambda):
+        text = cand.text.strip()
+        digest = hashlib.sha1(" ".join(text.split()).encode("utf-8")).digest()
+        if not text or digest in seen or any(text in p.text for p in passages):
+            stats["duplicate"] += 1
+            continue
+        seen.add(digest)
+        remaining = budget - used
+
+        # Neighbouring chunk of an already packed passage: only pay for the new text
+        neighbour = None
+        for p in passages:
+            if p.truncated or p.document_id is None or p.document_id != cand.document_id:
+                continue
+            after = find_overlap(p.text, text)
+            before = 0 if after else find_overlap(text, p.text)
+            if after or before:
+                neighbour = p
+                break
+        if neighbour:
+            p = neighbour
+            new_text = p.text + text[after:] if after else text[:len(text) - before] + p.text
+            new_tokens = counter.count(new_text)
+            if new_tokens - p.tokens <= remaining:
+                stats["merged"] += 1
+                stats["overlap_tokens_saved"] += max(counter.count(text) - (new_tokens - p.tokens), 0)
+            elif after and remaining >= CONTEXT_MIN_PARTIAL_TOKENS:
+                # Continue the passage with as much of the new text as fits
+                new_text = p.text + counter.truncate(text[after:], remaining)
+                new_tokens = counter.count(new_text)
+                p.truncated = True
+                stats["truncated"] += 1
+            else:
+                stats["over_budget"] += 1
+                continue
+            used += new_tokens - p.tokens
+            p.text, p.tokens = new_text, new_tokens
+            p.chunk_ids.append(cand.chunk_id)
+            continue
+
+        overhead = prefix_tokens + (separator_tokens if passages else 0)
+        tokens = counter.count(text)
+        if overhead + tokens <= remaining:
+            passages.append(Passage(cand.document_id, text, [cand.chunk_id], tokens))
+            used += overhead + tokens
+            stats["packed"] += 1
+        elif remaining - overhead >= CONTEXT_MIN_PARTIAL_TOKENS:
+            part = counter.truncate(text, remaining - overhead)
+            part_tokens = counter.count(part)
+            passages.append(Passage(cand.document_id, part, [cand.chunk_id], part_tokens, truncated=True))
+            used += overhead + part_tokens
+            stats["truncated"] += 1
+        else:
+            stats["over_budget"] += 1
+
+    context = _render(passages)
+    tokens = counter.count(context) if passages else 0
+    # Token counts of the parts can differ slightly from the joined text; trim the last passage if needed
+    if tokens > budget and passages:
+        last = passages[-1]
+        last.text = counter.truncate(last.text, max(last.tokens - (tokens - budget), 0))
+        context = _render(passages)
+        tokens = counter.count(context)
+
+    for outcome in ("packed", "merged", "duplicate", "truncated", "over_budget"):
+        if stats[outcome]:
+            CONTEXT_CHUNKS.labels(outcome=outcome).inc(stats[outcome])
+    CONTEXT_TOKENS_SAVED.inc(stats["overlap_tokens_saved"])
+    CONTEXT_TOKENS.observe(tokens)
+    return PackedContext(context=context, tokens=tokens,
+                         chunk_ids=[cid for p in passages for cid in p.chunk_ids], stats=stats)
@@ -0,0 +1,151 @@
+import os
+import re
+import time
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from pools import pg_connection
+from tracing import span
+
+# --- Configuration ---
+HYBRID_ENABLED = os.getenv("HYBRID_ENABLED", "true").lower() == "true"
+# Each leg returns top_k * HYBRID_DEPTH_FACTOR candidates before fusion
+HYBRID_DEPTH_FACTOR = int(os.getenv("HYBRID_DEPTH_FACTOR", "3"))
+# RRF constant; larger values flatten the difference between the top ranks
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Text search configuration of the `tsv` column; must match the embeddings-engine
+PG_TS_CONFIG = os.getenv("PG_TS_CONFIG", "english")
+# Budget for the lexical leg (pool wait + statement); past it the query uses dense results only
+LEXICAL_TIMEOUT_MS = int(os.getenv("LEXICAL_TIMEOUT_MS", "250"))
+# Terms found in more than this share of chunks are left out of lexical queries (they
+# match nearly everything and carry no signal, the IDF cut-off of BM25)
+LEXICAL_MAX_DF = float(os.getenv("LEXICAL_MAX_DF", "0.25"))
+# Document frequencies are estimated from a sample of this many chunks, refreshed every TTL seconds
+LEXICAL_STATS_SAMPLE = int(os.getenv("LEXICAL_STATS_SAMPLE", "5000"))
+LEXICAL_STATS_TTL = float(os.getenv("LEXICAL_STATS_TTL", "600"))
+
+if not re.fullmatch(r"[a-z_]+", PG_TS_CONFIG):
+    raise ValueError(f"Invalid PG_TS_CONFIG '{PG_TS_CONFIG}'")
+
+# Any remaining term is enough (OR); plainto_tsquery would require every term of the question.
+# No terms left gives a NULL query, which matches nothing.
+LEXICAL_SQL = f"""
+    SELECT id, text, source_file, ts_rank_cd(tsv, q, 1) AS rank
+    FROM embeddings, (
+        SELECT string_agg(quote_literal(lexeme), ' | ')::tsquery AS q
+        FROM unnest(tsvector_to_array(to_tsvector('{PG_TS_CONFIG}', %s))) AS lexeme
+        WHERE NOT lexeme = ANY(%s)
+    ) AS query
+    WHERE tsv @@ q
+    ORDER BY rank DESC
+    LIMIT %s
+"""
+COMMON_TERMS_SQL = """
+    WITH sample AS (SELECT tsv FROM embeddings TABLESAMPLE SYSTEM (%s))
+    SELECT lexeme FROM sample, unnest(tsvector_to_array(tsv)) AS lexeme
+    GROUP BY lexeme
+    HAVING count(*) > %s * (SELECT count(*) FROM sample)
+"""
+
+# --- Metrics ---
+RETRIEVAL_LEG_LATENCY = Histogram(
+    "rag_retrieval_leg_seconds",
+    "Latency per retrieval leg (dense, lexical, fusion)",
+    ["leg"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+RETRIEVAL_LEG_FAILURES = Counter(
+    "rag_retrieval_leg_failures_total",
+    "Retrieval legs that failed or ran out of time; the query continues without them",
+    ["leg"]
+)
+COMMON_TERMS = Gauge("rag_lexical_common_terms", "Terms currently excluded from lexical queries")
+
+
+@dataclass
+class Hit:
+    """Search hit shaped like a Qdrant ScoredPoint (id, score, payload)"""
+    id: str
+    score: float
+    payload: Dict[str, Any] = field(default_factory=dict)
+
+
+class LexicalSearcher:
+    """Full-text search over the `tsv` column the embeddings-engine maintains.
+
+    Keeps a set of overly common terms, estimated from a table sample in the
+    background, and leaves those out of every query.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.common_terms: List[str] = []
+        self._stats_at = 0.0
+        self._refresh: Optional[asyncio.Task] = None
+
+    async def search(self, question: str, limit: int) -> Optional[Tuple[List[Hit], float]]:
+        """Returns (hits, latency) or None on failure"""
+        self._maybe_refresh()
+        t0 = time.time()
+        try:
+            with span("postgres.lexical_search", limit=limit):
+                async with pg_connection(self.pool, timeout=LEXICAL_TIMEOUT_MS / 1000) as conn:
+                    async with conn.transaction(), conn.cursor() as cur:
+                        await cur.execute("SELECT set_config('statement_timeout', %s, true)", (str(LEXICAL_TIMEOUT_MS),))
+                        await cur.execute(LEXICAL_SQL, (question, self.common_terms, limit))
+                        rows = await cur.fetchall()
+        except Exception as e:
+            print(f"WARNING: Lexical search failed: {e}")
+            RETRIEVAL_LEG_FAILURES.labels(leg="lexical").inc()
+            return None
+        latency = time.time() - t0
+        RETRIEVAL_LEG_LATENCY.labels(leg="lexical").observe(latency)
+        hits = [Hit(id=str(row[0]), score=float(row[3]), payload={"text": row[1], "source_file": row[2]})
+                for row in rows]
+        return hits, latency
+
+    def _maybe_refresh(self):
+        if time.time() - self._stats_at < LEXICAL_STATS_TTL:
+            return
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self.refresh_common_terms())
+
+    async def refresh_common_terms(self):
+        self._stats_at = time.time()
+        try:
+            async with pg_connection(self.pool) as conn:
+                cur = await conn.execute("SELECT reltuples FROM pg_class WHERE relname = 'embeddings'")
+                row = await cur.fetchone()
+                # reltuples is -1 before the first ANALYZE; sample everything then
+                rows = row[0] if row and row[0] > 0 else 0
+                percent = min(100.0, 100.0 * LEXICAL_STATS_SAMPLE / rows) if rows else 100.0
+                cur = await conn.execute(COMMON_TERMS_SQL, (percent, LEXICAL_MAX_DF))
+                self.common_terms = [r[0] for r in await cur.fetchall()]
+            COMMON_TERMS.set(len(self.common_terms))
+        except Exception as e:
+            print(f"WARNING: Could not refresh lexical term statistics: {e}")
+
+    async def stop(self):
+        if self._refresh:
+            self._refresh.cancel()
+            await asyncio.gather(self._refresh, return_exceptions=True)
+
+
+def rrf_fuse(rankings: Sequence[Sequence[Any]], limit: int, k: int = RRF_K) -> List[Hit]:
+    """Reciprocal rank fusion: score = sum over legs of 1 / (k + rank).
+
+    Each ranking is a list of hits (anything with id and payload) in rank
+    order. The payload of the first leg that returned a document is kept.
+    """
+    scores: Dict[str, float] = {}
+    payloads: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            doc_id = str(hit.id)
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+            payloads.setdefault(doc_id, hit.payload or {})
+    ordered = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [Hit(id=doc_id, score=score, payload=payloads[doc_id]) for doc_id, score in ordered]
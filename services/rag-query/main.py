@@ -1,44 +1,148 @@
 import os
+import json
 import time
-from typing import Any, Dict, List, Optional
-import psycopg2
-from prometheus_client import make_asgi_app, Histogram, Gauge
+import asyncio
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from prometheus_client import Counter, Histogram
 
 import boto3
+from botocore.config import Config as BotoConfig
 import httpx
-from fastapi import FastAPI, HTTPException
+import numpy as np
+import psycopg
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http import models
 from prometheus_fastapi_instrumentator import Instrumentator
 
+from pools import create_pg_pool, create_http_client, pg_connection
+from shadow import ShadowEvaluator, SHADOW_ENABLED
+from semantic_cache import SemanticCache, CachedAnswer, SEMANTIC_CACHE_ENABLED
+from context_packer import Candidate, TokenCounter, pack_context, CONTEXT_TOKEN_BUDGET, CONTEXT_MMR_LAMBDA
+from reranker import Reranker, load_scorer, rerank_order, RERANK_ENABLED, RERANK_OVERFETCH, RERANK_BUDGET_MS
+from hybrid import Hit, LexicalSearcher, rrf_fuse, HYBRID_ENABLED, HYBRID_DEPTH_FACTOR, RETRIEVAL_LEG_LATENCY
+from s3_text_cache import S3TextCache, s3_ref_from_payload
+from tracing import (KIND_CLIENT, KIND_INTERNAL, TracingMiddleware, instrument_boto3, span, start_span,
+                     start_tracing, stop_tracing)
+from profiler import profile_response
+from admission import AdaptiveLimiter, AdmissionMiddleware
+from circuit_breaker import CircuitBreaker, CircuitOpenError, OPEN
+from vector_codec import (VECTOR_MEDIA_TYPE, DTYPE_HEADER, SCALE_HEADER, DIM_HEADER, PgVector,
+                          decode_vector, decode_vector_b64)
+
 APP_NAME = "rag-query"
 
 # Dependencies
 EMBEDDINGS_ENGINE_URL = os.getenv("EMBEDDINGS_ENGINE_URL", "http://localhost:8001")
 EMBEDDINGS_ENDPOINT = os.getenv("EMBEDDINGS_ENDPOINT", "/embed")
+# binary = raw octet-stream body, base64 = packed vector inside JSON, json = float list
+EMBED_TRANSPORT = os.getenv("EMBED_TRANSPORT", "binary").lower()
+# float32 | float16 | int8 (lossy, smaller on the wire)
+EMBED_TRANSPORT_DTYPE = os.getenv("EMBED_TRANSPORT_DTYPE", "float32").lower()
+# Timeouts count as failures for the circuit breakers; lower them to fail over sooner
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "30"))
 
 QDRANT_URL = os.getenv("QDRANT_URL", "http://10.0.11.10:6333")
 QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "faro_docs")
+# How long the ingestion generation (the semantic cache's collection version) is trusted before reading it again
+COLLECTION_VERSION_TTL = float(os.getenv("COLLECTION_VERSION_TTL", "5"))
+# Qdrant search defaults, overridable per query. 0 = Qdrant's default (ef_construct of the collection)
+QDRANT_HNSW_EF = int(os.getenv("QDRANT_HNSW_EF", "0"))
+# Quantized collections (QDRANT_PROFILE in the embeddings-engine) only: candidates fetched with the
+# quantized vectors = limit * oversampling, rescored with the original vectors. Ignored otherwise.
+QDRANT_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", "2.0"))
+QDRANT_RESCORE = os.getenv("QDRANT_RESCORE", "true").lower() == "true"
 
 # S3 Config
 S3_BUCKET = os.getenv("S3_BUCKET", "")
 AWS_REGION = os.getenv("AWS_REGION", "eu-central-1")
-s3 = boto3.client("s3", region_name=AWS_REGION) if S3_BUCKET else None
+# boto3 is blocking; S3 reads run on a bounded thread pool instead of the event loop
+S3_MAX_WORKERS = int(os.getenv("S3_MAX_WORKERS", "16"))
+s3_executor = ThreadPoolExecutor(max_workers=S3_MAX_WORKERS, thread_name_prefix="s3")
+# One HTTP connection per worker thread (botocore defaults to 10)
+s3 = instrument_boto3(boto3.client("s3", region_name=AWS_REGION,
+                                   config=BotoConfig(max_pool_connections=S3_MAX_WORKERS))) if S3_BUCKET else None
+s3_text_cache = S3TextCache(s3, S3_BUCKET, s3_executor) if s3 else None
 
 # LLM Config
 LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.openai.com/v1")
 LLM_API_KEY = os.getenv("LLM_API_KEY", "")
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+# Postgres Config
+PG_HOST = os.getenv("PG_HOST")
+PG_DB = os.getenv("PG_DB")
+PG_USER = os.getenv("PG_USER")
+PG_PASSWORD = os.getenv("PG_PASSWORD")
+# pgvector search defaults, overridable per query (hnsw.ef_search must be >= top_k)
+PG_EF_SEARCH = int(os.getenv("PG_EF_SEARCH", "100"))
+PG_IVFFLAT_PROBES = int(os.getenv("PG_IVFFLAT_PROBES", "10"))
 
 app = FastAPI(title=APP_NAME)
+# Inside the tracing middleware, so shed requests keep their request id and span
+limiter = AdaptiveLimiter()
+app.add_middleware(AdmissionMiddleware, limiter=limiter)
+app.add_middleware(TracingMiddleware)
 
 Instrumentator().instrument(app).expose(app)
 
+# Created at startup, closed at shutdown
+pg_pool = None
+embed_client: Optional[httpx.AsyncClient] = None
+llm_client: Optional[httpx.AsyncClient] = None
+shadow_evaluator: Optional[ShadowEvaluator] = None
+lexical_searcher: Optional[LexicalSearcher] = None
+reranker: Optional[Reranker] = None
+
 @app.on_event("startup")
 async def startup():
-    
-    pass
-    
+    global pg_pool, embed_client, llm_client, shadow_evaluator, lexical_searcher, reranker
+    start_tracing(APP_NAME)
+    # The embeddings engine continues our traces; the LLM provider gets no internal ids
+    embed_client = create_http_client(timeout=EMBED_TIMEOUT, propagate=True)
+    llm_client = create_http_client(timeout=LLM_TIMEOUT)
+    pg_pool = create_pg_pool(PG_HOST, PG_DB, PG_USER, PG_PASSWORD)
+    if pg_pool:
+        # Connections are established in the background; requests wait up to PG_POOL_TIMEOUT
+        await pg_pool.open()
+        if SHADOW_ENABLED:
+            shadow_evaluator = ShadowEvaluator(search_postgres_shadow, SEARCH_LATENCY.labels(database="postgres"))
+            shadow_evaluator.start()
+        lexical_searcher = LexicalSearcher(pg_pool)
+    elif semantic_cache:
+        print("WARNING: Semantic cache inactive: answers are validated against the ingestion generation in Postgres (PG_HOST)")
+    if RERANK_ENABLED:
+        # A backend that cannot be loaded is a configuration error: fail the startup
+        reranker = Reranker(load_scorer())
+        try:
+            await reranker.warm_up()
+        except Exception as e:
+            # Backend not reachable yet; until it is, candidates keep their retrieval order
+            print(f"WARNING: Reranker warm-up failed: {e}")
+        reranker.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    if shadow_evaluator:
+        await shadow_evaluator.stop()
+    if lexical_searcher:
+        await lexical_searcher.stop()
+    if reranker:
+        await reranker.stop()
+    for client in (embed_client, llm_client):
+        if client:
+            await client.aclose()
+    if pg_pool:
+        await pg_pool.close()
+    await qdrant.close()
+    s3_executor.shutdown(wait=False)
+    stop_tracing()
+
 # Histogram for Speed (Latency)
 SEARCH_LATENCY = Histogram(
     "rag_search_latency_seconds",
@@ -46,18 +150,53 @@ SEARCH_LATENCY = Histogram(
     ["database"] # Label: 'qdrant' or 'postgres'
 )
 
-# Gauge for Accuracy Proxy (Overlap)
-SEARCH_OVERLAP = Gauge(
-    "rag_search_overlap_ratio",
-    "Percentage of result overlap between Qdrant and Postgres (0.0 to 1.0)"
+# Histogram for Time-To-First-Token on /query/stream (request start -> first answer token)
+TTFT_LATENCY = Histogram(
+    "rag_query_ttft_seconds",
+    "Time from receiving a streaming query to sending the first answer token",
+    buckets=(0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 7.5, 10, 20, 30)
+)
+
+DEGRADED_RESPONSES = Counter(
+    "rag_degraded_responses_total",
+    "Answers produced without a dependency whose circuit was open or that failed",
+    ["dependency"]  # llm = retrieval-only answer, qdrant = full-text only, postgres = dense only
 )
 
-qdrant = QdrantClient(url=QDRANT_URL)
+qdrant = AsyncQdrantClient(url=QDRANT_URL)
+
+# One circuit per dependency: embeddings and qdrant fail the query fast (503), an open llm circuit
+# gives retrieval-only answers, an open postgres circuit skips the lexical leg and shadow search
+breakers = {name: CircuitBreaker(name) for name in ("embeddings", "llm", "qdrant", "postgres")}
+
+semantic_cache = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
+token_counter = TokenCounter()
+_collection_version = (None, 0.0)
+# Written by the embeddings-engine (write_buffer.py)
+INGEST_GENERATION_SQL = "SELECT generation FROM ingest_generation WHERE collection = %s"
+
+
+class PgSearchParams(BaseModel):
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)  # HNSW candidate list size
+    probes: Optional[int] = Field(None, ge=1, le=1000)  # IVFFlat lists scanned
+
+
+class QdrantSearchParams(BaseModel):
+    hnsw_ef: Optional[int] = Field(None, ge=1, le=4096)  # HNSW candidate list size
+    oversampling: Optional[float] = Field(None, ge=1.0, le=16.0)  # quantized collections only
+    rescore: Optional[bool] = None  # rescore quantized candidates with the original vectors
 
 
 class QueryRequest(BaseModel):
     question: str = Field(..., min_length=3, max_length=2000)
     top_k: int = Field(5, ge=1, le=20)
+    pg_search: Optional[PgSearchParams] = None
+    qdrant_search: Optional[QdrantSearchParams] = None
+    hybrid: Optional[bool] = None  # dense + lexical with rank fusion; None = HYBRID_ENABLED
+    context_tokens: Optional[int] = Field(None, ge=128, le=32000)  # None = CONTEXT_TOKEN_BUDGET
+    mmr_lambda: Optional[float] = Field(None, ge=0.0, le=1.0)  # None = CONTEXT_MMR_LAMBDA
+    rerank: Optional[bool] = None  # None = on when the reranker is loaded
+    rerank_budget_ms: Optional[int] = Field(None, ge=1, le=5000)  # None = RERANK_BUDGET_MS
 
 
 class Source(BaseModel):
@@ -72,60 +211,210 @@ class QueryResponse(BaseModel):
     answer: str
     sources: List[Source]
     timings_ms: Dict[str, int]
+    degraded: List[str] = []  # dependencies the answer was produced without
+
+
+@dataclass
+class RetrievalResult:
+    emb: np.ndarray
+    hits: List[Any]
+    sources: List[Source]
+    context: str
+    timings_ms: Dict[str, int]
+    collection_version: Any = None
+    cache_options: Tuple = ()
+    cached: Optional[CachedAnswer] = None
+    degraded: List[str] = field(default_factory=list)
+
+
+NO_HITS_ANSWER = "Answer: No relevant documents found."
+NO_TEXT_ANSWER = "Error: Found documents but failed to extract text content."
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
 
-def get_postgres_conn():
-    try:
-        return psycopg2.connect(
-            host=os.getenv("PG_HOST"),
-            database=os.getenv("PG_DB"),
-            user=os.getenv("PG_USER"),
-            password=os.getenv("PG_PASSWORD")
-        )
-    except Exception as e:
-        print(f"ERROR: Postgres connection failed: {e}")
-        return None
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "service": APP_NAME}
+    # Always 200: an open circuit is a dependency problem, restarting this pod would not fix it
+    return {"status": "ok", "service": APP_NAME,
+            "circuits": {name: breaker.state for name, breaker in breakers.items()}}
 
 
-async def get_query_embedding(question: str) -> List[float]:
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 30, hz: int = 100, idle: bool = False,
+                        x_profiler_token: Optional[str] = Header(None)):
+    """Samples the stacks of this worker for `seconds` and returns them folded, for a flame graph (PROFILER_ENABLED)"""
+    return await profile_response(seconds, hz, idle, x_profiler_token)
+
+
+async def get_query_embedding(question: str) -> np.ndarray:
     url = EMBEDDINGS_ENGINE_URL.rstrip("/") + EMBEDDINGS_ENDPOINT
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.post(url, json={"text": question})
+    body: Dict[str, Any] = {"text": question}
+    headers = {}
+    if EMBED_TRANSPORT == "binary":
+        body["dtype"] = EMBED_TRANSPORT_DTYPE
+        headers["Accept"] = f"{VECTOR_MEDIA_TYPE}, application/json;q=0.5"
+    elif EMBED_TRANSPORT == "base64":
+        body.update(encoding="base64", dtype=EMBED_TRANSPORT_DTYPE)
+    with breakers["embeddings"].guard() as guarded:
+        with span("embeddings_engine.embed", transport=EMBED_TRANSPORT) as call:
+            r = await embed_client.post(url, json=body, headers=headers)
+            call.error = f"HTTP {r.status_code}" if r.status_code != 200 else None
+        guarded.failed = r.status_code >= 500 or r.status_code == 429
     if r.status_code != 200:
         print(f"ERROR: Embedding service failed: {r.text}")
         raise HTTPException(status_code=502, detail=f"Embedding service error: {r.text}")
-    data = r.json()
-    emb = data.get("embedding")
-    if not isinstance(emb, list) or not emb:
+    try:
+        # An older embeddings-engine ignores the transport hints and answers with a JSON float list
+        if r.headers.get("content-type", "").startswith(VECTOR_MEDIA_TYPE):
+            emb = decode_vector(r.content, r.headers.get(DTYPE_HEADER, "float32"),
+                                float(r.headers.get(SCALE_HEADER, "1")), int(r.headers[DIM_HEADER]))
+        else:
+            data = r.json()
+            if data.get("embedding_b64"):
+                emb = decode_vector_b64(data["embedding_b64"], data.get("dtype", "float32"),
+                                        data.get("scale") or 1.0, data.get("dim"))
+            else:
+                emb = np.asarray(data.get("embedding") or [], dtype=np.float32)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=502, detail=f"Embedding service returned a malformed embedding: {e}")
+    if emb.ndim != 1 or not emb.size:
         raise HTTPException(status_code=502, detail="Embedding service returned no embedding")
     return emb
 
 
-def fetch_text_from_s3(s3_key: str) -> str:
-    if not s3 or not S3_BUCKET:
-        print(f"WARNING: Cannot fetch {s3_key}, S3_BUCKET not set.")
-        return ""
+def qdrant_search_params(top_k: int, params: Optional[QdrantSearchParams] = None) -> models.SearchParams:
+    hnsw_ef = (params and params.hnsw_ef) or QDRANT_HNSW_EF
+    oversampling = (params and params.oversampling) or QDRANT_OVERSAMPLING
+    rescore = QDRANT_RESCORE if params is None or params.rescore is None else params.rescore
+    return models.SearchParams(
+        # A candidate list shorter than the limit would cap the results
+        hnsw_ef=max(hnsw_ef, top_k) if hnsw_ef else None,
+        quantization=models.QuantizationSearchParams(rescore=rescore, oversampling=oversampling),
+    )
+
+
+async def search_qdrant(emb: np.ndarray, top_k: int, params: Optional[QdrantSearchParams] = None):
+    """Primary search; returns (hits, latency in seconds)"""
+    t_q0 = time.time()
+    with breakers["qdrant"].guard(), span("qdrant.query", limit=top_k):
+        res = await qdrant.query_points(
+            collection_name=QDRANT_COLLECTION,
+            query=emb,
+            limit=top_k,
+            search_params=qdrant_search_params(top_k, params),
+            with_payload=True,
+            with_vectors=False,
+        )
+    return res.points, time.time() - t_q0
+
+
+async def fill_payloads(hits: List[Hit], known_ids: set):
+    """Lexical-only hits carry the Postgres row; swap in the full Qdrant payload"""
+    missing = [h.id for h in hits if h.id not in known_ids]
+    if not missing:
+        return
     try:
-        obj = s3.get_object(Bucket=S3_BUCKET, Key=s3_key)
-        content = obj["Body"].read().decode("utf-8", errors="replace")
-        return content
+        with breakers["qdrant"].guard(), span("qdrant.retrieve", points=len(missing)):
+            points = await qdrant.retrieve(QDRANT_COLLECTION, ids=missing, with_payload=True, with_vectors=False)
     except Exception as e:
-        print(f"ERROR: S3 fetch failed for {s3_key}: {e}")
-        return ""
+        print(f"WARNING: Could not load payloads for lexical hits: {e}")
+        return
+    payloads = {str(p.id): p.payload for p in points if p.payload}
+    for h in hits:
+        h.payload = payloads.get(h.id, h.payload)
+
+
+async def resolve_texts(hits) -> List[str]:
+    """Chunk texts from the payloads; chunks whose payload only points to S3 are fetched in one batch"""
+    texts = [(h.payload or {}).get("text") or (h.payload or {}).get("chunk_text") or "" for h in hits]
+    missing = [(i, s3_ref_from_payload(h.payload or {})) for i, h in enumerate(hits) if not texts[i]]
+    missing = [(i, ref) for i, ref in missing if ref]
+    if missing:
+        if s3_text_cache:
+            print(f"INFO: Payload text empty for {len(missing)} chunks, fetching from S3")
+            fetched = await s3_text_cache.get_many([ref for _, ref in missing])
+            for (i, _), text in zip(missing, fetched):
+                texts[i] = text
+        else:
+            print(f"WARNING: Cannot fetch {len(missing)} chunks, S3_BUCKET not set.")
+
+    for hit, text in zip(hits, texts):
+        if not text:
+            print(f"WARNING: No text found for chunk {hit.id}. Skipping.")
+    return texts
 
 
-async def call_llm(question: str, context: str) -> str:
-    if not LLM_API_KEY:
-        return (
-            "Answer: LLM_API_KEY not set. Retrieval worked; here is a context preview.\n\n"
-            f"{context[:1000]}\n\n"
-        )
+def cancel_task(task: Optional[asyncio.Task]):
+    if task and not task.done():
+        task.cancel()
+
+
+async def get_collection_version():
+    """Ingestion generation of the collection, refreshed every few seconds; None when it cannot be read.
+
+    The embeddings-engine bumps it in Postgres after every write or delete of
+    points, so a cached answer is dropped as soon as any document changed.
+    """
+    global _collection_version
+    value, fetched_at = _collection_version
+    if time.time() - fetched_at < COLLECTION_VERSION_TTL:
+        return value
+    value = None
+    if pg_pool:
+        try:
+            with breakers["postgres"].guard() as guarded, span("postgres.ingest_generation"):
+                async with pg_connection(pg_pool) as conn:
+                    try:
+                        cur = await conn.execute(INGEST_GENERATION_SQL, (QDRANT_COLLECTION,))
+                    except psycopg.errors.UndefinedTable:
+                        # Embeddings-engine older than the marker: Postgres itself is fine
+                        guarded.failed = False
+                        raise
+                    row = await cur.fetchone()
+            # No row yet: nothing has been ingested since the table was created
+            value = row[0] if row else 0
+        except Exception as e:
+            print(f"WARNING: Could not read the ingestion generation: {e}")
+    _collection_version = (value, time.time())
+    return value
+
+
+async def search_postgres_shadow(emb: np.ndarray, top_k: int, params: Optional[PgSearchParams] = None):
+    """Shadow search used only for metrics; returns (ids, latency) or None on failure"""
+    ef_search = (params and params.ef_search) or PG_EF_SEARCH
+    probes = (params and params.probes) or PG_IVFFLAT_PROBES
+    try:
+        with breakers["postgres"].guard(), span("postgres.shadow_search", limit=top_k):
+            async with pg_connection(pg_pool) as pg_conn:
+                t_p0 = time.time()
+                # Index settings only live for this transaction, so pooled connections stay clean
+                async with pg_conn.transaction(), pg_conn.cursor() as cur:
+                    await cur.execute(
+                        "SELECT set_config('hnsw.ef_search', %s, true), set_config('ivfflat.probes', %s, true)",
+                        (str(max(ef_search, top_k)), str(probes)),
+                    )
+                    query_sql = """
+                        SELECT id 
+                        FROM embeddings 
+                        ORDER BY vector <=> %b::vector 
+                        LIMIT %s;
+                    """
+                    # pgvector binary format: no float -> text -> float round trip
+                    await cur.execute(query_sql, (PgVector(emb), top_k))
+                    pg_hits = await cur.fetchall()
+                t_p1 = time.time()
+        return [str(row[0]) for row in pg_hits], t_p1 - t_p0
+    except Exception as e:
+        # SAFETY: If Postgres fails, we just log it and continue. The user still gets their answer.
+        print(f"ERROR: Postgres shadow search failed: {e}")
+        return None
 
-    headers = {"Authorization": f"Bearer {LLM_API_KEY}", "Content-Type": "application/json"}
 
+def build_llm_body(question: str, context: str, stream: bool = False) -> Dict[str, Any]:
     # Simplified Prompt: No citations requested
     messages = [
         {
@@ -146,9 +435,39 @@ async def call_llm(question: str, context: str) -> str:
     ]
 
     body = {"model": LLM_MODEL, "messages": messages, "temperature": 0.2}
+    if stream:
+        body["stream"] = True
+    return body
+
+
+def llm_preview(context: str) -> str:
+    return (
+        "Answer: LLM_API_KEY not set. Retrieval worked; here is a context preview.\n\n"
+        f"{context[:1000]}\n\n"
+    )
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(f"{LLM_BASE_URL.rstrip('/')}/chat/completions", json=body, headers=headers)
+
+def retrieval_only_answer(context: str) -> str:
+    """Degraded answer while the LLM circuit is open: the best passages instead of a generated answer"""
+    DEGRADED_RESPONSES.labels(dependency="llm").inc()
+    return (
+        "Answer: The language model is unavailable right now. These are the most relevant passages.\n\n"
+        f"{context[:1000]}\n\n"
+    )
+
+
+async def call_llm(question: str, context: str) -> str:
+    if not LLM_API_KEY:
+        return llm_preview(context)
+
+    headers = {"Authorization": f"Bearer {LLM_API_KEY}", "Content-Type": "application/json"}
+    body = build_llm_body(question, context)
+
+    with breakers["llm"].guard() as guarded:
+        with span("llm.chat", model=LLM_MODEL) as call:
+            r = await llm_client.post(f"{LLM_BASE_URL.rstrip('/')}/chat/completions", json=body, headers=headers)
+            call.error = f"HTTP {r.status_code}" if r.status_code != 200 else None
+        guarded.failed = r.status_code >= 500 or r.status_code == 429
 
     if r.status_code != 200:
         print(f"ERROR: LLM failed: {r.text}")
@@ -162,106 +481,183 @@ async def call_llm(question: str, context: str) -> str:
         raise HTTPException(status_code=502, detail="LLM returned unexpected response")
 
 
-@app.post("/query", response_model=QueryResponse)
-async def query(req: QueryRequest):
-    t0 = time.time()
-    print(f"INFO: Processing query: {req.question}")
-
-    # 1) Embed
-    t_embed0 = time.time()
-    emb = await get_query_embedding(req.question)
-    t_embed1 = time.time()
+async def stream_llm(question: str, context: str) -> AsyncIterator[str]:
+    """Yields answer tokens as the OpenAI-compatible API streams them"""
+    if not LLM_API_KEY:
+        yield llm_preview(context)
+        return
 
-    # 2) Search - PRIMARY (Qdrant)
-    t_q0 = time.time()
-    hits = qdrant.search(
-        collection_name=QDRANT_COLLECTION,
-        query_vector=emb,
-        limit=req.top_k,
-        with_payload=True,
-        with_vectors=False,
-    )
-    t_q1 = time.time()
-    
-    # Record Primary Metric
-    qdrant_latency = t_q1 - t_q0
-    SEARCH_LATENCY.labels(database="qdrant").observe(qdrant_latency)
-    
-    # Save IDs for comparison
-    qdrant_ids = {str(h.id) for h in hits}
+    headers = {"Authorization": f"Bearer {LLM_API_KEY}", "Content-Type": "application/json"}
+    body = build_llm_body(question, context, stream=True)
 
-    # 3) Search - SHADOW (Postgres)
-    # This block is strictly for metrics. It does NOT affect the 'hits' variable used for the answer.
-    pg_conn = get_postgres_conn()
-    if pg_conn:
+    # Raises CircuitOpenError before anything is sent; the whole stream counts as one call
+    with breakers["llm"].guard() as guarded:
+        # Not made current: the span stays open across yields, which run in the caller's context
+        call = start_span("llm.chat_stream", kind=KIND_CLIENT, model=LLM_MODEL, tokens=0)
+        error = None
         try:
-            t_p0 = time.time()
-            with pg_conn.cursor() as cur:
-                query_sql = """
-                    SELECT id 
-                    FROM embeddings 
-                    ORDER BY vector <=> %s 
-                    LIMIT %s;
-                """
-                # Pass vector as string for pgvector
-                cur.execute(query_sql, (str(emb), req.top_k))
-                pg_hits = cur.fetchall()
-            t_p1 = time.time()
-            
-            # Record Shadow Metrics
-            pg_latency = t_p1 - t_p0
-            SEARCH_LATENCY.labels(database="postgres").observe(pg_latency)
-            
-            # Compare IDs (Overlap)
-            pg_ids = {str(row[0]) for row in pg_hits}
-            intersection = qdrant_ids.intersection(pg_ids)
-            
-            overlap = len(intersection) / req.top_k if req.top_k > 0 else 0.0
-            SEARCH_OVERLAP.set(overlap)
-            
-            print(f"COMPARISON: Qdrant={qdrant_latency:.3f}s, PG={pg_latency:.3f}s, Overlap={overlap*100:.1f}%")
-
+            async with llm_client.stream("POST", f"{LLM_BASE_URL.rstrip('/')}/chat/completions", json=body,
+                                         headers=headers) as r:
+                if r.status_code != 200:
+                    detail = (await r.aread()).decode("utf-8", errors="replace")
+                    print(f"ERROR: LLM failed: {detail}")
+                    guarded.failed = r.status_code >= 500 or r.status_code == 429
+                    raise HTTPException(status_code=502, detail=f"LLM error: {detail}")
+
+                async for line in r.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        token = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    except (ValueError, KeyError, IndexError):
+                        continue
+                    if token:
+                        call.attributes["tokens"] += 1
+                        yield token
         except Exception as e:
-            # SAFETY: If Postgres fails, we just log it and continue. The user still gets their answer.
-            print(f"ERROR: Postgres shadow search failed: {e}")
+            error = f"{type(e).__name__}: {e}"
+            raise
         finally:
-            pg_conn.close()
-    else:
-        print("WARNING: Skipping Postgres search (No Connection)")
+            call.end(error=error)
 
-    # 4) Build Context
-    # Note: We are using 'hits' (from Qdrant) just like before.
-    contexts: List[str] = []
-    sources: List[Source] = []
 
-    if not hits:
-        # Fast exit if Qdrant found nothing
-        return QueryResponse(
-            answer="Answer: No relevant documents found.",
-            sources=[],
-            timings_ms={
-                "embed": int((t_embed1 - t_embed0) * 1000),
-                "search": int((t_q1 - t_q0) * 1000),
-                "llm": 0,
-                "total": int((time.time() - t0) * 1000),
-            },
-        )
+async def lexical_search(question: str, limit: int):
+    """Lexical leg behind the postgres circuit; None when it failed, ran out of time or the circuit is open"""
+    try:
+        with breakers["postgres"].guard() as guarded:
+            result = await lexical_searcher.search(question, limit)
+            guarded.failed = result is None
+    except CircuitOpenError:
+        return None
+    return result
 
-    for h in hits:
-        payload = h.payload or {}
-        chunk_id = str(h.id)
-        
-        text = payload.get("text") or payload.get("chunk_text")
-        s3_key = payload.get("s3_key") or payload.get("s3Key") or payload.get("key")
 
-        if not text and s3_key:
-            print(f"INFO: Payload text empty for {chunk_id}, fetching from S3: {s3_key}")
-            text = fetch_text_from_s3(str(s3_key))
+async def retrieve(req: QueryRequest) -> RetrievalResult:
+    """Embeds the question, searches Qdrant (plus Postgres full text) and assembles the LLM context"""
+    use_hybrid = (HYBRID_ENABLED if req.hybrid is None else req.hybrid) and lexical_searcher is not None
+    use_rerank = reranker is not None and req.rerank is not False
+    # Reranking picks top_k out of a larger candidate pool
+    pool_k = req.top_k * RERANK_OVERFETCH if use_rerank else req.top_k
+    depth = pool_k * HYBRID_DEPTH_FACTOR if use_hybrid else pool_k
+    # The lexical leg needs no embedding, so it runs while the question is being embedded
+    lexical_task = asyncio.create_task(lexical_search(req.question, depth)) if use_hybrid else None
 
-        if not text:
-            print(f"WARNING: No text found for chunk {chunk_id}. Skipping.")
-            continue
+    # 1) Embed
+    t_embed0 = time.time()
+    try:
+        emb = await get_query_embedding(req.question)
+    except BaseException:
+        cancel_task(lexical_task)
+        raise
+    t_embed1 = time.time()
+
+    # 1b) Semantic cache: reuse the answer of a near-identical earlier question asked with the same settings
+    context_budget = req.context_tokens or CONTEXT_TOKEN_BUDGET
+    mmr_lambda = CONTEXT_MMR_LAMBDA if req.mmr_lambda is None else req.mmr_lambda
+    # The rerank budget decides how many candidates get rescored, so it shapes the answer too
+    rerank_budget = (req.rerank_budget_ms or RERANK_BUDGET_MS) if use_rerank else None
+    cache_options = (req.top_k, use_hybrid, use_rerank, rerank_budget, context_budget, mmr_lambda,
+                     req.qdrant_search.model_dump_json() if req.qdrant_search else None)
+    version = await get_collection_version() if semantic_cache else None
+    if semantic_cache and version is not None:
+        cached = semantic_cache.lookup(emb, cache_options, version)
+        if cached:
+            cancel_task(lexical_task)
+            print(f"INFO: Semantic cache hit ({cached.similarity:.3f}) for: {cached.question}")
+            return RetrievalResult(
+                emb=emb,
+                hits=[],
+                sources=[Source(**s) for s in cached.sources],
+                context="",
+                timings_ms={"embed": int((t_embed1 - t_embed0) * 1000), "search": 0},
+                collection_version=version,
+                cache_options=cache_options,
+                cached=cached,
+            )
+
+    # 2) Search - PRIMARY (Qdrant dense, fused with the lexical leg when enabled)
+    degraded: List[str] = []
+    try:
+        hits, qdrant_latency = await search_qdrant(emb, depth, req.qdrant_search)
+    except Exception as e:
+        # Failover: while Qdrant is down, Postgres full-text search answers on its own
+        if lexical_task is None and lexical_searcher is not None:
+            lexical_task = asyncio.create_task(lexical_search(req.question, depth))
+        if lexical_task is None or not await lexical_task:
+            raise
+        print(f"WARNING: Qdrant search failed, answering from full-text search only: {e}")
+        DEGRADED_RESPONSES.labels(dependency="qdrant").inc()
+        degraded.append("qdrant")
+        hits, qdrant_latency = None, 0.0
+    except BaseException:
+        cancel_task(lexical_task)
+        raise
+
+    dense_ids = []
+    if hits is not None:
+        # Record Primary Metric
+        SEARCH_LATENCY.labels(database="qdrant").observe(qdrant_latency)
+        RETRIEVAL_LEG_LATENCY.labels(leg="dense").observe(qdrant_latency)
+        dense_ids = [str(h.id) for h in hits]
+
+        # 3) Search - SHADOW (Postgres)
+        # Queued for the background evaluator; strictly for metrics and never on the user's critical path.
+        if shadow_evaluator and breakers["postgres"].state != OPEN:
+            shadow_evaluator.submit(emb, req.top_k, dense_ids[:req.top_k], req.pg_search)
+
+    timings_ms = {
+        "embed": int((t_embed1 - t_embed0) * 1000),
+        "dense": int(qdrant_latency * 1000),
+    }
+    t_dense1 = time.time()
+    if lexical_task:
+        lexical = await lexical_task
+        if lexical:
+            lexical_hits, lexical_latency = lexical
+            timings_ms["lexical"] = int(lexical_latency * 1000)
+            if hits is None:
+                # Full-text rows carry their text, no Qdrant payloads needed
+                hits = lexical_hits
+            else:
+                t_fuse0 = time.time()
+                hits = rrf_fuse([hits, lexical_hits], pool_k)
+                await fill_payloads(hits, set(dense_ids))
+                RETRIEVAL_LEG_LATENCY.labels(leg="fusion").observe(time.time() - t_fuse0)
+        else:
+            DEGRADED_RESPONSES.labels(dependency="postgres").inc()
+            degraded.append("postgres")
+    hits = hits[:pool_k]
+    # Kept as "search" for frontend compatibility: dense and lexical overlap, so this is the wall time of both
+    timings_ms["search"] = int((qdrant_latency + time.time() - t_dense1) * 1000)
 
+    # 4) Build Context
+    # Note: 'hits' are the Qdrant hits, or the fused ranking when the lexical leg answered.
+    texts = await resolve_texts(hits)
+    ranked = [(h, t) for h, t in zip(hits, texts) if t]
+
+    # 4b) Rerank the candidate pool against the question and keep the best top_k
+    if use_rerank and ranked:
+        t_rerank0 = time.time()
+        with span("rerank", kind=KIND_INTERNAL, candidates=len(ranked)):
+            scores = await reranker.rerank(req.question, [t for _, t in ranked], rerank_budget)
+        ranked = [
+            (Hit(id=str(ranked[i][0].id), score=scores[i] if scores[i] is not None else float(ranked[i][0].score),
+                 payload=ranked[i][0].payload), ranked[i][1])
+            for i in rerank_order(scores)
+        ]
+        timings_ms["rerank"] = int((time.time() - t_rerank0) * 1000)
+    ranked = ranked[:req.top_k]
+    hits = hits[:req.top_k]
+
+    candidates: List[Candidate] = []
+    by_id: Dict[str, Source] = {}
+    for h, text in ranked:
+        payload = h.payload or {}
+        chunk_id = str(h.id)
+        s3_key = payload.get("s3_key") or payload.get("s3Key") or payload.get("key")
         src = Source(
             score=float(h.score),
             chunk_id=chunk_id,
@@ -269,29 +665,150 @@ async def query(req: QueryRequest):
             title=payload.get("title"),
             s3_key=str(s3_key) if s3_key else None,
         )
-        sources.append(src)
-        contexts.append(f"Content: {text}")
-
-    context_block = "\n\n---\n\n".join(contexts)[:15000]
+        by_id[chunk_id] = src
+        candidates.append(Candidate(chunk_id=chunk_id, text=text, score=src.score, document_id=src.document_id))
+
+    # Token budget instead of a character cut: overlapping neighbours are merged, the last chunk is trimmed
+    t_pack0 = time.time()
+    packed = pack_context(
+        candidates,
+        token_counter,
+        budget=context_budget,
+        mmr_lambda=mmr_lambda,
+    )
+    context_block = packed.context
+    # Sources in context order; chunks that did not make it into the context are not listed
+    sources = [by_id[chunk_id] for chunk_id in packed.chunk_ids]
+    timings_ms["pack"] = int((time.time() - t_pack0) * 1000)
+    timings_ms["context_tokens"] = packed.tokens
     
     # DEBUG LOGGING
-    print(f"DEBUG: Context Size: {len(context_block)} chars")
+    print(f"DEBUG: Context Size: {len(context_block)} chars, {packed.tokens} tokens ({token_counter.name}), {packed.stats}")
+
+    return RetrievalResult(emb=emb, hits=hits, sources=sources, context=context_block,
+                           timings_ms=timings_ms, collection_version=version, cache_options=cache_options,
+                           degraded=degraded)
+
+
+def remember_answer(req: QueryRequest, result: RetrievalResult, answer: str):
+    """Stores an LLM answer in the semantic cache; answers from degraded retrieval are not reused"""
+    if semantic_cache and result.collection_version is not None and result.context and not result.degraded:
+        semantic_cache.store(result.emb, req.question, answer, [s.model_dump() for s in result.sources],
+                             result.cache_options, result.collection_version)
+
+
+@app.post("/query", response_model=QueryResponse)
+async def query(req: QueryRequest):
+    t0 = time.time()
+    print(f"INFO: Processing query: {req.question}")
+
+    result = await retrieve(req)
+
+    if result.cached:
+        return QueryResponse(
+            answer=result.cached.answer,
+            sources=result.sources,
+            timings_ms={**result.timings_ms, "llm": 0, "total": int((time.time() - t0) * 1000)},
+            degraded=result.degraded,
+        )
+
+    if not result.hits:
+        # Fast exit if Qdrant found nothing
+        return QueryResponse(
+            answer=NO_HITS_ANSWER,
+            sources=[],
+            timings_ms={**result.timings_ms, "llm": 0, "total": int((time.time() - t0) * 1000)},
+            degraded=result.degraded,
+        )
 
     # 5) LLM
     t_llm0 = time.time()
-    if not context_block:
-         answer = "Error: Found documents but failed to extract text content."
+    if not result.context:
+         answer = NO_TEXT_ANSWER
     else:
-         answer = await call_llm(req.question, context_block)
+         try:
+             answer = await call_llm(req.question, result.context)
+             remember_answer(req, result, answer)
+         except CircuitOpenError:
+             answer = retrieval_only_answer(result.context)
+             result.degraded.append("llm")
     t_llm1 = time.time()
 
     return QueryResponse(
         answer=answer,
-        sources=sources,
+        sources=result.sources,
         timings_ms={
-            "embed": int((t_embed1 - t_embed0) * 1000),
-            "search": int((t_q1 - t_q0) * 1000), # Kept as "search" for frontend compatibility
+            **result.timings_ms,
             "llm": int((t_llm1 - t_llm0) * 1000),
             "total": int((time.time() - t0) * 1000),
         },
-    )
\ No newline at end of file
+        degraded=result.degraded,
+    )
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest):
+    """Server-sent events: timing(embed/search), sources, token..., timing(llm/total), done (with `degraded`)"""
+    t0 = time.time()
+    print(f"INFO: Processing streaming query: {req.question}")
+
+    # Retrieval errors still surface as regular HTTP errors before the stream opens
+    result = await retrieve(req)
+
+    async def events():
+        timings_ms = dict(result.timings_ms)
+        for stage in ("embed", "search"):
+            yield sse_event("timing", {"stage": stage, "ms": timings_ms[stage]})
+        yield sse_event("sources", [s.model_dump() for s in result.sources])
+
+        t_llm0 = time.time()
+        answer_parts: List[str] = []
+        try:
+            if result.cached:
+                answer_parts.append(result.cached.answer)
+                yield sse_event("token", {"text": result.cached.answer})
+            elif not result.hits or not result.context:
+                static_answer = NO_HITS_ANSWER if not result.hits else NO_TEXT_ANSWER
+                answer_parts.append(static_answer)
+                yield sse_event("token", {"text": static_answer})
+            else:
+                try:
+                    async for token in stream_llm(req.question, result.context):
+                        if not answer_parts:
+                            ttft = time.time() - t0
+                            TTFT_LATENCY.observe(ttft)
+                            timings_ms["ttft"] = int(ttft * 1000)
+                            yield sse_event("timing", {"stage": "ttft", "ms": timings_ms["ttft"]})
+                        answer_parts.append(token)
+                        yield sse_event("token", {"text": token})
+                    remember_answer(req, result, "".join(answer_parts))
+                except CircuitOpenError:
+                    # Raised before the first token
+                    fallback = retrieval_only_answer(result.context)
+                    result.degraded.append("llm")
+                    answer_parts.append(fallback)
+                    yield sse_event("token", {"text": fallback})
+        except HTTPException as e:
+            yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+            return
+        except Exception as e:
+            print(f"ERROR: Streaming LLM failed: {e}")
+            yield sse_event("error", {"status": 502, "detail": "LLM stream interrupted"})
+            return
+
+        timings_ms["llm"] = int((time.time() - t_llm0) * 1000)
+        timings_ms["total"] = int((time.time() - t0) * 1000)
+        for stage in ("llm", "total"):
+            yield sse_event("timing", {"stage": stage, "ms": timings_ms[stage]})
+        yield sse_event("done", {"answer": "".join(answer_parts), "timings_ms": timings_ms,
+                                 "degraded": result.degraded})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,196 @@
+import os
+import time
+import asyncio
+import importlib
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from prometheus_client import Counter, Histogram
+
+# --- Configuration ---
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+# An http(s) URL of a /rerank endpoint (text-embeddings-inference API), cross-encoder (local CPU,
+# needs sentence-transformers, which the image does not include) or "package.module:function"
+# taking [(query, text)] -> [score]
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "http://reranker:8080")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))
+# Candidates fetched per final result: the LLM still sees top_k chunks
+RERANK_OVERFETCH = int(os.getenv("RERANK_OVERFETCH", "4"))
+# Per-request budget; candidates not scored in time keep their retrieval order
+RERANK_BUDGET_MS = int(os.getenv("RERANK_BUDGET_MS", "150"))
+# Pairs of concurrent requests are scored together, up to this many per model call
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "64"))
+# How long the first pair of a batch waits for pairs of other requests
+RERANK_BATCH_WAIT_MS = float(os.getenv("RERANK_BATCH_WAIT_MS", "2"))
+
+# --- Metrics ---
+RERANK_LATENCY = Histogram(
+    "rag_rerank_seconds",
+    "Time a query spent in the rerank stage",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1, 2.5)
+)
+RERANK_BATCH = Histogram(
+    "rag_rerank_batch_pairs",
+    "Query/chunk pairs per scorer call (across concurrent requests)",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+RERANK_PAIRS = Counter(
+    "rag_rerank_pairs_total",
+    "Candidate pairs by rerank outcome (scored, over_budget, failed)",
+    ["outcome"]
+)
+
+Scorer = Callable[[List[Tuple[str, str]]], Sequence[float]]
+
+
+def cross_encoder_scorer(model_name: str = RERANK_MODEL) -> Scorer:
+    try:
+        from sentence_transformers import CrossEncoder
+    except ImportError as e:
+        raise RuntimeError("RERANK_BACKEND=cross-encoder needs sentence-transformers installed in the image") from e
+    model = CrossEncoder(model_name, max_length=RERANK_MAX_LENGTH, device="cpu")
+
+    def score(pairs: List[Tuple[str, str]]) -> Sequence[float]:
+        return model.predict(pairs, batch_size=len(pairs), show_progress_bar=False).tolist()
+    return score
+
+
+def http_scorer(url: str) -> Scorer:
+    """text-embeddings-inference style endpoint: {query, texts} -> [{index, score}]"""
+    import httpx
+    client = httpx.Client(timeout=RERANK_BUDGET_MS / 1000 * 4)
+    endpoint = url.rstrip("/") + ("" if url.rstrip("/").endswith("/rerank") else "/rerank")
+
+    def score(pairs: List[Tuple[str, str]]) -> Sequence[float]:
+        # One call per distinct query in the batch
+        by_query: Dict[str, List[int]] = {}
+        for i, (query, _) in enumerate(pairs):
+            by_query.setdefault(query, []).append(i)
+        scores = [0.0] * len(pairs)
+        for query, indexes in by_query.items():
+            r = client.post(endpoint, json={"query": query, "texts": [pairs[i][1] for i in indexes], "truncate": True})
+            r.raise_for_status()
+            for item in r.json():
+                scores[indexes[item["index"]]] = float(item["score"])
+        return scores
+    return score
+
+
+def load_scorer(backend: str = RERANK_BACKEND) -> Scorer:
+    if backend == "cross-encoder":
+        return cross_encoder_scorer()
+    if backend.startswith(("http://", "https://")):
+        return http_scorer(backend)
+    module, _, name = backend.partition(":")
+    if not name:
+        raise ValueError(f"Unknown RERANK_BACKEND '{backend}'")
+    return getattr(importlib.import_module(module), name)
+
+
+@dataclass
+class _Pair:
+    query: str
+    text: str
+    deadline: float
+    future: asyncio.Future
+
+
+class Reranker:
+    """Rescores retrieved chunks against the question with a shared batching worker.
+
+    Requests put their (question, chunk) pairs on one queue. The worker takes
+    up to `batch_size` pairs, across requests, per scorer call and runs the
+    call in a thread. A request waits at most its budget; pairs whose deadline
+    passed before their batch started are skipped.
+    """
+
+    def __init__(self, scorer: Scorer, batch_size: int = RERANK_BATCH_SIZE,
+                 batch_wait_ms: float = RERANK_BATCH_WAIT_MS):
+        self.scorer = scorer
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def warm_up(self):
+        """First model call is slow (lazy init); pay it at startup instead of on a query"""
+        await asyncio.to_thread(self.scorer, [("warm up", "warm up")])
+
+    async def rerank(self, query: str, texts: Sequence[str], budget_ms: int = RERANK_BUDGET_MS) -> List[Optional[float]]:
+        """Scores per text, None for texts not scored within the budget"""
+        if not texts:
+            return []
+        t0 = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + budget_ms / 1000
+        futures = []
+        # Queued in retrieval order, so a short budget still rescores the best candidates
+        for text in texts:
+            future = loop.create_future()
+            self._queue.put_nowait(_Pair(query, text, deadline, future))
+            futures.append(future)
+
+        await asyncio.wait(futures, timeout=max(deadline - loop.time(), 0))
+        scores: List[Optional[float]] = []
+        for future in futures:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                scores.append(future.result())
+                RERANK_PAIRS.labels(outcome="scored").inc()
+            else:
+                outcome = "failed" if future.done() and not future.cancelled() else "over_budget"
+                RERANK_PAIRS.labels(outcome=outcome).inc()
+                future.cancel()
+                scores.append(None)
+        RERANK_LATENCY.observe(time.perf_counter() - t0)
+        return scores
+
+    async def _next_batch(self) -> List[_Pair]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        wait_until = loop.time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = wait_until - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        now = loop.time()
+        return [p for p in batch if not p.future.done() and p.deadline > now]
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            RERANK_BATCH.observe(len(batch))
+            try:
+                scores = await asyncio.to_thread(self.scorer, [(p.query, p.text) for p in batch])
+            except Exception as e:
+                print(f"ERROR: Rerank scorer failed ({len(batch)} pairs): {e}")
+                for p in batch:
+                    if not p.future.done():
+                        p.future.set_exception(e)
+                continue
+            for p, score in zip(batch, scores):
+                if not p.future.done():
+                    p.future.set_result(float(score))
+
+
+def rerank_order(scores: Sequence[Optional[float]]) -> List[int]:
+    """Indexes by rerank score; unscored candidates follow in their original order"""
+    scored = sorted((i for i, s in enumerate(scores) if s is not None), key=lambda i: scores[i], reverse=True)
+    return scored + [i for i, s in enumerate(scores) if s is None]
@@ -0,0 +1,183 @@
+import os
+import time
+import asyncio
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from botocore.exceptions import ClientError
+from prometheus_client import Counter, Gauge, Histogram
+
+# --- Configuration ---
+S3_CACHE_MAX_BYTES = int(os.getenv("S3_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Entries are served without asking S3 for this long; after that a conditional GET
+# (If-None-Match) checks the ETag and only downloads the object when it changed
+S3_CACHE_REVALIDATE_SECONDS = float(os.getenv("S3_CACHE_REVALIDATE_SECONDS", "300"))
+
+# --- Metrics ---
+S3_CACHE_REQUESTS = Counter(
+    "rag_s3_cache_requests_total",
+    "S3 text lookups by result (hit, miss, revalidated, modified, error)",
+    ["result"]
+)
+S3_FETCH_LATENCY = Histogram(
+    "rag_s3_fetch_seconds",
+    "Duration of S3 GETs for chunk text (full, ranged and conditional)",
+    ["kind"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+S3_CACHE_BYTES = Gauge("rag_s3_cache_bytes", "Bytes held in the S3 text cache")
+S3_CACHE_ENTRIES = Gauge("rag_s3_cache_entries", "Objects and ranges held in the S3 text cache")
+
+
+class S3Ref(NamedTuple):
+    """An S3 object, or a byte range of it when offset/length are set"""
+    key: str
+    offset: Optional[int] = None
+    length: Optional[int] = None
+
+    @property
+    def cache_key(self) -> str:
+        return self.key if self.offset is None else f"{self.key}#{self.offset}+{self.length}"
+
+
+def s3_ref_from_payload(payload: dict) -> Optional[S3Ref]:
+    key = payload.get("s3_key") or payload.get("s3Key") or payload.get("key")
+    if not key:
+        return None
+    offset, length = payload.get("s3_offset"), payload.get("s3_length")
+    if offset is not None and length:
+        return S3Ref(str(key), int(offset), int(length))
+    return S3Ref(str(key))
+
+
+@dataclass
+class _Entry:
+    data: bytes
+    etag: Optional[str]
+    validated_at: float
+
+
+class S3TextCache:
+    """Byte-bounded LRU of S3 objects (or ranges) holding chunk text.
+
+    Lookups of one query run concurrently on the S3 thread pool, and
+    concurrent lookups of the same object share one GET. A cached full object
+    also serves ranges of that object.
+    """
+
+    def __init__(self, client, bucket: str, executor: Executor,
+                 max_bytes: int = S3_CACHE_MAX_BYTES, revalidate_after: float = S3_CACHE_REVALIDATE_SECONDS):
+        self.client = client
+        self.bucket = bucket
+        self.executor = executor
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def get_many(self, refs: List[S3Ref]) -> List[str]:
+        return list(await asyncio.gather(*(self.get(ref) for ref in refs)))
+
+    async def get(self, ref: S3Ref) -> str:
+        data = await self.get_bytes(ref)
+        return data.decode("utf-8", errors="replace") if data else ""
+
+    async def get_bytes(self, ref: S3Ref) -> bytes:
+        entry = self._entries.get(ref.cache_key)
+        if entry is None and ref.offset is not None:
+            # A cached whole object answers range requests too
+            whole = self._entries.get(ref.key)
+            if whole and self._fresh(whole):
+                self._entries.move_to_end(ref.key)
+                S3_CACHE_REQUESTS.labels(result="hit").inc()
+                return whole.data[ref.offset:ref.offset + ref.length]
+        if entry and self._fresh(entry):
+            self._entries.move_to_end(ref.cache_key)
+            S3_CACHE_REQUESTS.labels(result="hit").inc()
+            return entry.data
+
+        pending = self._inflight.get(ref.cache_key)
+        if pending:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[ref.cache_key] = future
+        try:
+            data = await self._load(ref, entry)
+            future.set_result(data)
+            return data
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Consumed here so an unawaited shared future does not log a warning
+            future.exception()
+            raise
+        finally:
+            del self._inflight[ref.cache_key]
+
+    def _fresh(self, entry: _Entry) -> bool:
+        return time.monotonic() - entry.validated_at < self.revalidate_after
+
+    async def _load(self, ref: S3Ref, stale: Optional[_Entry]) -> bytes:
+        loop = asyncio.get_running_loop()
+        etag = stale.etag if stale else None
+        try:
+            # run_in_executor does not carry the context over; copy it so the S3 call joins the trace
+            data, etag = await loop.run_in_executor(self.executor, contextvars.copy_context().run,
+                                                    self._fetch, ref, etag)
+        except Exception as e:
+            S3_CACHE_REQUESTS.labels(result="error").inc()
+            if stale:
+                print(f"WARNING: S3 revalidation failed for {ref.key}, serving cached copy: {e}")
+                return stale.data
+            print(f"ERROR: S3 fetch failed for {ref.key}: {e}")
+            return b""
+
+        if data is None:
+            # 304 Not Modified: the cached copy is still current
+            S3_CACHE_REQUESTS.labels(result="revalidated").inc()
+            stale.validated_at = time.monotonic()
+            # Re-insert rather than move: other loads may have evicted it during the GET
+            self._store(ref.cache_key, stale)
+            return stale.data
+        S3_CACHE_REQUESTS.labels(result="modified" if stale else "miss").inc()
+        self._store(ref.cache_key, _Entry(data, etag, time.monotonic()))
+        return data
+
+    def _fetch(self, ref: S3Ref, etag: Optional[str]) -> Tuple[Optional[bytes], Optional[str]]:
+        """Runs on the S3 thread pool; returns (None, etag) when the object is unchanged"""
+        params = {"Bucket": self.bucket, "Key": ref.key}
+        if ref.offset is not None:
+            params["Range"] = f"bytes={ref.offset}-{ref.offset + ref.length - 1}"
+        if etag:
+            params["IfNoneMatch"] = etag
+        kind = "conditional" if etag else ("range" if ref.offset is not None else "full")
+        t0 = time.perf_counter()
+        try:
+            obj = self.client.get_object(**params)
+            return obj["Body"].read(), obj.get("ETag")
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("304", "NotModified"):
+                return None, etag
+            raise
+        finally:
+            S3_FETCH_LATENCY.labels(kind=kind).observe(time.perf_counter() - t0)
+
+    def _store(self, cache_key: str, entry: _Entry):
+        size = len(entry.data)
+        old = self._entries.pop(cache_key, None)
+        if old:
+            self._bytes -= len(old.data)
+        if size <= self.max_bytes:
+            self._entries[cache_key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.data)
+        S3_CACHE_BYTES.set(self._bytes)
+        S3_CACHE_ENTRIES.set(len(self._entries))
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from prometheus_client import Counter, Gauge, Histogram
+
+# --- Configuration ---
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+# Cosine similarity needed to reuse an answer; keep this high, near-misses give wrong answers
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+SEMANTIC_CACHE_MAX_BYTES = int(os.getenv("SEMANTIC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+
+# --- Metrics ---
+CACHE_REQUESTS = Counter(
+    "rag_semantic_cache_requests_total",
+    "Semantic cache lookups by result (hit, miss, stale)",
+    ["result"]
+)
+CACHE_EVICTIONS = Counter("rag_semantic_cache_evictions_total", "Semantic cache evictions", ["reason"])
+CACHE_ENTRIES = Gauge("rag_semantic_cache_entries", "Entries held in the semantic cache")
+CACHE_BYTES = Gauge("rag_semantic_cache_bytes", "Approximate memory used by the semantic cache")
+CACHE_LOOKUP_LATENCY = Histogram(
+    "rag_semantic_cache_lookup_seconds",
+    "Time spent searching the semantic cache",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+)
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    sources: List[Dict[str, Any]]
+    options: Tuple
+    collection_version: Any
+    created_at: float
+    nbytes: int
+    similarity: float = 0.0
+
+
+class SemanticCache:
+    """Answer cache keyed by question embedding.
+
+    Normalized embeddings live in one preallocated float32 matrix, so a lookup
+    is a single matrix-vector product. Only entries stored with the same
+    `options` (the request settings that shape an answer) are compared, and an
+    entry is only served when its similarity clears the threshold and the
+    collection version it was answered against is still current.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 max_bytes: int = SEMANTIC_CACHE_MAX_BYTES,
+                 ttl: int = SEMANTIC_CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._matrix: Optional[np.ndarray] = None  # allocated on first store, once dim is known
+        self._valid = np.zeros(max_entries, dtype=bool)
+        # Per slot, the id of its entry's options; lookups only consider slots with the same id.
+        # Options are registered by store() and dropped with their last entry, so the map stays
+        # bounded by max_entries however many settings clients send.
+        self._option_ids = np.zeros(max_entries, dtype=np.int64)
+        self._options: Dict[Tuple, int] = {}
+        self._option_refs: Dict[int, int] = {}
+        self._next_option_id = 0
+        self._entries: Dict[int, CachedAnswer] = {}
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self._free: List[int] = list(range(max_entries - 1, -1, -1))
+        self._bytes = 0
+
+    @staticmethod
+    def _normalize(emb: List[float]) -> np.ndarray:
+        vec = np.asarray(emb, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _evict(self, slot: int, reason: str):
+        entry = self._entries.pop(slot)
+        self._lru.pop(slot, None)
+        self._valid[slot] = False
+        self._free.append(slot)
+        self._bytes -= entry.nbytes
+        self._release_option(entry.options)
+        CACHE_EVICTIONS.labels(reason=reason).inc()
+
+    def _update_gauges(self):
+        CACHE_ENTRIES.set(len(self._entries))
+        CACHE_BYTES.set(self._bytes)
+
+    def _register_option(self, options: Tuple) -> int:
+        option_id = self._options.get(options)
+        if option_id is None:
+            option_id = self._options[options] = self._next_option_id
+            self._next_option_id += 1
+        self._option_refs[option_id] = self._option_refs.get(option_id, 0) + 1
+        return option_id
+
+    def _release_option(self, options: Tuple):
+        option_id = self._options[options]
+        self._option_refs[option_id] -= 1
+        if not self._option_refs[option_id]:
+            del self._option_refs[option_id]
+            del self._options[options]
+
+    def lookup(self, emb: List[float], options: Tuple, collection_version: Any) -> Optional[CachedAnswer]:
+        t0 = time.perf_counter()
+        try:
+            if self._matrix is None or not self._entries or len(emb) != self._matrix.shape[1]:
+                CACHE_REQUESTS.labels(result="miss").inc()
+                return None
+
+            option_id = self._options.get(options)
+            if option_id is None:
+                CACHE_REQUESTS.labels(result="miss").inc()
+                return None
+            slots = np.flatnonzero(self._valid & (self._option_ids == option_id))
+            if not len(slots):
+                CACHE_REQUESTS.labels(result="miss").inc()
+                return None
+            sims = self._matrix[slots] @ self._normalize(emb)
+            best = int(np.argmax(sims))
+            similarity = float(sims[best])
+            slot = int(slots[best])
+
+            if similarity < self.threshold:
+                CACHE_REQUESTS.labels(result="miss").inc()
+                return None
+
+            entry = self._entries[slot]
+            if time.time() - entry.created_at > self.ttl:
+                self._evict(slot, "ttl")
+                self._update_gauges()
+                CACHE_REQUESTS.labels(result="stale").inc()
+                return None
+            if entry.collection_version != collection_version:
+                # Documents changed since this answer was generated
+                self._evict(slot, "collection_changed")
+                self._update_gauges()
+                CACHE_REQUESTS.labels(result="stale").inc()
+                return None
+
+            self._lru.move_to_end(slot)
+            entry.similarity = similarity
+            CACHE_REQUESTS.labels(result="hit").inc()
+            return entry
+        finally:
+            CACHE_LOOKUP_LATENCY.observe(time.perf_counter() - t0)
+
+    def store(self, emb: List[float], question: str, answer: str, sources: List[Dict[str, Any]],
+              options: Tuple, collection_version: Any):
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_entries, len(emb)), dtype=np.float32)
+        elif len(emb) != self._matrix.shape[1]:
+            return
+
+        nbytes = self._matrix.shape[1] * 4 + len(question) + len(answer) + len(json.dumps(sources))
+        if nbytes > self.max_bytes:
+            return
+
+        # Make room: by entry count first, then by the memory bound
+        while self._lru and (not self._free or self._bytes + nbytes > self.max_bytes):
+            oldest = next(iter(self._lru))
+            self._evict(oldest, "size")
+
+        slot = self._free.pop()
+        self._matrix[slot] = self._normalize(emb)
+        self._valid[slot] = True
+        self._option_ids[slot] = self._register_option(options)
+        self._entries[slot] = CachedAnswer(
+            question=question,
+            answer=answer,
+            sources=sources,
+            options=options,
+            collection_version=collection_version,
+            created_at=time.time(),
+            nbytes=nbytes,
+        )
+        self._lru[slot] = None
+        self._bytes += nbytes
+        self._update_gauges()
+
+    def clear(self):
+        for slot in list(self._entries):
+            self._evict(slot, "cleared")
+        self._update_gauges()
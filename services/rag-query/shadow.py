@@ -0,0 +1,128 @@
+import os
+import math
+import random
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from prometheus_client import Counter, Gauge
+
+# --- Configuration ---
+SHADOW_ENABLED = os.getenv("SHADOW_ENABLED", "true").lower() == "true"
+# Fraction of queries that get a Postgres comparison (0.0 - 1.0)
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "1.0"))
+SHADOW_QUEUE_SIZE = int(os.getenv("SHADOW_QUEUE_SIZE", "100"))
+SHADOW_WORKERS = int(os.getenv("SHADOW_WORKERS", "2"))
+
+# --- Metrics ---
+# Gauge for Accuracy Proxy (Overlap)
+SEARCH_OVERLAP = Gauge(
+    "rag_search_overlap_ratio",
+    "Percentage of result overlap between Qdrant and Postgres (0.0 to 1.0)"
+)
+SEARCH_RECALL = Gauge(
+    "rag_search_recall_at_k",
+    "Share of the Postgres (exact) top-k that Qdrant also returned (0.0 to 1.0)"
+)
+SEARCH_NDCG = Gauge(
+    "rag_search_ndcg",
+    "Rank-aware agreement of Qdrant with the Postgres ranking (0.0 to 1.0)"
+)
+SHADOW_QUEUE_DEPTH = Gauge("rag_shadow_queue_depth", "Shadow comparisons waiting to run")
+SHADOW_SKIPPED = Counter("rag_shadow_skipped_total", "Shadow comparisons not run", ["reason"])
+
+# search_fn(emb, top_k, params) -> (ids, latency_seconds), or None when the shadow search failed
+ShadowSearch = Callable[[List[float], int, Any], Awaitable[Optional[Tuple[List[str], float]]]]
+
+
+def overlap_ratio(primary: Sequence[str], reference: Sequence[str], k: int) -> float:
+    return len(set(primary) & set(reference)) / k if k > 0 else 0.0
+
+
+def recall_at_k(primary: Sequence[str], reference: Sequence[str], k: int) -> float:
+    truth = set(reference[:k])
+    if not truth:
+        return 0.0
+    return len(truth & set(primary[:k])) / len(truth)
+
+
+def ndcg_at_k(primary: Sequence[str], reference: Sequence[str], k: int) -> float:
+    """nDCG of the primary ranking, using the reference ranking as graded relevance.
+
+    The reference's first hit gets relevance k, the second k-1, and so on.
+    """
+    relevance = {doc_id: k - rank for rank, doc_id in enumerate(reference[:k])}
+    dcg = sum(relevance.get(doc_id, 0) / math.log2(rank + 2) for rank, doc_id in enumerate(primary[:k]))
+    idcg = sum((k - rank) / math.log2(rank + 2) for rank in range(min(k, len(reference))))
+    return dcg / idcg if idcg > 0 else 0.0
+
+
+class ShadowEvaluator:
+    """Runs the Postgres shadow comparison off the request path.
+
+    Queries are sampled at `sample_rate` and put on a bounded queue; when the
+    queue is full the oldest item is dropped so the comparison tracks recent
+    traffic. Worker tasks run the shadow search and record overlap, recall@k
+    and nDCG against the Qdrant ids captured at request time.
+    """
+
+    def __init__(self, search_fn: ShadowSearch, latency_metric, sample_rate: float = SHADOW_SAMPLE_RATE,
+                 queue_size: int = SHADOW_QUEUE_SIZE, workers: int = SHADOW_WORKERS):
+        self.search_fn = search_fn
+        self.latency_metric = latency_metric
+        self.sample_rate = sample_rate
+        self.workers = workers
+        self._queue: deque = deque(maxlen=queue_size)
+        self._ready = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, emb: List[float], top_k: int, qdrant_ids: List[str], params: Any = None):
+        """Non-blocking; never delays the caller"""
+        if random.random() >= self.sample_rate:
+            SHADOW_SKIPPED.labels(reason="sampled_out").inc()
+            return
+        if len(self._queue) == self._queue.maxlen:
+            # deque(maxlen) evicts the oldest entry on append
+            SHADOW_SKIPPED.labels(reason="queue_full").inc()
+        self._queue.append((emb, top_k, qdrant_ids, params))
+        SHADOW_QUEUE_DEPTH.set(len(self._queue))
+        self._ready.set()
+
+    async def _worker(self):
+        while True:
+            await self._ready.wait()
+            if not self._queue:
+                self._ready.clear()
+                continue
+            emb, top_k, qdrant_ids, params = self._queue.popleft()
+            SHADOW_QUEUE_DEPTH.set(len(self._queue))
+            try:
+                await self._evaluate(emb, top_k, qdrant_ids, params)
+            except Exception as e:
+                print(f"ERROR: Shadow evaluation failed: {e}")
+
+    async def _evaluate(self, emb: List[float], top_k: int, qdrant_ids: List[str], params: Any = None):
+        result = await self.search_fn(emb, top_k, params)
+        if not result:
+            SHADOW_SKIPPED.labels(reason="search_failed").inc()
+            return
+        pg_ids, pg_latency = result
+        self.latency_metric.observe(pg_latency)
+
+        overlap = overlap_ratio(qdrant_ids, pg_ids, top_k)
+        recall = recall_at_k(qdrant_ids, pg_ids, top_k)
+        ndcg = ndcg_at_k(qdrant_ids, pg_ids, top_k)
+        SEARCH_OVERLAP.set(overlap)
+        SEARCH_RECALL.set(recall)
+        SEARCH_NDCG.set(ndcg)
+
+        print(f"COMPARISON: PG={pg_latency:.3f}s, Overlap={overlap*100:.1f}%, Recall@{top_k}={recall:.2f}, nDCG={ndcg:.2f}")
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import AdaptiveLimiter, Overloaded, response_outcome
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_response_outcome():
+    assert response_outcome(200) == "ok"
+    assert response_outcome(404) == "ignored"
+    assert response_outcome(503) == "ignored"
+    assert response_outcome(502) == "dropped"
+    assert response_outcome(500) == "dropped"
+
+
+def test_admits_up_to_the_limit_then_queues_fifo():
+    async def go():
+        limiter = AdaptiveLimiter(initial=2, min_limit=1, max_limit=10, queue_target=1.0, max_queue=10)
+        first, second = await limiter.acquire(), await limiter.acquire()
+        order = []
+
+        async def waiter(name):
+            permit = await limiter.acquire()
+            order.append(name)
+            return permit
+
+        tasks = [asyncio.create_task(waiter(n)) for n in ("a", "b")]
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 2 and len(limiter._waiters) == 2
+        limiter.release(first, "ignored")
+        limiter.release(second, "ignored")
+        for permit in await asyncio.gather(*tasks):
+            limiter.release(permit, "ignored")
+        return order, limiter.in_flight
+    assert run(go()) == (["a", "b"], 0)
+
+
+def test_sheds_when_the_queue_is_full():
+    async def go():
+        limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=10, queue_target=1.0, max_queue=1)
+        permit = await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as e:
+            await limiter.acquire()
+        limiter.release(permit, "ignored")
+        limiter.release(await queued, "ignored")
+        return e.value.reason
+    assert run(go()) == "queue_full"
+
+
+def test_sheds_after_the_queue_target():
+    async def go():
+        limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=10, queue_target=0.01, max_queue=10)
+        permit = await limiter.acquire()
+        with pytest.raises(Overloaded) as e:
+            await limiter.acquire()
+        assert e.value.reason == "queue_timeout" and e.value.retry_after >= 1
+        assert not limiter._waiters
+        limiter.release(permit, "ignored")
+        return limiter.in_flight
+    assert run(go()) == 0
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def go():
+        limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=10, queue_target=1.0, max_queue=10)
+        permit = await limiter.acquire()
+        task = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        limiter.release(permit, "ignored")
+        assert limiter.in_flight == 0
+        again = await limiter.acquire()
+        limiter.release(again, "ignored")
+        return limiter.in_flight
+    assert run(go()) == 0
+
+
+def test_limit_shrinks_when_latency_grows_and_grows_when_it_recovers():
+    limiter = AdaptiveLimiter(initial=10, min_limit=2, max_limit=50)
+    limiter.in_flight = 10  # limit in use
+    limiter._on_sample(0.1)
+    assert limiter.baseline == pytest.approx(0.1)
+    for _ in range(20):
+        limiter._on_sample(1.0)  # ten times the baseline
+    shrunk = limiter.limit
+    assert shrunk < 10
+    limiter.in_flight = int(shrunk)
+    for _ in range(20):
+        limiter._on_sample(0.1)
+    assert limiter.limit > shrunk
+
+
+def test_limit_does_not_grow_while_unused():
+    limiter = AdaptiveLimiter(initial=10, min_limit=2, max_limit=50)
+    limiter.in_flight = 1
+    for _ in range(20):
+        limiter._on_sample(0.1)
+    assert limiter.limit == 10
+
+
+def test_dropped_requests_back_off_within_bounds(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_BACKOFF", 0.5)
+    limiter = AdaptiveLimiter(initial=8, min_limit=2, max_limit=50)
+    limiter.in_flight = 1
+    limiter.release(admission.Permit(admitted_at=0.0), "dropped")
+    assert limiter.limit == 4 and limiter.in_flight == 0
+    for _ in range(5):
+        limiter.in_flight = 1
+        limiter.release(admission.Permit(admitted_at=0.0), "dropped")
+    assert limiter.limit == 2
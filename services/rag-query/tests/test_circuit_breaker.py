@@ -0,0 +1,112 @@
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+def fail(breaker, times=1):
+    for _ in range(times):
+        with pytest.raises(RuntimeError):
+            with breaker.guard():
+                raise RuntimeError("down")
+
+
+def succeed(breaker):
+    with breaker.guard():
+        pass
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, open_seconds=10)
+    fail(breaker, 2)
+    succeed(breaker)  # a success resets the count
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+    fail(breaker)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as e:
+        succeed(breaker)
+    assert e.value.retry_after == 10
+
+
+def test_half_open_trial_closes_or_reopens(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, open_seconds=10, half_open_calls=1)
+    fail(breaker)
+    clock.now += 10
+    assert breaker.state == HALF_OPEN
+    fail(breaker)
+    assert breaker.state == OPEN
+    clock.now += 10
+    succeed(breaker)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_admits_limited_trials(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, open_seconds=10, half_open_calls=1)
+    fail(breaker)
+    clock.now += 10
+    with breaker.guard():
+        # A second call while the trial is running fails fast
+        with pytest.raises(CircuitOpenError):
+            succeed(breaker)
+    assert breaker.state == CLOSED
+
+
+def test_failed_flag_classifies_the_outcome(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    # A bad answer without an exception
+    with breaker.guard() as call:
+        call.failed = True
+    assert breaker.state == OPEN
+
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    # An exception that is not the dependency's fault
+    with pytest.raises(ValueError):
+        with breaker.guard() as call:
+            call.failed = False
+            raise ValueError("bad request")
+    assert breaker.state == CLOSED
+
+
+def test_cancellation_frees_the_trial_slot(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, open_seconds=10)
+    fail(breaker)
+    clock.now += 10
+    with pytest.raises(KeyboardInterrupt):
+        with breaker.guard():
+            raise KeyboardInterrupt
+    assert breaker.state == HALF_OPEN
+    succeed(breaker)
+    assert breaker.state == CLOSED
+
+
+def test_stale_calls_are_ignored(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, open_seconds=10)
+    slow = breaker.guard()
+    slow.__enter__()  # started while closed
+    fail(breaker)
+    assert breaker.state == OPEN
+    slow.__exit__(None, None, None)  # finishes successfully after the circuit opened
+    assert breaker.state == OPEN
+
+
+def test_disabled_breaker_never_opens(clock, monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "BREAKER_ENABLED", False)
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    fail(breaker, 3)
+    assert breaker.state == CLOSED
@@ -0,0 +1,93 @@
+import pytest
+
+from context_packer import (PASSAGE_PREFIX, PASSAGE_SEPARATOR, Candidate, TokenCounter, find_overlap, mmr_order,
+                            pack_context)
+
+
+@pytest.fixture(scope="module")
+def counter():
+    # Unknown encoding: the estimate at one character per token keeps budgets easy to reason about
+    return TokenCounter(encoding="test-estimate", chars_per_token=1)
+
+
+def cand(chunk_id, text, score=1.0, document_id="doc"):
+    return Candidate(chunk_id=chunk_id, text=text, score=score, document_id=document_id)
+
+
+def test_find_overlap():
+    left = "The quick brown fox jumps over the lazy dog"
+    right = "jumps over the lazy dog and runs away"
+    assert find_overlap(left, right, min_chars=10) == len("jumps over the lazy dog")
+    assert find_overlap(left, "something else entirely", min_chars=10) == 0
+
+
+def test_find_overlap_below_minimum():
+    assert find_overlap("abc xyz", "xyz def", min_chars=10) == 0
+    assert find_overlap("abc xyz", "xyz def", min_chars=3) == 3
+    assert find_overlap("long enough text", "short", min_chars=10) == 0
+
+
+def test_find_overlap_prefers_longest_match():
+    assert find_overlap("abab abab", "abab abab cd", min_chars=4) == len("abab abab")
+
+
+def test_packs_in_rank_order_within_budget(counter):
+    packed = pack_context([cand("a", " alpha text ", document_id="1"), cand("b", "beta text", document_id="2")],
+                          counter, budget=1000, mmr_lambda=1.0)
+    assert packed.chunk_ids == ["a", "b"]
+    assert packed.context == PASSAGE_PREFIX + "alpha text" + PASSAGE_SEPARATOR + PASSAGE_PREFIX + "beta text"
+    assert packed.tokens == counter.count(packed.context)
+    assert packed.stats["packed"] == 2
+
+
+def test_duplicates_are_dropped(counter):
+    packed = pack_context([cand("a", "same text here"), cand("b", "same   text here"), cand("c", "text")],
+                          counter, budget=1000, mmr_lambda=1.0)
+    assert packed.chunk_ids == ["a"]
+    assert packed.stats["duplicate"] == 2
+
+
+def test_overlapping_neighbours_are_merged(counter):
+    first = "Section one explains how the pump is installed in the basement."
+    second = "how the pump is installed in the basement. Section two covers maintenance."
+    packed = pack_context([cand("a", first), cand("b", second)], counter, budget=1000, mmr_lambda=1.0)
+    assert packed.chunk_ids == ["a", "b"]
+    assert packed.stats["merged"] == 1
+    assert packed.context == PASSAGE_PREFIX + first + " Section two covers maintenance."
+    assert packed.stats["overlap_tokens_saved"] > 0
+
+
+def test_chunks_of_other_documents_are_not_merged(counter):
+    first = "Section one explains how the pump is installed in the basement."
+    second = "how the pump is installed in the basement. Section two covers maintenance."
+    packed = pack_context([cand("a", first, document_id="1"), cand("b", second, document_id="2")],
+                          counter, budget=1000, mmr_lambda=1.0)
+    assert packed.stats["merged"] == 0 and packed.stats["packed"] == 2
+
+
+def test_last_chunk_is_truncated_into_the_budget(counter):
+    budget = 160
+    packed = pack_context([cand("a", "x" * 50, document_id="1"), cand("b", "word " * 40, document_id="2")],
+                          counter, budget=budget, mmr_lambda=1.0)
+    assert packed.chunk_ids == ["a", "b"]
+    assert packed.stats["truncated"] == 1
+    assert packed.tokens <= budget
+
+
+def test_chunk_over_budget_is_skipped(counter):
+    packed = pack_context([cand("a", "x" * 90, document_id="1"), cand("b", "y" * 90, document_id="2")],
+                          counter, budget=110, mmr_lambda=1.0)
+    assert packed.chunk_ids == ["a"]
+    assert packed.stats["over_budget"] == 1
+
+
+def test_empty_input(counter):
+    packed = pack_context([], counter, budget=100)
+    assert packed.context == "" and packed.tokens == 0 and packed.chunk_ids == []
+
+
+def test_mmr_prefers_diverse_chunks():
+    candidates = [cand("a", "pump installation basement", 1.0), cand("b", "pump installation basement guide", 0.95),
+                  cand("c", "invoice payment terms", 0.9)]
+    assert [c.chunk_id for c in mmr_order(candidates, 1.0)] == ["a", "b", "c"]
+    assert [c.chunk_id for c in mmr_order(candidates, 0.5)] == ["a", "c", "b"]
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from hybrid import Hit, LEXICAL_SQL, PG_TS_CONFIG, rrf_fuse
+
+
+def hits(*ids):
+    return [Hit(id=i, score=0.0, payload={"leg": i}) for i in ids]
+
+
+def test_rrf_sums_reciprocal_ranks():
+    fused = rrf_fuse([hits("a", "b"), hits("b", "c")], limit=10, k=60)
+    scores = {h.id: h.score for h in fused}
+    assert scores["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert scores["a"] == pytest.approx(1 / 61)
+    assert scores["c"] == pytest.approx(1 / 62)
+    assert [h.id for h in fused] == ["b", "a", "c"]
+
+
+def test_rrf_limit_and_empty_legs():
+    assert [h.id for h in rrf_fuse([hits("a", "b", "c"), []], limit=2)] == ["a", "b"]
+    assert rrf_fuse([[], []], limit=5) == []
+
+
+def test_rrf_keeps_payload_of_first_leg():
+    dense = [Hit(id="a", score=0.9, payload={"text": "from qdrant"})]
+    lexical = [Hit(id="a", score=3.0, payload={"text": "from postgres"})]
+    assert rrf_fuse([dense, lexical], limit=1)[0].payload == {"text": "from qdrant"}
+
+
+def test_rrf_compares_ids_as_strings():
+    class Point:
+        def __init__(self, id):
+            self.id, self.payload = id, None
+
+    fused = rrf_fuse([[Point(7)], hits("7")], limit=5)
+    assert len(fused) == 1 and fused[0].id == "7" and fused[0].payload == {}
+
+
+def test_lexical_sql_uses_configured_text_search():
+    assert f"to_tsvector('{PG_TS_CONFIG}', %s)" in LEXICAL_SQL
+    # question, excluded terms, limit
+    assert LEXICAL_SQL.count("%s") == 3
+
+
+# The lexical query against a real Postgres, e.g. TEST_PG_DSN=postgresql://postgres@localhost/postgres
+TEST_PG_DSN = os.getenv("TEST_PG_DSN")
+
+
+@pytest.fixture
+def lexical_rows():
+    psycopg = pytest.importorskip("psycopg")
+    if not TEST_PG_DSN:
+        pytest.skip("TEST_PG_DSN not set")
+    with psycopg.connect(TEST_PG_DSN) as conn:
+        # A temporary table shadows the real one for this session only
+        conn.execute(f"""
+            CREATE TEMP TABLE embeddings (
+                id TEXT PRIMARY KEY, text TEXT, source_file TEXT,
+                tsv tsvector GENERATED ALWAYS AS (to_tsvector('{PG_TS_CONFIG}', coalesce(text, ''))) STORED
+            )
+        """)
+        conn.execute("""
+            INSERT INTO embeddings (id, text, source_file) VALUES
+                ('1', 'Error code E-4012 means the pump is blocked', 'a.pdf'),
+                ('2', 'The pump needs maintenance every year', 'b.pdf'),
+                ('3', 'Unrelated text about invoices', 'c.pdf')
+        """)
+
+        def search(question, excluded=(), limit=10):
+            return [row[0] for row in conn.execute(LEXICAL_SQL, (question, list(excluded), limit)).fetchall()]
+        yield search
+
+
+def test_lexical_query_matches_any_term(lexical_rows):
+    # OR semantics: each chunk needs only one of the question's terms
+    assert set(lexical_rows("pump error E-4012")) == {"1", "2"}
+    assert lexical_rows("pump error E-4012")[0] == "1"
+
+
+def test_lexical_query_leaves_out_common_terms(lexical_rows):
+    assert lexical_rows("pump maintenance", excluded=["pump"]) == ["2"]
+    # Nothing left to search for matches nothing
+    assert lexical_rows("pump", excluded=["pump"]) == []
+    assert lexical_rows("the of and") == []
+
+
+def test_lexical_query_limit(lexical_rows):
+    assert len(lexical_rows("pump", limit=1)) == 1
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from botocore.exceptions import ClientError
+
+from s3_text_cache import S3Ref, S3TextCache, s3_ref_from_payload
+
+
+class Body:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class MemoryS3:
+    """get_object double with ranges and If-None-Match; records every call"""
+
+    def __init__(self, objects):
+        self.objects = {key: (data, f'"{key}-1"') for key, data in objects.items()}
+        self.calls = []
+
+    def put(self, key, data, version):
+        self.objects[key] = (data, f'"{key}-{version}"')
+
+    def get_object(self, Bucket, Key, Range=None, IfNoneMatch=None):
+        self.calls.append((Key, Range, IfNoneMatch))
+        data, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise ClientError({"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject")
+        if Range:
+            start, end = Range[len("bytes="):].split("-")
+            data = data[int(start):int(end) + 1]
+        return {"Body": Body(data), "ETag": etag}
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(4) as pool:
+        yield pool
+
+
+def test_payload_refs():
+    assert s3_ref_from_payload({"s3_key": "doc.jsonl"}) == S3Ref("doc.jsonl")
+    assert s3_ref_from_payload({"s3_key": "doc.jsonl", "s3_offset": 10, "s3_length": 5}) == S3Ref("doc.jsonl", 10, 5)
+    assert s3_ref_from_payload({"text": "inline"}) is None
+
+
+def test_miss_then_hit(executor):
+    s3 = MemoryS3({"a": b"alpha"})
+    cache = S3TextCache(s3, "bucket", executor, max_bytes=1000, revalidate_after=60)
+
+    assert asyncio.run(cache.get(S3Ref("a"))) == "alpha"
+    assert asyncio.run(cache.get(S3Ref("a"))) == "alpha"
+    assert s3.calls == [("a", None, None)]
+
+
+def test_missing_object_returns_empty_text(executor):
+    cache = S3TextCache(MemoryS3({}), "bucket", executor, max_bytes=1000, revalidate_after=60)
+    assert asyncio.run(cache.get(S3Ref("gone"))) == ""
+    assert not cache._entries
+
+
+def test_concurrent_lookups_share_one_get(executor):
+    s3 = MemoryS3({"a": b"alpha"})
+    cache = S3TextCache(s3, "bucket", executor, max_bytes=1000, revalidate_after=60)
+    assert asyncio.run(cache.get_many([S3Ref("a")] * 5)) == ["alpha"] * 5
+    assert len(s3.calls) == 1
+
+
+def test_etag_revalidation(executor):
+    s3 = MemoryS3({"a": b"alpha"})
+    cache = S3TextCache(s3, "bucket", executor, max_bytes=1000, revalidate_after=0)
+
+    asyncio.run(cache.get(S3Ref("a")))
+    # Unchanged: a conditional GET answers 304 and the cached copy is served
+    assert asyncio.run(cache.get(S3Ref("a"))) == "alpha"
+    assert s3.calls[-1] == ("a", None, '"a-1"')
+
+    s3.put("a", b"alpha v2", version=2)
+    assert asyncio.run(cache.get(S3Ref("a"))) == "alpha v2"
+    assert cache._entries["a"].etag == '"a-2"'
+
+
+def test_range_served_from_cached_whole_object(executor):
+    s3 = MemoryS3({"doc": b"0123456789"})
+    cache = S3TextCache(s3, "bucket", executor, max_bytes=1000, revalidate_after=60)
+
+    asyncio.run(cache.get(S3Ref("doc")))
+    assert asyncio.run(cache.get(S3Ref("doc", 3, 4))) == "3456"
+    assert s3.calls == [("doc", None, None)]
+
+
+def test_range_without_whole_object_uses_ranged_get(executor):
+    s3 = MemoryS3({"doc": b"0123456789"})
+    cache = S3TextCache(s3, "bucket", executor, max_bytes=1000, revalidate_after=60)
+
+    assert asyncio.run(cache.get(S3Ref("doc", 3, 4))) == "3456"
+    assert s3.calls == [("doc", "bytes=3-6", None)]
+    assert list(cache._entries) == ["doc#3+4"]
+
+
+def test_byte_bound_evicts_least_recently_used(executor):
+    s3 = MemoryS3({"a": b"a" * 40, "b": b"b" * 40, "c": b"c" * 40, "huge": b"h" * 200})
+    cache = S3TextCache(s3, "bucket", executor, max_bytes=100, revalidate_after=60)
+
+    asyncio.run(cache.get(S3Ref("a")))
+    asyncio.run(cache.get(S3Ref("b")))
+    asyncio.run(cache.get(S3Ref("a")))  # a is now the most recently used
+    asyncio.run(cache.get(S3Ref("c")))
+    assert list(cache._entries) == ["a", "c"]
+    assert cache._bytes == 80
+
+    # Objects over the bound are served but never cached
+    assert asyncio.run(cache.get(S3Ref("huge"))) == "h" * 200
+    assert list(cache._entries) == ["a", "c"]
+
+
+def test_revalidated_entry_evicted_during_get(executor):
+    s3 = MemoryS3({"a": b"a" * 60, "b": b"b" * 60})
+    b_fetched = threading.Event()
+    get_object = s3.get_object
+
+    def slow_conditional_get(Bucket, Key, Range=None, IfNoneMatch=None):
+        if IfNoneMatch:
+            # Let the miss for "b" land first; storing it evicts "a"
+            b_fetched.wait(5)
+            time.sleep(0.05)
+        try:
+            return get_object(Bucket, Key, Range, IfNoneMatch)
+        finally:
+            if Key == "b":
+                b_fetched.set()
+
+    s3.get_object = slow_conditional_get
+    cache = S3TextCache(s3, "bucket", executor, max_bytes=100, revalidate_after=0)
+
+    asyncio.run(cache.get(S3Ref("a")))
+    assert asyncio.run(cache.get_many([S3Ref("a"), S3Ref("b")])) == ["a" * 60, "b" * 60]
+    assert list(cache._entries) == ["a"]
+    assert cache._bytes == 60
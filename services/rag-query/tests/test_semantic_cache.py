@@ -0,0 +1,103 @@
+import pytest
+
+import semantic_cache
+from semantic_cache import SemanticCache
+
+OPTIONS = (5, True, False, None, 1500, 0.7, None)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(semantic_cache.time, "time", clock)
+    return clock
+
+
+def store(cache, emb, answer="answer", options=OPTIONS, version=1, question="question"):
+    cache.store(emb, question, answer, [], options, version)
+
+
+def test_hit_above_threshold_miss_below():
+    cache = SemanticCache(threshold=0.95, max_entries=10, max_bytes=1 << 20, ttl=60)
+    store(cache, [1.0, 0.0, 0.0])
+
+    hit = cache.lookup([1.0, 0.1, 0.0], OPTIONS, 1)  # cosine ~0.995
+    assert hit is not None and hit.answer == "answer"
+    assert hit.similarity == pytest.approx(0.995, abs=1e-3)
+    assert cache.lookup([1.0, 1.0, 0.0], OPTIONS, 1) is None  # cosine ~0.707
+
+
+def test_other_options_never_match():
+    cache = SemanticCache(threshold=0.95, max_entries=10, max_bytes=1 << 20, ttl=60)
+    store(cache, [1.0, 0.0])
+    assert cache.lookup([1.0, 0.0], OPTIONS[:-1] + ("filtered",), 1) is None
+
+
+def test_expired_entry_is_evicted(clock):
+    cache = SemanticCache(threshold=0.95, max_entries=10, max_bytes=1 << 20, ttl=60)
+    store(cache, [1.0, 0.0])
+    clock.now += 61
+
+    assert cache.lookup([1.0, 0.0], OPTIONS, 1) is None
+    assert not cache._entries
+    assert not cache._options
+
+
+def test_collection_version_change_is_stale():
+    cache = SemanticCache(threshold=0.95, max_entries=10, max_bytes=1 << 20, ttl=60)
+    store(cache, [1.0, 0.0], version=1)
+
+    assert cache.lookup([1.0, 0.0], OPTIONS, 2) is None
+    assert not cache._entries
+    # The stale answer is gone, so even the old version misses now
+    assert cache.lookup([1.0, 0.0], OPTIONS, 1) is None
+
+
+def test_byte_bound_evicts_least_recently_used():
+    dim = 4
+    entry_bytes = dim * 4 + len("q") + len("a") + len("[]")
+    cache = SemanticCache(threshold=0.95, max_entries=10, max_bytes=2 * entry_bytes, ttl=60)
+    first, second, third = [1.0, 0, 0, 0], [0, 1.0, 0, 0], [0, 0, 1.0, 0]
+    store(cache, first, answer="a", question="q")
+    store(cache, second, answer="a", question="q")
+    assert cache.lookup(first, OPTIONS, 1) is not None  # first is now the most recently used
+
+    store(cache, third, answer="a", question="q")
+    assert cache._bytes <= cache.max_bytes
+    assert cache.lookup(second, OPTIONS, 1) is None
+    assert cache.lookup(first, OPTIONS, 1) is not None
+    assert cache.lookup(third, OPTIONS, 1) is not None
+
+
+def test_entry_larger_than_bound_is_not_stored():
+    cache = SemanticCache(threshold=0.95, max_entries=10, max_bytes=64, ttl=60)
+    store(cache, [1.0, 0.0], answer="x" * 100)
+    assert not cache._entries
+
+
+def test_lookups_do_not_grow_option_map():
+    cache = SemanticCache(threshold=0.95, max_entries=10, max_bytes=1 << 20, ttl=60)
+    store(cache, [1.0, 0.0])
+    for top_k in range(10_000):
+        cache.lookup([1.0, 0.0], (top_k, True, False, None, 1500, 0.7, None), 1)
+    assert len(cache._options) == 1
+
+
+def test_option_ids_are_dropped_with_their_last_entry():
+    cache = SemanticCache(threshold=0.95, max_entries=3, max_bytes=1 << 20, ttl=60)
+    for top_k in range(100):
+        store(cache, [1.0, 0.0], options=(top_k,))
+    assert len(cache._options) == 3
+    assert cache.lookup([1.0, 0.0], (99,), 1) is not None
+    assert cache.lookup([1.0, 0.0], (0,), 1) is None
+
+    cache.clear()
+    assert not cache._options and not cache._option_refs